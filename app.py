@@ -1,15 +1,11 @@
 import streamlit as st
-import pandas as pd
-import numpy as np
-import plotly.express as px
-import plotly.graph_objects as go
-from plotly.subplots import make_subplots
-import sqlite3
 import os
 import tempfile
-from data_processor import DataProcessor
 from datetime import datetime
 
+# pandas・DataProcessor はログイン後、plotly はダッシュボード表示時に読み込む
+# （ログイン画面やデータ入力ページの起動を軽くするため）
+
 # ページ設定
 st.set_page_config(
     page_title="財務予測シミュレーター",
@@ -226,40 +222,89 @@ if not check_password():
     st.stop()
 
 # ログイン成功 - メインアプリケーション
+import pandas as pd
+import perf_trace
+from data_processor import DataProcessor
+from storage import PostgresBackend
 
-# 初期化
-if 'processor' not in st.session_state:
-    st.session_state.processor = DataProcessor()
-processor = st.session_state.processor
+# 処理時間の計測（管理者のみ。URLに ?perf=1 を付けるかサイドバーのパフォーマンス欄で有効化）
+is_admin = st.session_state.username == "admin"
+if is_admin and st.query_params.get("perf") == "1":
+    st.session_state.setdefault("perf_panel", True)
+perf = perf_trace.start(is_admin and st.session_state.get("perf_panel", False))
 
-# キャッシュ付きデータ読み込み関数（高速化）
-@st.cache_data(ttl=60)  # 60秒間キャッシュ
-def load_actual_data_cached(period_id, _processor):
-    """実績データをキャッシュ付きで読み込み"""
-    return _processor.load_actual_data(period_id)
+def create_storage_backend():
+    """
+    secrets に database 設定があれば PostgreSQL (Supabase) に接続
+    
+    戻り値: (バックエンド, エラーメッセージ) — 設定が無い・接続できない場合はバックエンドが None (SQLiteを使用)
+    """
+    try:
+        db_config = dict(st.secrets['database']) if 'database' in st.secrets else None
+    except Exception:
+        db_config = None
+    if not db_config:
+        return None, None
+    try:
+        return PostgresBackend(**db_config), None
+    except Exception as e:
+        return None, f"❌ データベースに接続できないためSQLiteを使用します: {e}"
+
+@st.cache_resource
+def get_shared_processor():
+    """
+    プロセス全体で共有するDataProcessor (全セッション共通)
+    
+    テーブル作成・接続プール・読み込みキャッシュはセッションごとに作らず1つを共有する。
+    読み込みキャッシュの上限は secrets の read_cache_mb (MB) で変更できる。
+    secrets に query_log_slow_ms (ミリ秒) があればSQLの実行ログを有効にする
+    """
+    backend, error = create_storage_backend()
+    try:
+        cache_mb = int(st.secrets.get('read_cache_mb', 0))
+        slow_ms = st.secrets.get('query_log_slow_ms')
+    except Exception:
+        cache_mb, slow_ms = 0, None
+    shared = DataProcessor(
+        backend=backend,
+        read_cache_bytes=cache_mb * 1024 * 1024 or None,
+        query_log_slow_ms=float(slow_ms) if slow_ms is not None else None
+    )
+    # クエリは計測中のセッションにだけ記録される（計測していなければ何もしない）
+    shared.backend.add_query_listener(perf_trace.record_query)
+    return shared, error
 
-@st.cache_data(ttl=60)
-def load_forecast_data_cached(period_id, scenario, _processor):
-    """予測データをキャッシュ付きで読み込み"""
-    return _processor.load_forecast_data(period_id, scenario)
+# 初期化
+with perf_trace.phase("DataProcessor取得"):
+    processor, backend_error = get_shared_processor()
+if backend_error:
+    st.sidebar.error(backend_error)
+# 共有キャッシュ・書き込みキューの統計（パフォーマンスパネルで今回の再実行での増分を表示）
+perf_stats_before = (processor.read_cache.stats(), processor.writer.stats()) if perf else None
 
-@st.cache_data(ttl=60)
-def load_sub_accounts_cached(period_id, scenario, _processor):
+# キャッシュ付きデータ読み込み関数（高速化）
+# 実績・予測は processor.get_actual_data / get_forecast_data（セッション間で1部だけ共有）を使う。
+# data_version（processor.get_data_version）をキーに含め、有効期限なしで保持する。
+# 書き込みのたびにバージョンが上がるため、他のセッションの保存も次の再実行で必ず反映される。
+# 古いバージョンのエントリは max_entries で押し出される
+# track_cache はパフォーマンスパネル用にヒット/ミスを記録する（計測していなければ何もしない）
+@perf_trace.track_cache(st.cache_data(max_entries=64))
+def load_sub_accounts_cached(period_id, scenario, data_version, _processor):
     """補助科目データをキャッシュ付きで読み込み"""
     return _processor.load_sub_accounts(period_id, scenario)
 
-@st.cache_data(ttl=300)  # 5分間キャッシュ（変更頻度が低い）
-def get_companies_cached(_processor):
+@perf_trace.track_cache(st.cache_data(max_entries=8))
+def get_companies_cached(master_version, _processor):
     """会社一覧をキャッシュ付きで取得"""
     return _processor.get_companies()
 
-@st.cache_data(ttl=300)
-def get_company_periods_cached(comp_id, _processor):
+@perf_trace.track_cache(st.cache_data(max_entries=64))
+def get_company_periods_cached(comp_id, master_version, _processor):
     """会計期間一覧をキャッシュ付きで取得"""
     return _processor.get_company_periods(comp_id)
 
-@st.cache_data(ttl=300)
-def get_fiscal_months_cached(comp_id, period_id, _processor):
+@perf_trace.track_cache(st.cache_data(max_entries=64))
+def get_fiscal_months_cached(comp_id, period_id, master_version, _processor):
     """会計月一覧をキャッシュ付きで取得"""
     return _processor.get_fiscal_months(comp_id, period_id)
 
@@ -274,6 +319,7 @@ def safe_int(value):
         return 0
 
 # サイドバー
+perf_trace.mark("サイドバー")
 st.sidebar.markdown("""
 <div style='text-align: center; padding: 1rem 0;'>
     <h1 style='color: #1f77b4; margin: 0; font-size: 1.8rem;'>📊</h1>
@@ -302,7 +348,8 @@ else:
 st.sidebar.markdown("---")
 
 # 会社選択
-companies = get_companies_cached(processor)
+master_version = processor.get_data_version()
+companies = get_companies_cached(master_version, processor)
 if companies.empty:
     st.sidebar.info("🏢 会社を登録してください")
     st.sidebar.markdown("👉 システム設定から会社を追加")
@@ -332,7 +379,7 @@ else:
     # 会社が変更された場合、データをリフレッシュ
     if prev_comp_id != selected_comp_id:
         # session_stateをクリア（データ再読み込み用）
-        for key in ['actuals_df', 'forecasts_df', 'imported_df', 'show_import_button']:
+        for key in ['actuals_df', 'forecasts_df', 'scenario_cube', 'imported_df', 'show_import_button']:
             if key in st.session_state:
                 del st.session_state[key]
     
@@ -340,7 +387,7 @@ else:
     st.session_state.selected_comp_name = selected_comp_name
 
     # 期選択
-    periods = get_company_periods_cached(selected_comp_id, processor)
+    periods = get_company_periods_cached(selected_comp_id, master_version, processor)
     if periods.empty:
         st.sidebar.info("📅 会計期間を登録してください")
         st.sidebar.markdown("👉 システム設定から期を追加")
@@ -372,9 +419,11 @@ else:
             # 期が変更された場合、データをリフレッシュ
             if prev_period_id != selected_period_id:
                 # session_stateをクリア（データ再読み込み用）
-                for key in ['actuals_df', 'forecasts_df', 'imported_df', 'show_import_button']:
+                for key in ['actuals_df', 'forecasts_df', 'scenario_cube', 'imported_df', 'show_import_button']:
                     if key in st.session_state:
                         del st.session_state[key]
+                # 次に開かれそうな前後の期をバックグラウンドで先読み
+                processor.warm_adjacent_periods(selected_period_id)
                 
             st.session_state.selected_period_id = selected_period_id
             st.session_state.selected_period_num = selected_period_num
@@ -393,14 +442,6 @@ else:
         label_visibility="collapsed"
     )
     
-    # シナリオ設定
-    if 'scenario_rates' not in st.session_state:
-        st.session_state.scenario_rates = {
-            "現実": 0.0,
-            "楽観": 0.1,
-            "悲観": -0.1
-        }
-    
     # 表示設定
     st.sidebar.markdown("### ⚙️ 表示設定")
     st.session_state.display_mode = st.sidebar.radio(
@@ -411,7 +452,7 @@ else:
     
     # 月次リスト取得
     if selected_period_id:
-        months = get_fiscal_months_cached(selected_comp_id, selected_period_id, processor)
+        months = get_fiscal_months_cached(selected_comp_id, selected_period_id, master_version, processor)
         
         # 実績締月の選択
         if 'current_month' not in st.session_state or st.session_state.current_month not in months:
@@ -461,6 +502,7 @@ def format_percent(val):
 # --------------------------------------------------------------------------------
 # メインコンテンツ
 # --------------------------------------------------------------------------------
+perf_trace.mark(f"ページ: {st.session_state.page}")
 
 # システム設定ページ（会社未登録時でも表示）
 if st.session_state.page == "システム設定":
@@ -596,6 +638,57 @@ if st.session_state.page == "システム設定":
             periods_stat = processor.get_company_periods(st.session_state.selected_comp_id)
             st.metric("会計期間数", f"{len(periods_stat)}期")
         
+        # SQLの実行ログ（プロセス全体・全セッション分）
+        st.markdown("---")
+        st.markdown("### 🐢 クエリログ")
+        query_log = processor.query_log
+        if query_log is None or query_log not in processor.backend.query_listeners:
+            st.caption("SQLの実行時間を記録し、遅いクエリは実行計画と共にログに出します（secrets の query_log_slow_ms で起動時から有効化）")
+            if st.button("▶️ クエリログを開始"):
+                processor.enable_query_log()
+                st.rerun()
+        else:
+            log_stats = query_log.stats()
+            col1, col2, col3 = st.columns(3)
+            col1.metric("記録したクエリ", f"{log_stats['queries']}件")
+            col2.metric(f"遅いクエリ（{log_stats['slow_ms']:.0f}ms以上）", f"{log_stats['slow_queries']}件")
+            col3.metric("エラー", f"{log_stats['errors']}件")
+            
+            sort_key = st.radio(
+                "並び順", ["合計時間", "実行回数"], horizontal=True, key="query_log_sort"
+            )
+            top_statements = query_log.summary(n=20, by='total_seconds' if sort_key == "合計時間" else 'count')
+            if top_statements:
+                # パラメータ違いで同じ文が大量に実行されていれば N+1 の可能性がある
+                st.dataframe(pd.DataFrame([
+                    {
+                        'SQL': g['statement'][:300],
+                        '回数': g['count'],
+                        'パラメータ種類': g['distinct_params'],
+                        '合計ms': round(g['total_seconds'] * 1000, 1),
+                        '平均ms': round(g['mean_ms'], 2),
+                        '最大ms': round(g['max_ms'], 1),
+                        '行数': g['rows'],
+                        'エラー': g['errors'],
+                    }
+                    for g in top_statements
+                ]), hide_index=True, width="stretch")
+            
+            for entry in query_log.slow()[:10]:
+                with st.expander(f"🐢 {entry['seconds'] * 1000:.1f}ms  {entry['statement'][:80]}"):
+                    st.code(entry['statement'], language="sql")
+                    st.code("\n".join(entry['plan']) or "（実行計画なし）")
+            
+            col1, col2 = st.columns(2)
+            with col1:
+                if st.button("🗑️ ログを消去"):
+                    query_log.clear()
+                    st.rerun()
+            with col2:
+                if st.button("⏹️ クエリログを停止"):
+                    processor.disable_query_log()
+                    st.rerun()
+        
         # 接続テスト
         st.markdown("---")
         st.markdown("### 🧪 接続テスト")
@@ -611,51 +704,74 @@ if st.session_state.page == "システム設定":
 
 # データの読み込み（期が選択されている場合のみ）
 if 'selected_period_id' in st.session_state and st.session_state.selected_period_id is not None:
-        # キャッシュされたデータを使用
+        # データバージョンが変わっていれば（他のセッションでの保存を含む）読み直す
+        with perf_trace.phase("データバージョン確認"):
+            data_version = processor.get_data_version(st.session_state.selected_period_id)
+        loaded_version = (st.session_state.selected_period_id, data_version)
+        if st.session_state.get('loaded_data_version') != loaded_version:
+            for key in ['actuals_df', 'forecasts_df', 'scenario_cube']:
+                st.session_state.pop(key, None)
+            st.session_state.loaded_data_version = loaded_version
+        
+        # 実績・全シナリオの予測・補助科目合計などを並列に読み込み（共有キャッシュにあればそれを使用）
+        # 全セッションで同じオブジェクトのため変更しない
+        with perf_trace.phase("期データ読み込み (get_period_bundle)"):
+            period_bundle = processor.get_period_bundle(st.session_state.selected_period_id, data_version)
         if 'actuals_df' not in st.session_state:
-            st.session_state.actuals_df = load_actual_data_cached(st.session_state.selected_period_id, processor)
+            st.session_state.actuals_df = period_bundle['actuals']
         if 'forecasts_df' not in st.session_state:
-            st.session_state.forecasts_df = load_forecast_data_cached(st.session_state.selected_period_id, "現実", processor)
+            st.session_state.forecasts_df = period_bundle['forecasts']["現実"]
             
         actuals_df = st.session_state.actuals_df.copy()
-        forecasts_df = st.session_state.forecasts_df.copy()
         
-        # シナリオ調整
-        if st.session_state.scenario != "現実":
-            rate = st.session_state.scenario_rates[st.session_state.scenario]
-            split_idx = months.index(st.session_state.current_month) + 1 if st.session_state.current_month in months else 0
-            forecast_months = months[split_idx:]
-            # DataFrameに存在する月のみを使用
-            available_forecast_months = [m for m in forecast_months if m in forecasts_df.columns]
-            
-            for item in processor.all_items:
-                if item == "売上高":
-                    forecasts_df.loc[forecasts_df['項目名'] == item, available_forecast_months] *= (1 + rate)
-                elif item == "売上原価":
-                    forecasts_df.loc[forecasts_df['項目名'] == item, available_forecast_months] *= (1 - rate * 0.5)
-                elif item in processor.ga_items:
-                    forecasts_df.loc[forecasts_df['項目名'] == item, available_forecast_months] *= (1 - rate * 0.3)
-                    
-            st.session_state.adjusted_forecasts_df = forecasts_df.copy()
+        split_idx = months.index(st.session_state.current_month) + 1 if st.session_state.current_month in months else 0
+        scenario_idx = processor.SCENARIOS.index(st.session_state.scenario)
         
-        # 補助科目合計の反映
-        sub_accounts_df = processor.load_sub_accounts(st.session_state.selected_period_id, st.session_state.scenario)
-        if not sub_accounts_df.empty:
-            aggregated = sub_accounts_df.groupby(['parent_item', 'month'])['amount'].sum().reset_index()
-            for _, row in aggregated.iterrows():
-                parent = row['parent_item']
-                month = row['month']
-                amount = row['amount']
-                forecasts_df.loc[forecasts_df['項目名'] == parent, month] = amount
+        # シナリオ係数（DBのシナリオ設定から作成・バージョンごとにキャッシュ）
+        scenario_coefficients = period_bundle['coefficients']
         
-        # PL計算
-        split_idx = months.index(st.session_state.current_month) + 1 if st.session_state.current_month in months else 0
-        pl_df = processor.calculate_pl(
-            actuals_df,
-            forecasts_df,
+        # 全シナリオのPLを一括計算（シナリオ切替時は再計算せず参照のみ）
+        cube_key = (
+            st.session_state.selected_period_id,
             split_idx,
-            months
+            tuple(months),
+            scenario_coefficients.tobytes()
         )
+        scenario_cube = st.session_state.get('scenario_cube')
+        if scenario_cube is None or scenario_cube['key'] != cube_key:
+            # 補助科目合計（DB側で全シナリオ分を集計し、予測値を上書き）
+            sub_totals = period_bundle['sub_account_totals']
+            
+            # 前回から変更されたセルのみ再計算（インクリメンタル評価）
+            with perf_trace.phase("PL計算 (evaluate_period_pls)"):
+                forecast_cube, pl_cube = processor.evaluate_period_pls(
+                    st.session_state.selected_period_id,
+                    st.session_state.actuals_df,
+                    st.session_state.forecasts_df,
+                    split_idx,
+                    months,
+                    scenario_coefficients,
+                    sub_totals,
+                    data_version=data_version
+                )
+            scenario_cube = {
+                'key': cube_key,
+                'forecasts': forecast_cube,
+                'pl': pl_cube
+            }
+            st.session_state.scenario_cube = scenario_cube
+        
+        # 選択中シナリオの予測値とPL
+        with perf_trace.phase("PL表の作成 (pl_to_frame)"):
+            forecasts_df = processor.matrix_to_frame(scenario_cube['forecasts'][scenario_idx], months)
+            pl_df = processor.pl_to_frame(scenario_cube['pl'][scenario_idx], split_idx, months)
+        
+        # シナリオ×項目の通期合計（シナリオ比較用）
+        scenario_totals = scenario_cube['pl'].sum(axis=2)
+        
+        # 選択中シナリオのKPI（主要利益の合計と利益率。PL表や表示モードに関係なくPL行列から計算）
+        kpi = processor.kpi_summary(scenario_cube['pl'][scenario_idx], split_idx)
+        kpi_totals, kpi_margins = kpi['合計'], kpi['利益率']['合計']
         
         # 表示モードでフィルタ
         if st.session_state.display_mode == "要約":
@@ -663,11 +779,20 @@ if 'selected_period_id' in st.session_state and st.session_state.selected_period
         else:
             pl_display = pl_df
         
+        for frame_name, frame in [('actuals_df', actuals_df), ('forecasts_df', forecasts_df),
+                                  ('pl_df', pl_df), ('pl_display', pl_display)]:
+            perf_trace.record_frame(frame_name, frame)
+        
         # --------------------------------------------------------------------------------
         # ページコンテンツ
         # --------------------------------------------------------------------------------
         
         if st.session_state.page == "着地予測ダッシュボード":
+            # グラフ描画ライブラリはこのページでのみ使うため、ここで読み込む
+            import plotly.express as px
+            import plotly.graph_objects as go
+            from plotly.subplots import make_subplots
+            
             st.title("📊 着地予測ダッシュボード")
             
             st.markdown(f"""
@@ -683,7 +808,7 @@ if 'selected_period_id' in st.session_state and st.session_state.selected_period
             col1, col2, col3, col4, col5 = st.columns(5)
             
             with col1:
-                sales_total = pl_display[pl_display['項目名'] == '売上高']['合計'].iloc[0]
+                sales_total = kpi_totals['売上高']
                 st.markdown(f"""
                 <div class="summary-card-blue">
                     <div class="card-title">売上高</div>
@@ -693,8 +818,8 @@ if 'selected_period_id' in st.session_state and st.session_state.selected_period
                 """, unsafe_allow_html=True)
             
             with col2:
-                gp_total = pl_display[pl_display['項目名'] == '売上総損益金額']['合計'].iloc[0]
-                gp_rate = (gp_total / sales_total * 100) if sales_total != 0 else 0
+                gp_total = kpi_totals['売上総損益金額']
+                gp_rate = kpi_margins['売上総損益金額'] * 100
                 st.markdown(f"""
                 <div class="summary-card-green">
                     <div class="card-title">売上総利益</div>
@@ -704,8 +829,8 @@ if 'selected_period_id' in st.session_state and st.session_state.selected_period
                 """, unsafe_allow_html=True)
             
             with col3:
-                op_total = pl_display[pl_display['項目名'] == '営業損益金額']['合計'].iloc[0]
-                op_rate = (op_total / sales_total * 100) if sales_total != 0 else 0
+                op_total = kpi_totals['営業損益金額']
+                op_rate = kpi_margins['営業損益金額'] * 100
                 st.markdown(f"""
                 <div class="summary-card-orange">
                     <div class="card-title">営業利益</div>
@@ -715,8 +840,8 @@ if 'selected_period_id' in st.session_state and st.session_state.selected_period
                 """, unsafe_allow_html=True)
             
             with col4:
-                ord_total = pl_display[pl_display['項目名'] == '経常損益金額']['合計'].iloc[0]
-                ord_rate = (ord_total / sales_total * 100) if sales_total != 0 else 0
+                ord_total = kpi_totals['経常損益金額']
+                ord_rate = kpi_margins['経常損益金額'] * 100
                 st.markdown(f"""
                 <div class="summary-card">
                     <div class="card-title">経常利益</div>
@@ -726,8 +851,8 @@ if 'selected_period_id' in st.session_state and st.session_state.selected_period
                 """, unsafe_allow_html=True)
             
             with col5:
-                net_total = pl_display[pl_display['項目名'] == '当期純損益金額']['合計'].iloc[0]
-                net_rate = (net_total / sales_total * 100) if sales_total != 0 else 0
+                net_total = kpi_totals['当期純損益金額']
+                net_rate = kpi_margins['当期純損益金額'] * 100
                 color_class = "summary-card-green" if net_total >= 0 else "summary-card-red"
                 st.markdown(f"""
                 <div class="{color_class}">
@@ -740,7 +865,7 @@ if 'selected_period_id' in st.session_state and st.session_state.selected_period
             st.markdown("---")
             
             # タブで表示切り替え
-            tab1, tab2 = st.tabs(["📊 損益計算書", "📈 グラフ分析"])
+            tab1, tab2, tab3 = st.tabs(["📊 損益計算書", "📈 グラフ分析", "🎯 シナリオ比較"])
             
             with tab1:
                 st.subheader("期末着地予測 損益計算書")
@@ -756,7 +881,8 @@ if 'selected_period_id' in st.session_state and st.session_state.selected_period
                     .apply(highlight_summary, axis=1)\
                     .format(lambda x: f"¥{safe_int(x):,}" if isinstance(x, (int, float)) else x)
                 
-                st.dataframe(styled_df, width="stretch", height=500)
+                with perf_trace.phase("Styler: PLサマリー"):
+                    st.dataframe(styled_df, width="stretch", height=500)
                 
             with tab2:
                 st.subheader("月次推移グラフ")
@@ -821,7 +947,8 @@ if 'selected_period_id' in st.session_state and st.session_state.selected_period
                 fig.update_yaxes(title_text="売上高 (円)", secondary_y=False)
                 fig.update_yaxes(title_text="営業利益 (円)", secondary_y=True)
                 
-                st.plotly_chart(fig, width="stretch")
+                with perf_trace.phase("Plotly: 月次推移グラフ"):
+                    st.plotly_chart(fig, width="stretch")
                 
                 # 費用構成の円グラフ
                 st.subheader("費用構成分析（通期予測）")
@@ -835,7 +962,33 @@ if 'selected_period_id' in st.session_state and st.session_state.selected_period
                     hole=0.4,
                     color_discrete_sequence=px.colors.qualitative.Pastel
                 )
-                st.plotly_chart(fig_pie, width="stretch")
+                with perf_trace.phase("Plotly: 費用構成"):
+                    st.plotly_chart(fig_pie, width="stretch")
+            
+            with tab3:
+                st.subheader("シナリオ別 期末着地予測")
+                
+                compare_items = processor.KPI_ITEMS
+                compare_rows = [processor.item_index[item] for item in compare_items]
+                compare_df = pd.DataFrame(scenario_totals[:, compare_rows].T, columns=processor.SCENARIOS)
+                compare_df.insert(0, '項目名', compare_items)
+                
+                st.dataframe(
+                    compare_df.style.format(lambda x: f"¥{safe_int(x):,}" if isinstance(x, (int, float)) else x),
+                    width="stretch"
+                )
+                
+                fig_compare = go.Figure([
+                    go.Bar(name=scenario_name, x=compare_items, y=scenario_totals[i, compare_rows])
+                    for i, scenario_name in enumerate(processor.SCENARIOS)
+                ])
+                fig_compare.update_layout(
+                    title_text="シナリオ別 主要項目",
+                    barmode="group",
+                    legend=dict(orientation="h", yanchor="bottom", y=1.02, xanchor="right", x=1)
+                )
+                with perf_trace.phase("Plotly: シナリオ比較"):
+                    st.plotly_chart(fig_compare, width="stretch")
 
         elif st.session_state.page == "損益計算書 (PL)":
             st.title("📄 損益計算書 (PL)")
@@ -863,7 +1016,8 @@ if 'selected_period_id' in st.session_state and st.session_state.selected_period
                 .format(lambda x: f"¥{safe_int(x):,}" if isinstance(x, (int, float)) else x)\
                 .apply(lambda row: ['background-color: #f8f9fa; font-weight: bold' if row['タイプ'] == '要約' else '' for _ in row], axis=1)
             
-            st.dataframe(formatted_df, width="stretch", height=700)
+            with perf_trace.phase("Styler: 損益計算書"):
+                st.dataframe(formatted_df, width="stretch", height=700)
             
             # CSVダウンロード
             csv = display_df.to_csv(index=False).encode('utf-8-sig')
@@ -1006,6 +1160,7 @@ if 'selected_period_id' in st.session_state and st.session_state.selected_period
                                                         )
                                                         if success:
                                                             st.success(msg)
+                                                            st.session_state.pop('scenario_cube', None)
                                                             st.rerun()
                                                         else:
                                                             st.error(msg)
@@ -1020,6 +1175,7 @@ if 'selected_period_id' in st.session_state and st.session_state.selected_period
                                                         )
                                                         if success:
                                                             st.success(msg)
+                                                            st.session_state.pop('scenario_cube', None)
                                                             st.rerun()
                                                         else:
                                                             st.error(msg)
@@ -1058,6 +1214,7 @@ if 'selected_period_id' in st.session_state and st.session_state.selected_period
                                                 )
                                                 if success:
                                                     st.success(msg)
+                                                    st.session_state.pop('scenario_cube', None)
                                                     st.rerun()
                                                 else:
                                                     st.error(msg)
@@ -1096,6 +1253,7 @@ if 'selected_period_id' in st.session_state and st.session_state.selected_period
                                         st.success(msg)
                                         if 'forecasts_df' in st.session_state:
                                             del st.session_state.forecasts_df
+                                        st.session_state.pop('scenario_cube', None)
                                         st.rerun()
                                     else:
                                         st.error(msg)
@@ -1145,6 +1303,7 @@ if 'selected_period_id' in st.session_state and st.session_state.selected_period
                     # キャッシュクリア
                     if 'actuals_df' in st.session_state:
                         del st.session_state.actuals_df
+                    st.session_state.pop('scenario_cube', None)
                     st.rerun()
                 else:
                     st.error(msg)
@@ -1186,11 +1345,12 @@ if 'selected_period_id' in st.session_state and st.session_state.selected_period
                             
                         st.success(f"✅ ファイル **{uploaded_file.name}** を読み込みました")
                         
-                        # fiscal_period_idを渡す
+                        # 必要な列だけを読み取り専用モードで読み込む (同じ内容のファイルはキャッシュから取得)
                         st.session_state.imported_df, info = processor.import_yayoi_excel(
-                            temp_path, 
-                            st.session_state.selected_period_id,
-                            preview_only=True
+                            temp_path,
+                            preview_only=True,
+                            streaming=True,
+                            use_cache=True
                         )
                         st.session_state.show_import_button = True
                         
@@ -1240,7 +1400,7 @@ if 'selected_period_id' in st.session_state and st.session_state.selected_period
                             if success:
                                 st.success("✅ インポートが完了しました！")
                                 # キャッシュクリア
-                                for key in ['actuals_df', 'imported_df', 'show_import_button']:
+                                for key in ['actuals_df', 'scenario_cube', 'imported_df', 'show_import_button']:
                                     if key in st.session_state:
                                         del st.session_state[key]
                                 st.rerun()
@@ -1375,7 +1535,7 @@ if 'selected_period_id' in st.session_state and st.session_state.selected_period
                             if success:
                                 st.success(f"✅ {info}")
                                 # キャッシュクリア
-                                for key in ['forecasts_df', 'forecast_imported_df', 'show_forecast_import_button']:
+                                for key in ['forecasts_df', 'scenario_cube', 'forecast_imported_df', 'show_forecast_import_button']:
                                     if key in st.session_state:
                                         del st.session_state[key]
                                 st.rerun()
@@ -1388,17 +1548,19 @@ if 'selected_period_id' in st.session_state and st.session_state.selected_period
             st.markdown("""
             <div class="info-box">
                 <strong>💡 使い方:</strong> 「現実」シナリオをベースに、「楽観」「悲観」シナリオの増減率を設定します。
-                設定した増減率は全画面に即座に反映されます。
+                設定はこの会計期に保存され、全画面に即座に反映されます。
             </div>
             """, unsafe_allow_html=True)
             
+            scenario_rates = processor.get_scenario_rates(st.session_state.selected_period_id)
+            
             col1, col2 = st.columns(2)
             
             with col1:
                 st.markdown("### 📈 楽観シナリオ")
                 st.markdown("""
                 <div class="success-box">
-                    <strong>想定される効果:</strong><br>
+                    <strong>想定される効果（初期設定）:</strong><br>
                     • 売上: 増加率そのまま適用<br>
                     • 売上原価: 増加率の50%を逆方向に適用<br>
                     • 販管費: 増加率の30%を逆方向に適用
@@ -1407,7 +1569,7 @@ if 'selected_period_id' in st.session_state and st.session_state.selected_period
                 
                 new_opt_rate = st.number_input(
                     "楽観シナリオ増減率 (%)",
-                    value=st.session_state.scenario_rates["楽観"] * 100,
+                    value=scenario_rates["楽観"] * 100,
                     min_value=-100.0,
                     max_value=100.0,
                     step=1.0,
@@ -1415,15 +1577,18 @@ if 'selected_period_id' in st.session_state and st.session_state.selected_period
                 ) / 100.0
                 
                 if st.button("💾 楽観シナリオ増減率を保存", type="primary"):
-                    st.session_state.scenario_rates["楽観"] = new_opt_rate
-                    st.success(f"✅ 楽観シナリオの増減率を **{new_opt_rate * 100:.1f}%** に設定しました")
-                    st.rerun()
+                    success, msg = processor.save_scenario_rate(st.session_state.selected_period_id, "楽観", new_opt_rate)
+                    if success:
+                        st.success(f"✅ 楽観シナリオの増減率を **{new_opt_rate * 100:.1f}%** に設定しました")
+                        st.rerun()
+                    else:
+                        st.error(msg)
             
             with col2:
                 st.markdown("### 📉 悲観シナリオ")
                 st.markdown("""
                 <div class="warning-box">
-                    <strong>想定される効果:</strong><br>
+                    <strong>想定される効果（初期設定）:</strong><br>
                     • 売上: 減少率そのまま適用<br>
                     • 売上原価: 減少率の50%を逆方向に適用<br>
                     • 販管費: 減少率の30%を逆方向に適用
@@ -1432,7 +1597,7 @@ if 'selected_period_id' in st.session_state and st.session_state.selected_period
                 
                 new_pes_rate = st.number_input(
                     "悲観シナリオ増減率 (%)",
-                    value=st.session_state.scenario_rates["悲観"] * 100,
+                    value=scenario_rates["悲観"] * 100,
                     min_value=-100.0,
                     max_value=100.0,
                     step=1.0,
@@ -1440,9 +1605,12 @@ if 'selected_period_id' in st.session_state and st.session_state.selected_period
                 ) / 100.0
                 
                 if st.button("💾 悲観シナリオ増減率を保存", type="primary"):
-                    st.session_state.scenario_rates["悲観"] = new_pes_rate
-                    st.success(f"✅ 悲観シナリオの増減率を **{new_pes_rate * 100:.1f}%** に設定しました")
-                    st.rerun()
+                    success, msg = processor.save_scenario_rate(st.session_state.selected_period_id, "悲観", new_pes_rate)
+                    if success:
+                        st.success(f"✅ 悲観シナリオの増減率を **{new_pes_rate * 100:.1f}%** に設定しました")
+                        st.rerun()
+                    else:
+                        st.error(msg)
             
             st.markdown("---")
             
@@ -1452,9 +1620,9 @@ if 'selected_period_id' in st.session_state and st.session_state.selected_period
             summary_data = {
                 "シナリオ": ["現実", "楽観", "悲観"],
                 "増減率": [
-                    f"{st.session_state.scenario_rates['現実'] * 100:.1f}%",
-                    f"{st.session_state.scenario_rates['楽観'] * 100:.1f}%",
-                    f"{st.session_state.scenario_rates['悲観'] * 100:.1f}%"
+                    f"{scenario_rates['現実'] * 100:.1f}%",
+                    f"{scenario_rates['楽観'] * 100:.1f}%",
+                    f"{scenario_rates['悲観'] * 100:.1f}%"
                 ],
                 "説明": [
                     "ベースとなる予測値",
@@ -1464,6 +1632,41 @@ if 'selected_period_id' in st.session_state and st.session_state.selected_period
             }
             
             st.table(pd.DataFrame(summary_data))
+            
+            st.markdown("---")
+            
+            # 項目別の感応度ルール
+            st.subheader("📐 項目別の感応度")
+            st.caption("各項目に適用する係数 = 1 + 増減率 × 感応度（カテゴリの設定より項目の設定が優先されます）")
+            
+            rules = processor.get_scenario_rules(st.session_state.selected_period_id)
+            rules_df = pd.DataFrame({'対象': list(rules.keys()), '感応度': list(rules.values())})
+            rule_targets = list(processor.item_categories) + [
+                item for item in processor.all_items if item not in processor.calculated_items
+            ]
+            
+            edited_rules = st.data_editor(
+                rules_df,
+                num_rows="dynamic",
+                width="stretch",
+                column_config={
+                    '対象': st.column_config.SelectboxColumn(options=rule_targets, required=True),
+                    '感応度': st.column_config.NumberColumn(min_value=-5.0, max_value=5.0, step=0.05, format="%.2f")
+                },
+                key="scenario_rules_editor"
+            )
+            
+            if st.button("💾 感応度ルールを保存", type="primary"):
+                valid_rules = edited_rules.dropna(subset=['対象'])
+                success, msg = processor.save_scenario_rules(
+                    st.session_state.selected_period_id,
+                    dict(zip(valid_rules['対象'], valid_rules['感応度'].fillna(0.0)))
+                )
+                if success:
+                    st.success(f"✅ {msg}")
+                    st.rerun()
+                else:
+                    st.error(msg)
         
 
 else:
@@ -1504,3 +1707,71 @@ else:
             会計期間を追加してください。
         </div>
         """, unsafe_allow_html=True)
+
+# --------------------------------------------------------------------------------
+# パフォーマンスパネル（管理者のみ）
+# --------------------------------------------------------------------------------
+def render_perf_panel(perf, stats_before):
+    """今回の再実行の区間ごとの時間・DBクエリ・キャッシュ・DataFrameサイズを表示"""
+    perf.finish()
+    summary = perf.summary()
+    
+    col1, col2 = st.columns(2)
+    col1.metric("合計", f"{summary['total_seconds'] * 1000:.0f} ms")
+    col2.metric("DBクエリ", f"{summary['query_count']}件", f"{summary['query_seconds'] * 1000:.1f} ms", delta_color="off")
+    
+    st.markdown("**区間**")
+    st.dataframe(pd.DataFrame([
+        {
+            '区間': "　" * p['depth'] + p['name'],
+            'ms': round(p['seconds'] * 1000, 1),
+            'クエリ': p['queries'],
+            'クエリms': round(p['query_seconds'] * 1000, 1),
+        }
+        for p in summary['phases']
+    ]), hide_index=True, width="stretch")
+    
+    if summary['slowest_queries']:
+        st.markdown("**遅いクエリ（上位10件）**")
+        st.dataframe(pd.DataFrame([
+            {
+                'ms': round(q['seconds'] * 1000, 2),
+                '行数': q['rows'],
+                '区間': q['phase'],
+                'SQL': " ".join(q['sql'].split())[:200],
+            }
+            for q in summary['slowest_queries']
+        ]), hide_index=True, width="stretch")
+    
+    # キャッシュ付き読み込み関数はこのセッションの呼び出し、共有キャッシュ・書き込みキューはプロセス全体の増分
+    cache_before, writer_before = stats_before
+    cache_after, writer_after = processor.read_cache.stats(), processor.writer.stats()
+    cache_rows = [
+        {'キャッシュ': name, 'ヒット': c['hits'], 'ミス': c['misses']}
+        for name, c in summary['caches'].items()
+    ]
+    cache_rows.append({
+        'キャッシュ': f"共有読み込みキャッシュ ({cache_after['bytes'] / 1e6:.1f}MB)",
+        'ヒット': cache_after['hits'] - cache_before['hits'],
+        'ミス': cache_after['misses'] - cache_before['misses'],
+    })
+    st.markdown("**キャッシュ**")
+    st.dataframe(pd.DataFrame(cache_rows), hide_index=True, width="stretch")
+    st.caption(
+        f"書き込みキュー: 待ち {writer_after['pending']}件 / "
+        f"今回のコミット {writer_after['commits'] - writer_before['commits']}回 "
+        f"({writer_after['jobs'] - writer_before['jobs']}ジョブ)"
+    )
+    
+    if summary['frames']:
+        st.markdown("**DataFrame**")
+        st.dataframe(pd.DataFrame([
+            {'名前': name, '行': f['rows'], '列': f['columns'], 'KB': round(f['bytes'] / 1024, 1)}
+            for name, f in summary['frames'].items()
+        ]), hide_index=True, width="stretch")
+
+if is_admin:
+    with st.sidebar.expander("⏱ パフォーマンス", expanded=perf is not None):
+        st.checkbox("再実行ごとの処理時間を計測", key="perf_panel")
+        if perf is not None:
+            render_perf_panel(perf, perf_stats_before)
@@ -0,0 +1,219 @@
+"""
+弥生会計Excelの一括インポート (コマンドライン)
+
+ディレクトリ内の月次推移表を (会社, 会計期) に対応付け、プロセスプールで並列に解析してから
+複数ファイルずつ1トランザクションで実績データに差分反映する。
+
+対応付けはファイル名の正規表現 (名前付きグループ company / period) かマニフェストCSV
+(列: file, company, period) で指定する。period は期数。
+
+例:
+    python batch_import.py exports/
+    python batch_import.py exports/ --pattern "(?P<company>.+)_第(?P<period>\\d+)期"
+    python batch_import.py exports/ --manifest manifest.csv --workers 8
+"""
+import argparse
+import csv
+import os
+import re
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from data_processor import DataProcessor
+
+# 既定のファイル名パターン: 「会社名_15期.xlsx」など
+DEFAULT_PATTERN = r'(?P<company>.+?)[_\-\s]+(?:第)?(?P<period>\d+)期'
+EXCEL_SUFFIXES = ('.xlsx', '.xlsm', '.xls')
+
+# ワーカープロセスごとの解析器 (initializer で受け取る。DBには接続しない)
+_worker_parser = None
+
+
+def _init_worker(parser):
+    global _worker_parser
+    _worker_parser = parser
+
+
+def _parse_file(file_path, use_cache):
+    """ワーカーで1ファイルを解析し (DataFrame, メッセージ, 秒数) を返す"""
+    start = time.perf_counter()
+    # ファイル単位で並列化しているため、シート単位の並列化は行わない
+    imported_df, message = _worker_parser.parse(
+        file_path, streaming=True, max_workers=1, use_cache=use_cache
+    )
+    return imported_df, message, time.perf_counter() - start
+
+
+def find_excel_files(paths):
+    """指定されたファイル・ディレクトリからExcelファイルを列挙 (ディレクトリは名前順)"""
+    files = []
+    for path in paths:
+        if os.path.isdir(path):
+            files.extend(
+                os.path.join(path, name) for name in sorted(os.listdir(path))
+                if name.lower().endswith(EXCEL_SUFFIXES) and not name.startswith('~$')
+            )
+        else:
+            files.append(path)
+    return files
+
+
+def load_manifest(manifest_path):
+    """マニフェストCSV (file, company, period) を {ファイルパス: (会社名, 期数)} に変換"""
+    base_dir = os.path.dirname(os.path.abspath(manifest_path))
+    targets = {}
+    with open(manifest_path, newline='', encoding='utf-8-sig') as f:
+        for row in csv.DictReader(f):
+            path = row['file'] if os.path.isabs(row['file']) else os.path.join(base_dir, row['file'])
+            targets[os.path.abspath(path)] = (row['company'].strip(), int(row['period']))
+    return targets
+
+
+def resolve_targets(processor, files, pattern=None, manifest=None):
+    """
+    各ファイルを会計期IDに対応付ける
+
+    戻り値: ([(ファイル, 会計期ID)], [(ファイル, エラー理由)])
+    """
+    periods = processor.list_fiscal_periods()
+    period_ids = {
+        (row.company_name, int(row.period_num)): int(row.fiscal_period_id)
+        for row in periods.itertuples(index=False)
+    }
+    regex = re.compile(pattern or DEFAULT_PATTERN)
+
+    resolved, failed = [], []
+    for file_path in files:
+        if manifest is not None:
+            key = manifest.get(os.path.abspath(file_path))
+            if key is None:
+                failed.append((file_path, "マニフェストに記載がありません"))
+                continue
+        else:
+            match = regex.search(os.path.splitext(os.path.basename(file_path))[0])
+            if not match:
+                failed.append((file_path, "ファイル名がパターンに一致しません"))
+                continue
+            key = (match.group('company').strip(), int(match.group('period')))
+
+        if key not in period_ids:
+            failed.append((file_path, f"会計期が登録されていません: {key[0]} 第{key[1]}期"))
+            continue
+        resolved.append((file_path, period_ids[key]))
+    return resolved, failed
+
+
+def run_batch(db_path, targets, workers=None, batch_size=10, use_cache=True, log=print):
+    """
+    (ファイル, 会計期ID) のリストを並列解析し、batch_size ファイルごとに1トランザクションで保存
+
+    db_path が None の場合は DataProcessor の既定 (DATABASE_URL があればPostgreSQL) に従う。
+    DataProcessor はこのプロセスにだけ作り、ワーカーには解析器 (YayoiParser) だけを渡す
+
+    戻り値: ファイルごとの結果辞書のリスト
+    """
+    processor = DataProcessor(db_path)
+    results = []
+    pending = []
+
+    def flush():
+        if not pending:
+            return
+        start = time.perf_counter()
+        try:
+            counts = processor.merge_actual_data_many([(pid, df) for _, pid, df in pending])
+        except Exception as e:
+            for result, _, _ in pending:
+                result.update(status='error', message=f"保存に失敗しました: {e}")
+            log(f"  保存エラー ({len(pending)}ファイル): {e}")
+        else:
+            elapsed = time.perf_counter() - start
+            for (result, _, _), count in zip(pending, counts):
+                result.update(status='ok', save_seconds=elapsed / len(pending), **count)
+            log(f"  {len(pending)}ファイルを保存 ({elapsed:.2f}秒)")
+        pending.clear()
+
+    files = [file_path for file_path, _ in targets]
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                             initargs=(processor.yayoi_parser,)) as executor:
+        # executor.map は入力順に結果を返すため、同じ会計期のファイルは後のものが優先される
+        parsed = executor.map(_parse_file, files, [use_cache] * len(files))
+        for (file_path, pid), (imported_df, message, seconds) in zip(targets, parsed):
+            result = {
+                'file': file_path,
+                'fiscal_period_id': pid,
+                'size_bytes': os.path.getsize(file_path),
+                'parse_seconds': seconds,
+            }
+            results.append(result)
+            if imported_df.empty:
+                result.update(status='error', message=message if message != "データ抽出に成功しました" else "データが見つかりません")
+                log(f"  ✗ {os.path.basename(file_path)}: {result['message']}")
+                continue
+            log(f"  ✓ {os.path.basename(file_path)}: {len(imported_df)}項目 ({seconds:.2f}秒)")
+            pending.append((result, pid, imported_df))
+            if len(pending) >= batch_size:
+                flush()
+        flush()
+    processor.close()
+    return results
+
+
+def print_report(results, failed, elapsed):
+    """ファイルごとの所要時間とスループットを表示"""
+    ok = [r for r in results if r.get('status') == 'ok']
+    errors = [r for r in results if r.get('status') != 'ok']
+    total_bytes = sum(r['size_bytes'] for r in results)
+
+    print()
+    print(f"{'ファイル':<40} {'解析(秒)':>9} {'保存(秒)':>9} {'追加':>6} {'更新':>6} {'削除':>6}")
+    for r in ok:
+        print(
+            f"{os.path.basename(r['file']):<40} {r['parse_seconds']:>9.2f} {r['save_seconds']:>9.2f} "
+            f"{r['inserted']:>6} {r['updated']:>6} {r['deleted']:>6}"
+        )
+    for r in errors:
+        print(f"{os.path.basename(r['file']):<40} エラー: {r['message']}")
+    for file_path, reason in failed:
+        print(f"{os.path.basename(file_path):<40} スキップ: {reason}")
+
+    print()
+    print(f"成功 {len(ok)}件 / エラー {len(errors)}件 / スキップ {len(failed)}件")
+    if elapsed > 0:
+        print(
+            f"所要時間 {elapsed:.2f}秒  スループット {len(results) / elapsed:.2f}ファイル/秒 "
+            f"({total_bytes / elapsed / 1e6:.2f}MB/秒)"
+        )
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="弥生会計Excelを一括で実績データにインポートします")
+    parser.add_argument('paths', nargs='+', help="Excelファイルまたはディレクトリ")
+    parser.add_argument('--db', default=None,
+                        help="SQLiteファイル (省略時は環境変数 DATABASE_URL のPostgreSQL、無ければ financial_data.db)")
+    parser.add_argument('--pattern', default=None,
+                        help="ファイル名から会社名と期数を取り出す正規表現 (名前付きグループ company / period)")
+    parser.add_argument('--manifest', default=None, help="対応表CSV (列: file, company, period)")
+    parser.add_argument('--workers', type=int, default=None, help="解析プロセス数 (省略時はCPU数)")
+    parser.add_argument('--batch-size', type=int, default=10, help="1トランザクションで保存するファイル数")
+    parser.add_argument('--no-cache', action='store_true', help="解析結果キャッシュを使わない")
+    args = parser.parse_args(argv)
+
+    start = time.perf_counter()
+    processor = DataProcessor(args.db)
+    files = find_excel_files(args.paths)
+    manifest = load_manifest(args.manifest) if args.manifest else None
+    targets, failed = resolve_targets(processor, files, pattern=args.pattern, manifest=manifest)
+    processor.close()
+
+    print(f"{len(files)}ファイル中 {len(targets)}ファイルをインポートします")
+    results = run_batch(args.db, targets, workers=args.workers, batch_size=args.batch_size,
+                        use_cache=not args.no_cache) if targets else []
+    print_report(results, failed, time.perf_counter() - start)
+
+    return 0 if not failed and all(r.get('status') == 'ok' for r in results) else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,219 @@
+"""
+全会社・全会計期・全シナリオのPL一括作成 (コマンドライン / API)
+
+実績・予測・補助科目合計・シナリオ係数を会計期をまたいだ数回のクエリでまとめて読み込み、
+会計期ごとの行列 (実績: 項目×月、予測: シナリオ×項目×月) に変換してから、
+PL計算と縦持ちへの展開をプロセスプールで並列に実行して1つのファイル (CSV / Excel / Parquet) に出力する。
+ワーカーは行列と集計行列 (pl_layout) だけを受け取り、DataProcessor やDB接続は作らない。
+
+出力は縦持ち (会社名, 期, 会計期ID, シナリオ, 項目名, タイプ, 月, 区分, 金額)。
+
+例:
+    python batch_report.py pl_report.csv
+    python batch_report.py pl_report.xlsx --close-month 2025-09 --workers 8
+    python batch_report.py pl_report.parquet --company A社 --company B社
+"""
+import argparse
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from data_processor import DataProcessor
+
+REPORT_COLUMNS = ['会社名', '期', '会計期ID', 'シナリオ', '項目名', 'タイプ', '月', '区分', '金額']
+EXCEL_MAX_ROWS = 1048575
+
+# ワーカープロセスごとのPL計算の定義 (initializer で受け取る)
+_worker_layout = None
+
+
+def _init_worker(layout):
+    global _worker_layout
+    _worker_layout = layout
+
+
+def _compute_chunk(tasks):
+    """ワーカーで複数会計期のPLを計算し、縦持ちのDataFrameにまとめて返す"""
+    return compute_report_rows(_worker_layout, tasks)
+
+
+def pl_layout(processor):
+    """compute_report_rows に渡すPL計算の定義 (シナリオ・項目・タイプ・集計行列)"""
+    return {
+        'scenarios': list(processor.SCENARIOS),
+        'items': list(processor.all_items),
+        'item_types': processor.pl_item_types(),
+        'pl_matrix': processor.pl_aggregation_matrix(),
+    }
+
+
+def compute_report_rows(layout, tasks):
+    """
+    会計期ごとの行列 (build_report_tasks の要素) から3シナリオのPLを計算して縦持ちのDataFrameにする
+
+    layout: pl_layout の戻り値。DBには接続しない (DataProcessor.calculate_pl_matrix と同じ計算)
+    """
+    frames = []
+    scenarios = np.array(layout['scenarios'], dtype=object)
+    items = np.array(layout['items'], dtype=object)
+    item_types = np.array(layout['item_types'], dtype=object)
+    n_scenarios, n_items = len(scenarios), len(items)
+    for task in tasks:
+        months = task['months']
+        if not months:
+            continue
+        n_months = len(months)
+        is_actual = np.arange(n_months) < task['split_index']
+        base = np.where(is_actual, task['actuals'], task['forecasts'])
+        pl_cube = np.matmul(layout['pl_matrix'], base)
+        size = n_scenarios * n_items * n_months
+        frames.append(pd.DataFrame({
+            '会社名': task['company_name'],
+            '期': task['period_num'],
+            '会計期ID': task['fiscal_period_id'],
+            'シナリオ': np.repeat(scenarios, n_items * n_months),
+            '項目名': np.tile(np.repeat(items, n_months), n_scenarios),
+            'タイプ': np.tile(np.repeat(item_types, n_months), n_scenarios),
+            '月': np.tile(np.array(months, dtype=object), n_scenarios * n_items),
+            '区分': np.tile(np.where(is_actual, '実績', '予測').astype(object), n_scenarios * n_items),
+            '金額': pl_cube.reshape(size),
+        }))
+    if not frames:
+        return pd.DataFrame(columns=REPORT_COLUMNS)
+    return pd.concat(frames, ignore_index=True)
+
+
+def build_report_tasks(processor, companies=None, close_month=None):
+    """
+    対象の全会計期について、PL計算に必要なデータをまとめて読み込み、会計期ごとの行列に変換する
+
+    各要素の 'actuals' は項目×月、'forecasts' はシナリオ係数と補助科目合計を反映したシナリオ×項目×月の配列
+    companies: 対象の会社名リスト (省略時は全社)
+    close_month: 実績締月 (YYYY-MM)。省略時は会計期ごとに実績がある最終月
+    """
+    periods = processor.list_fiscal_periods()
+    if companies:
+        periods = periods[periods['company_name'].isin(companies)]
+    if periods.empty:
+        return []
+    period_ids = periods['fiscal_period_id'].astype(int).tolist()
+
+    # 会計期をまたいで一括取得し、会計期ごとに分割する
+    actuals = processor.load_grid_cells('actual', period_ids)
+    forecasts = processor.load_grid_cells('forecast', period_ids, scenario=processor.SCENARIOS[0])
+    sub_totals = processor.load_sub_account_totals_many(period_ids)
+    coefficients = processor.get_scenario_coefficients_many(period_ids)
+    actuals_by_period = dict(tuple(actuals.groupby('fiscal_period_id')))
+    forecasts_by_period = dict(tuple(forecasts.groupby('fiscal_period_id')))
+    sub_totals_by_period = dict(tuple(sub_totals.groupby('fiscal_period_id')))
+
+    tasks = []
+    for period in periods.itertuples(index=False):
+        pid = int(period.fiscal_period_id)
+        months = processor.months_between(period.start_date, period.end_date)
+        period_actuals = actuals_by_period.get(pid)
+        split_index = split_index_for(months, close_month, period_actuals)
+        tasks.append({
+            'fiscal_period_id': pid,
+            'company_name': period.company_name,
+            'period_num': int(period.period_num),
+            'months': months,
+            'split_index': split_index,
+            'actuals': processor.frame_to_matrix(period_actuals, months),
+            'forecasts': processor.build_scenario_forecasts(
+                forecasts_by_period.get(pid), split_index, months, coefficients[pid], sub_totals_by_period.get(pid)
+            ),
+        })
+    return tasks
+
+
+def split_index_for(months, close_month=None, actuals=None):
+    """実績と予測の境界 (実績の月数) を求める"""
+    if close_month is not None:
+        # 締月が会計期より後なら全月実績、前なら全月予測
+        return sum(1 for m in months if m <= close_month)
+    if actuals is None or actuals.empty:
+        return 0
+    actual_months = set(actuals['month'])
+    last = max((i for i, m in enumerate(months) if m in actual_months), default=-1)
+    return last + 1
+
+
+def build_pl_report(db_path=None, companies=None, close_month=None, workers=None, log=print):
+    """
+    全会計期のPLを計算して縦持ちのDataFrameで返す
+
+    workers: PL計算のプロセス数 (省略時はCPU数、1の場合は並列化しない)
+    """
+    processor = DataProcessor(db_path)
+    start = time.perf_counter()
+    tasks = build_report_tasks(processor, companies=companies, close_month=close_month)
+    log(f"{len(tasks)}会計期のデータを読み込みました ({time.perf_counter() - start:.2f}秒)")
+
+    layout = pl_layout(processor)
+    processor.close()
+
+    start = time.perf_counter()
+    workers = min(workers or os.cpu_count() or 1, max(len(tasks), 1))
+    if workers <= 1:
+        report = compute_report_rows(layout, tasks)
+    else:
+        # 1プロセスあたり数チャンクの連続した区間に分け、処理時間の偏りをならしつつ出力順を保つ
+        n_chunks = min(len(tasks), workers * 4)
+        bounds = np.linspace(0, len(tasks), n_chunks + 1).astype(int)
+        chunks = [tasks[a:b] for a, b in zip(bounds[:-1], bounds[1:])]
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                                 initargs=(layout,)) as executor:
+            frames = list(executor.map(_compute_chunk, chunks))
+        report = pd.concat(frames, ignore_index=True)
+    log(f"PLを計算しました: {len(report)}行 ({time.perf_counter() - start:.2f}秒, {workers}プロセス)")
+    return report
+
+
+def write_report(report, output_path):
+    """拡張子に応じて CSV / Excel / Parquet で出力"""
+    ext = os.path.splitext(output_path)[1].lower()
+    if ext == '.csv':
+        # Excelで開いたときに文字化けしないようBOM付きで出力
+        report.to_csv(output_path, index=False, encoding='utf-8-sig')
+    elif ext in ('.xlsx', '.xlsm'):
+        if len(report) > EXCEL_MAX_ROWS:
+            raise ValueError(f"Excelの最大行数を超えています ({len(report)}行)。CSVかParquetで出力してください")
+        report.to_excel(output_path, index=False, sheet_name='PL')
+    elif ext == '.parquet':
+        try:
+            report.to_parquet(output_path, index=False)
+        except ImportError as e:
+            raise ValueError(f"Parquet出力には pyarrow が必要です: {e}")
+    else:
+        raise ValueError(f"未対応の出力形式です: {ext} (.csv / .xlsx / .parquet)")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="全会社・全会計期・全シナリオのPLを1つのファイルに出力します")
+    parser.add_argument('output', help="出力ファイル (.csv / .xlsx / .parquet)")
+    parser.add_argument('--db', default=None,
+                        help="SQLiteファイル (省略時は環境変数 DATABASE_URL のPostgreSQL、無ければ financial_data.db)")
+    parser.add_argument('--company', action='append', default=None, help="対象の会社名 (複数指定可、省略時は全社)")
+    parser.add_argument('--close-month', default=None,
+                        help="実績締月 YYYY-MM (省略時は会計期ごとに実績がある最終月)")
+    parser.add_argument('--workers', type=int, default=None, help="PL計算のプロセス数 (省略時はCPU数)")
+    args = parser.parse_args(argv)
+
+    start = time.perf_counter()
+    report = build_pl_report(args.db, companies=args.company, close_month=args.close_month, workers=args.workers)
+    try:
+        write_report(report, args.output)
+    except ValueError as e:
+        print(f"エラー: {e}")
+        return 1
+    print(f"{args.output} に出力しました (合計 {time.perf_counter() - start:.2f}秒)")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
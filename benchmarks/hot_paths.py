@@ -0,0 +1,339 @@
+"""
+DataProcessor の主要処理のベンチマーク (合成データ)
+
+乱数シードで決まる合成データ (会社 × 会計期 × all_items × 12ヶ月、予測3シナリオ、補助科目) と
+弥生会計形式の月次推移表Excelを一時ディレクトリに作成し、規模ごとに
+読み込み・ピボット・PL計算・予測・インポート・保存の時間を計測して JSON で出力する。
+
+結果はコミット間で比較できる (--compare)。
+
+例:
+    python benchmarks/hot_paths.py
+    python benchmarks/hot_paths.py --scale small --scale large --output after.json
+    python benchmarks/hot_paths.py --companies 20 --periods 4 --workbook-rows 3000
+    python benchmarks/hot_paths.py --compare before.json after.json
+"""
+import argparse
+import contextlib
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_DIR)
+
+import numpy as np
+import pandas as pd
+
+from data_processor import DataProcessor
+
+# 規模の定義: 会社数・会計期数・補助科目数 (親項目ごと)・Excelの行数とシート数
+SCALES = {
+    'small': {'companies': 2, 'periods': 2, 'sub_accounts': 3, 'workbook_rows': 200, 'workbook_sheets': 1},
+    'medium': {'companies': 10, 'periods': 3, 'sub_accounts': 5, 'workbook_rows': 1000, 'workbook_sheets': 3},
+    'large': {'companies': 40, 'periods': 5, 'sub_accounts': 10, 'workbook_rows': 5000, 'workbook_sheets': 5},
+}
+
+# 補助科目を持たせる親項目
+SUB_ACCOUNT_PARENTS = ["売上高", "売上原価", "外注費"]
+
+# Excelに混ぜる科目名以外の行
+NOISE_LABELS = ["【販売管理費】", "その他", "期首商品棚卸高", "合計", "メモ"]
+
+
+def generate_dataset(processor, companies, periods, sub_accounts, seed=0):
+    """
+    会社 × 会計期ごとに実績 (all_items × 12ヶ月)・予測 (3シナリオ)・補助科目を登録
+
+    戻り値: 登録した会計期IDのリスト
+    """
+    rng = np.random.default_rng(seed)
+    n_items = len(processor.all_items)
+    # 項目ごとの規模 (売上高が最大) を固定し、月ごとに揺らす
+    item_scale = rng.lognormal(mean=13, sigma=1.5, size=n_items)
+    item_scale[processor.item_index["売上高"]] = item_scale.max() * 3
+
+    for c in range(companies):
+        processor.add_company(f"合成{c + 1:03d}株式会社")
+    company_ids = processor.get_companies().sort_values('name')['id'].astype(int).tolist()
+    for comp_id in company_ids:
+        for p in range(periods):
+            processor.add_fiscal_period(comp_id, p + 1, f"{2020 + p}-04-01", f"{2021 + p}-03-31")
+
+    periods_df = processor.list_fiscal_periods()
+    imports = []
+    for period in periods_df.itertuples(index=False):
+        pid = int(period.fiscal_period_id)
+        months = processor.months_between(period.start_date, period.end_date)
+        n_months = len(months)
+
+        actual = np.round(item_scale[:, None] * rng.uniform(0.7, 1.3, size=(n_items, n_months)))
+        actual_df = pd.DataFrame(actual, columns=months)
+        actual_df.insert(0, '項目名', processor.all_items)
+        imports.append((pid, actual_df))
+
+        for scenario in processor.SCENARIOS:
+            forecast = np.round(actual * rng.uniform(0.9, 1.1, size=actual.shape))
+            forecast_df = pd.DataFrame(forecast, columns=months)
+            forecast_df.insert(0, '項目名', processor.all_items)
+            processor.submit_grid(pid, 'forecast', scenario, forecast_df)
+
+        cells = [
+            (parent, f"補助{s + 1:02d}", month, float(rng.integers(10000, 1000000)))
+            for parent in SUB_ACCOUNT_PARENTS
+            for s in range(sub_accounts)
+            for month in months
+        ]
+        if cells:
+            sub_df = pd.DataFrame(cells, columns=['parent_item', 'sub_account_name', 'month', 'amount'])
+            processor.submit_grid(pid, 'sub_account', processor.SCENARIOS[0], sub_df)
+
+    processor.merge_actual_data_many(imports)
+    return periods_df['fiscal_period_id'].astype(int).tolist()
+
+
+def _yayoi_value(rng):
+    """弥生会計の表記ゆれ (カンマ区切り・△・括弧・円記号・空欄) を含む金額"""
+    n = int(rng.integers(1, 10000000))
+    kind = rng.random()
+    if kind < 0.45:
+        return n
+    if kind < 0.6:
+        return f"{n:,}"
+    if kind < 0.7:
+        return f"△{n:,}"
+    if kind < 0.75:
+        return f"({n:,})"
+    if kind < 0.8:
+        return f"¥{n:,}円"
+    if kind < 0.9:
+        return None
+    return 0
+
+
+def generate_yayoi_workbook(path, processor, rows, sheets=1, seed=0):
+    """
+    弥生会計の月次推移表に似たExcelを作成
+
+    各シートはタイトル行・空行・見出し行 (勘定科目 + 4月〜3月 + 合計) と rows 行の明細。
+    科目名は item_mapping の別名と科目以外の行を混ぜ、列 (A〜C) もばらつかせる
+    """
+    import openpyxl
+
+    rng = np.random.default_rng(seed)
+    aliases = [alias for names in processor.item_mapping.values() for alias in names]
+    labels = aliases + NOISE_LABELS
+    month_labels = [f"{(i + 3) % 12 + 1}月" for i in range(12)]
+
+    wb = openpyxl.Workbook(write_only=True)
+    for s in range(sheets):
+        ws = wb.create_sheet(f"月次推移{s + 1}")
+        ws.append(["月次推移表", None, None, "合成データ株式会社"])
+        ws.append([])
+        ws.append(["勘定科目", None, None] + month_labels + ["合計"])
+        for _ in range(rows):
+            label_row = [None, None, None]
+            label_row[int(rng.choice([0, 0, 1, 2]))] = labels[int(rng.integers(len(labels)))]
+            ws.append(label_row + [_yayoi_value(rng) for _ in range(13)])
+    wb.save(path)
+    return path
+
+
+def time_call(func, repeat, setup=None):
+    """func を repeat 回実行し、ミリ秒の中央値・最小・最大を返す (setup は毎回の前処理で計測対象外)"""
+    samples = []
+    for _ in range(repeat):
+        if setup is not None:
+            setup()
+        start = time.perf_counter()
+        func()
+        samples.append((time.perf_counter() - start) * 1000)
+    return {
+        'median_ms': statistics.median(samples),
+        'min_ms': min(samples),
+        'max_ms': max(samples),
+        'repeat': repeat,
+    }
+
+
+def run_scale(params, repeat, seed, work_dir):
+    """1つの規模でデータを作成し、各処理を計測して {処理名: 統計} を返す"""
+    db_path = os.path.join(work_dir, "bench.db")
+    processor = DataProcessor(db_path)
+    start = time.perf_counter()
+    period_ids = generate_dataset(
+        processor, params['companies'], params['periods'], params['sub_accounts'], seed=seed
+    )
+    generate_seconds = time.perf_counter() - start
+
+    workbook = generate_yayoi_workbook(
+        os.path.join(work_dir, "yayoi.xlsx"), processor,
+        params['workbook_rows'], params['workbook_sheets'], seed=seed
+    )
+
+    pid = period_ids[len(period_ids) // 2]
+    comp_id = processor.get_company_id_from_period_id(pid)
+    months = processor.get_fiscal_months(comp_id, pid)
+    split_index = 6
+    actuals_df = processor.load_actual_data(pid)
+    forecasts_df = processor.load_forecast_data(pid, processor.SCENARIOS[0])
+    long_actuals = processor.load_grid_cells('actual', [pid])
+    coefficients = processor.get_scenario_coefficients(pid)
+    overrides = processor.load_sub_account_totals(pid)
+    pl_matrix = processor.calculate_scenario_pls(actuals_df, forecasts_df, split_index, months,
+                                                 coefficients, overrides)[0]
+    imported_df, _ = processor.import_yayoi_excel(workbook, preview_only=True)
+    rng = np.random.default_rng(seed)
+
+    def perturbed_actuals():
+        # 1割のセルを変更した取り込み結果 (差分保存の計測用)
+        df = actuals_df.copy()
+        mask = rng.random((len(df), len(months))) < 0.1
+        df[months] = np.where(mask, df[months].to_numpy() + 1, df[months].to_numpy())
+        return df
+
+    pending = {}
+    cases = {
+        'load_actual_data': (lambda: processor.load_actual_data(pid), None),
+        'load_forecast_data': (lambda: processor.load_forecast_data(pid, processor.SCENARIOS[0]), None),
+        'load_grid_cells_all_periods': (lambda: processor.load_grid_cells('actual', period_ids), None),
+        'pivot_wide_to_matrix': (lambda: processor.frame_to_matrix(actuals_df, months), None),
+        'pivot_long_to_matrix': (lambda: processor.frame_to_matrix(long_actuals, months), None),
+        'calculate_pl': (lambda: processor.calculate_pl(actuals_df, forecasts_df, split_index, months), None),
+        'calculate_scenario_pls': (
+            lambda: processor.calculate_scenario_pls(actuals_df, forecasts_df, split_index, months,
+                                                     coefficients, overrides),
+            None
+        ),
+        'growth_forecast': (lambda: processor.calculate_growth_forecasts(actuals_df, split_index, months), None),
+        'kpi_summary': (lambda: processor.kpi_summary(pl_matrix, split_index), None),
+        'kpi_summaries_all_periods_cold': (
+            lambda: processor.get_kpi_summaries({p: split_index for p in period_ids}), processor.read_cache.invalidate
+        ),
+        'kpi_summaries_all_periods_warm': (
+            lambda: processor.get_kpi_summaries({p: split_index for p in period_ids}), None
+        ),
+        'period_bundle_cold': (lambda: processor.get_period_bundle(pid), processor.read_cache.invalidate),
+        'period_bundle_warm': (lambda: processor.get_period_bundle(pid), None),
+        'import_yayoi_pandas': (lambda: processor.import_yayoi_excel(workbook, preview_only=True), None),
+        'import_yayoi_streaming': (
+            lambda: processor.import_yayoi_excel(workbook, preview_only=True, streaming=True, max_workers=1),
+            None
+        ),
+        'save_extracted_merge': (
+            lambda: processor.save_extracted_data(pid, pending['df']),
+            lambda: pending.update(df=perturbed_actuals())
+        ),
+        'save_extracted_replace': (
+            lambda: processor.save_extracted_data(pid, pending['df'], merge=False),
+            lambda: pending.update(df=perturbed_actuals())
+        ),
+        'save_grid_forecast': (
+            lambda: processor.save_grid(pid, 'forecast', processor.SCENARIOS[1], pending['df']),
+            lambda: pending.update(df=perturbed_actuals())
+        ),
+    }
+    results = {}
+    for name, (func, setup) in cases.items():
+        results[name] = time_call(func, repeat, setup)
+    processor.close()
+
+    return {
+        'params': params,
+        'rows': {
+            'periods': len(period_ids),
+            'actual_cells': len(period_ids) * len(processor.all_items) * 12,
+            'imported_items': len(imported_df),
+        },
+        'generate_seconds': generate_seconds,
+        'results': results,
+    }
+
+
+def _git_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=REPO_DIR, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(before_path, after_path):
+    """2つの結果ファイルの中央値を比較して表示 (比 = after / before)"""
+    with open(before_path, encoding='utf-8') as f:
+        before = json.load(f)
+    with open(after_path, encoding='utf-8') as f:
+        after = json.load(f)
+    print(f"before: {before.get('commit')}  after: {after.get('commit')}")
+    for scale, result in after['scales'].items():
+        base = before['scales'].get(scale)
+        if base is None:
+            continue
+        print(f"\n[{scale}]")
+        print(f"{'処理':<32} {'before(ms)':>11} {'after(ms)':>11} {'比':>7}")
+        for name, stats in result['results'].items():
+            if name not in base['results']:
+                continue
+            b, a = base['results'][name]['median_ms'], stats['median_ms']
+            print(f"{name:<32} {b:>11.2f} {a:>11.2f} {a / b if b else float('nan'):>7.2f}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="DataProcessor の主要処理を合成データで計測します")
+    parser.add_argument('--scale', action='append', choices=sorted(SCALES), default=None,
+                        help="計測する規模 (複数指定可、省略時は small と medium)")
+    parser.add_argument('--companies', type=int, default=None, help="会社数 (指定時は custom 規模として計測)")
+    parser.add_argument('--periods', type=int, default=3, help="custom 規模の会社ごとの会計期数")
+    parser.add_argument('--sub-accounts', type=int, default=5, help="custom 規模の親項目ごとの補助科目数")
+    parser.add_argument('--workbook-rows', type=int, default=1000, help="custom 規模のExcelの明細行数 (シートごと)")
+    parser.add_argument('--workbook-sheets', type=int, default=1, help="custom 規模のExcelのシート数")
+    parser.add_argument('--repeat', type=int, default=5, help="処理ごとの実行回数 (中央値を採用)")
+    parser.add_argument('--seed', type=int, default=0, help="合成データの乱数シード")
+    parser.add_argument('--output', default=None, help="結果のJSONファイル (省略時は標準出力)")
+    parser.add_argument('--compare', nargs=2, metavar=('BEFORE', 'AFTER'), default=None,
+                        help="2つの結果ファイルを比較して表示")
+    args = parser.parse_args(argv)
+
+    if args.compare:
+        compare(*args.compare)
+        return 0
+
+    scales = {name: SCALES[name] for name in (args.scale or ['small', 'medium'])}
+    if args.companies:
+        scales['custom'] = {
+            'companies': args.companies, 'periods': args.periods, 'sub_accounts': args.sub_accounts,
+            'workbook_rows': args.workbook_rows, 'workbook_sheets': args.workbook_sheets,
+        }
+
+    report = {
+        'benchmark': 'hot_paths',
+        'commit': _git_commit(),
+        'python': platform.python_version(),
+        'pandas': pd.__version__,
+        'numpy': np.__version__,
+        'seed': args.seed,
+        'scales': {},
+    }
+    for name, params in scales.items():
+        print(f"{name}: {params}", file=sys.stderr)
+        # DataProcessor のメッセージ (保存エラーの print など) で標準出力のJSONが崩れないよう標準エラーへ
+        with tempfile.TemporaryDirectory() as work_dir, contextlib.redirect_stdout(sys.stderr):
+            report['scales'][name] = run_scale(params, args.repeat, args.seed, work_dir)
+
+    text = json.dumps(report, ensure_ascii=False, indent=2)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(text)
+    else:
+        print(text)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
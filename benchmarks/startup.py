@@ -0,0 +1,187 @@
+"""
+app.py の起動時間ベンチマーク (初回描画までの時間)
+
+画面ごとに新しいPythonプロセスで app.py を Streamlit の AppTest で実行し、
+コールドスタート (モジュール読み込みを含む初回実行) と再実行の時間、
+読み込まれた重いライブラリ、ログイン後は各ページへの切り替え時間を計測して JSON で出力する。
+
+データベースは一時ディレクトリのSQLiteを使う (financial_data.db は変更しない)。
+
+例:
+    python benchmarks/startup.py
+    python benchmarks/startup.py --repeat 5 --output startup.json
+    python benchmarks/startup.py --budget-ms login=1500 --budget-ms dashboard=4000
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+APP_PATH = os.path.join(REPO_DIR, "app.py")
+
+# 画面名 → AppTest 実行前に設定する session_state (ログイン後の初回表示はダッシュボード)
+SCREENS = {
+    "login": {},
+    "dashboard": {"authenticated": True, "username": "admin"},
+}
+
+# ログイン後にメニューから切り替えて計測するページ
+PAGES = ["損益計算書 (PL)", "実績データ入力", "予測データ入力", "データインポート", "シナリオ一括設定", "システム設定"]
+
+# 起動時に読み込まれたかを記録するライブラリ
+HEAVY_MODULES = ["pandas", "numpy", "plotly", "plotly.express", "openpyxl", "data_processor"]
+
+
+def _seed_database(db_path):
+    """会社・会計期・実績を1件ずつ登録した一時DBを作成"""
+    sys.path.insert(0, REPO_DIR)
+    from data_processor import DataProcessor
+
+    processor = DataProcessor(db_path)
+    processor.add_company("ベンチマーク株式会社")
+    comp_id = int(processor.get_companies()["id"].iloc[0])
+    processor.add_fiscal_period(comp_id, 1, "2025-04-01", "2026-03-31")
+    period_id = int(processor.list_fiscal_periods()["fiscal_period_id"].iloc[0])
+    months = processor.get_fiscal_months(comp_id, period_id)
+    for i, item in enumerate(["売上高", "売上原価", "給料手当", "地代家賃"]):
+        processor.save_actual_item(period_id, item, {m: 1000000.0 / (i + 1) for m in months[:6]})
+    processor.close()
+
+
+def _run_child(screen):
+    """子プロセス側: 1画面を実行して計測結果を JSON で標準出力へ"""
+    start = time.perf_counter()
+    from streamlit.testing.v1 import AppTest
+    import_seconds = time.perf_counter() - start
+
+    at = AppTest.from_file(APP_PATH, default_timeout=120)
+    for key, value in SCREENS[screen].items():
+        at.session_state[key] = value
+
+    start = time.perf_counter()
+    at.run()
+    first_render = time.perf_counter() - start
+
+    loaded_modules = [m for m in HEAVY_MODULES if m in sys.modules]
+
+    start = time.perf_counter()
+    at.run()
+    rerun = time.perf_counter() - start
+
+    page_seconds = {}
+    if SCREENS[screen].get("authenticated"):
+        for page in PAGES:
+            start = time.perf_counter()
+            _select_page(at, page)
+            page_seconds[page] = time.perf_counter() - start
+
+    print(json.dumps({
+        "screen": screen,
+        "streamlit_import_seconds": import_seconds,
+        "first_render_seconds": first_render,
+        "rerun_seconds": rerun,
+        "page_seconds": page_seconds,
+        "exceptions": [str(e.value) for e in at.exception],
+        "loaded_modules": loaded_modules,
+    }, ensure_ascii=False))
+
+
+def _select_page(at, page):
+    """サイドバーのメニューでページを切り替えて再実行"""
+    menu = next(radio for radio in at.sidebar.radio if page in radio.options)
+    menu.set_value(page).run()
+
+
+def measure(screens, repeat, db_url):
+    """画面ごとに repeat 回コールドスタートし、中央値と各回の結果を返す"""
+    env = dict(os.environ, DATABASE_URL=db_url)
+    results = {}
+    for screen in screens:
+        samples = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            completed = subprocess.run(
+                [sys.executable, os.path.abspath(__file__), "--child", screen],
+                capture_output=True, text=True, env=env, cwd=REPO_DIR
+            )
+            wall = time.perf_counter() - start
+            lines = [line for line in completed.stdout.splitlines() if line.startswith("{")]
+            if completed.returncode != 0 or not lines:
+                raise RuntimeError(f"{screen} の計測に失敗しました:\n{completed.stderr}")
+            sample = json.loads(lines[-1])
+            sample["process_seconds"] = wall
+            samples.append(sample)
+        results[screen] = {
+            "first_render_ms": statistics.median(s["first_render_seconds"] for s in samples) * 1000,
+            "rerun_ms": statistics.median(s["rerun_seconds"] for s in samples) * 1000,
+            "process_ms": statistics.median(s["process_seconds"] for s in samples) * 1000,
+            "page_ms": {
+                page: statistics.median(s["page_seconds"][page] for s in samples) * 1000
+                for page in samples[-1]["page_seconds"]
+            },
+            "loaded_modules": samples[-1]["loaded_modules"],
+            "exceptions": samples[-1]["exceptions"],
+            "samples": samples,
+        }
+    return results
+
+
+def parse_budgets(values):
+    """--budget-ms 画面=ミリ秒 の指定を辞書に変換"""
+    budgets = {}
+    for value in values or []:
+        screen, _, ms = value.partition("=")
+        budgets[screen] = float(ms)
+    return budgets
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="app.py の初回描画までの時間を計測します")
+    parser.add_argument("--screen", action="append", choices=sorted(SCREENS), default=None,
+                        help="計測する画面 (複数指定可、省略時は全画面)")
+    parser.add_argument("--repeat", type=int, default=3, help="画面ごとのコールドスタート回数 (中央値を採用)")
+    parser.add_argument("--output", default=None, help="結果のJSONファイル (省略時は標準出力)")
+    parser.add_argument("--budget-ms", action="append", default=None,
+                        help="初回描画時間の上限 画面=ミリ秒 (超えた場合は終了コード1)")
+    parser.add_argument("--child", default=None, help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.child:
+        _run_child(args.child)
+        return 0
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        db_path = os.path.join(tmp_dir, "startup.db")
+        _seed_database(db_path)
+        results = measure(args.screen or list(SCREENS), args.repeat, f"sqlite:///{db_path}")
+
+    report = {
+        "benchmark": "startup",
+        "python": sys.version.split()[0],
+        "repeat": args.repeat,
+        "screens": results,
+    }
+    text = json.dumps(report, ensure_ascii=False, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(text)
+    else:
+        print(text)
+
+    over = [
+        f"{screen}: {results[screen]['first_render_ms']:.0f}ms > {budget:.0f}ms"
+        for screen, budget in parse_budgets(args.budget_ms).items()
+        if screen in results and results[screen]["first_render_ms"] > budget
+    ]
+    for line in over:
+        print(f"予算超過 {line}", file=sys.stderr)
+    return 1 if over else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
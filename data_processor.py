@@ -1,17 +1,91 @@
-import sqlite3
 import pandas as pd
 import numpy as np
 import re
 import os
+import contextvars
+import threading
+import zipfile
+import hashlib
+import json
+import logging
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor
+from contextlib import contextmanager
 from datetime import datetime, timedelta
+from storage import SQLiteBackend, backend_from_env
+from read_cache import ReadCache
+from write_queue import WriteQueue
+from query_log import QueryLog
+import schema
+
+logger = logging.getLogger(__name__)
+
 
 class DataProcessor:
-    def __init__(self, db_path=None):
+    # save_grid の種別: (テーブル名, DataFrameのキー列, DBのキー列)
+    GRID_KINDS = {
+        'actual': ('actual_data', ['項目名'], ['item_name']),
+        'forecast': ('forecast_data', ['項目名'], ['item_name']),
+        'sub_account': ('sub_accounts', ['parent_item', 'sub_account_name'], ['parent_item', 'sub_account_name']),
+    }
+    
+    # YYYY-MM形式の月列
+    MONTH_COLUMN = re.compile(r'^\d{4}-\d{2}$')
+    # 共有読み込みキャッシュの既定のメモリ上限
+    READ_CACHE_MAX_BYTES = 256 * 1024 * 1024
+    
+    # 会計期データの並列読み込みのスレッド数
+    PREFETCH_WORKERS = 4
+    
+    # SQLの実行ログ: この時間 (ミリ秒) 以上かかったSQLを実行計画と共にログに出す
+    QUERY_LOG_SLOW_MS = 100.0
+    
+    # data_versions で会社・会計期マスタのバージョンに使うID (会計期IDは1から振られる)
+    MASTER_DATA_VERSION_ID = 0
+    
+    # 予測シナリオ (シナリオ×項目×月 の配列はこの順で並ぶ)
+    SCENARIOS = ["現実", "楽観", "悲観"]
+    
+    # PL表 (pl_to_frame) の月列の後の合計列
+    PL_TOTAL_COLUMNS = ["実績合計", "予測合計", "合計"]
+    
+    # KPIサマリー (kpi_summary) の項目。先頭の売上高以外は売上高に対する利益率も計算する
+    KPI_ITEMS = ["売上高", "売上総損益金額", "営業損益金額", "経常損益金額", "当期純損益金額"]
+    
+    # シナリオ増減率の初期値
+    DEFAULT_SCENARIO_RATES = {"現実": 0.0, "楽観": 0.1, "悲観": -0.1}
+    
+    # シナリオ増減率に対する感応度の初期ルール (項目名またはカテゴリ名 → 感応度)
+    # 売上: 増減率そのまま / 売上原価: 50%を逆方向 / 販管費: 30%を逆方向
+    DEFAULT_SCENARIO_RULES = {"売上高": 1.0, "売上原価": -0.5, "販売管理費": -0.3}
+
+    def __init__(self, db_path=None, backend=None, read_cache_bytes=None, query_log_slow_ms=None):
+        """
+        db_path: SQLiteファイル (省略時は financial_data.db)
+        backend: storage のバックエンド (省略時は環境変数 DATABASE_URL があればPostgreSQL、無ければSQLite)
+        read_cache_bytes: 共有読み込みキャッシュのメモリ上限 (省略時は READ_CACHE_MAX_BYTES)
+        query_log_slow_ms: 指定するとSQLの実行ログを有効にし、これ以上 (ミリ秒) かかったSQLを
+                           実行計画と共にログに出す (省略時は環境変数 QUERY_LOG_SLOW_MS、無ければ無効)
+        
+        1つのインスタンスを複数スレッド (Streamlitの全セッション) で共有できる
+        """
         if db_path is None:
             base_dir = os.path.dirname(os.path.abspath(__file__))
             self.db_path = os.path.join(base_dir, "financial_data.db")
         else:
             self.db_path = db_path
+        if backend is None:
+            backend = SQLiteBackend(self.db_path) if db_path is not None else backend_from_env(self.db_path)
+        if isinstance(backend, SQLiteBackend):
+            self.db_path = backend.db_path
+        self.backend = backend
+        
+        # SQLの実行ログ (enable_query_log で有効化)
+        self.query_log = None
+        if query_log_slow_ms is None and os.environ.get('QUERY_LOG_SLOW_MS'):
+            query_log_slow_ms = float(os.environ['QUERY_LOG_SLOW_MS'])
+        if query_log_slow_ms is not None:
+            self.enable_query_log(query_log_slow_ms)
+        
         self._init_db()
         
         # 標準的な勘定科目リスト (要件定義書の3.1に準拠)
@@ -111,127 +185,121 @@ class DataProcessor:
             "特別損失合計": ["特別損失", "特別損失合計"],
             "法人税、住民税及び事業税": ["法人税", "法人税等", "法人税、住民税及び事業税"]
         }
+        
+        # PL計算用: 項目→行番号と集計行列
+        self.item_index = {item: i for i, item in enumerate(self.all_items)}
+        self._pl_matrix = self._build_pl_matrix()
+        self._pl_matrix.flags.writeable = False
+        self._kpi_rows = np.array([self.item_index[item] for item in self.KPI_ITEMS])
+        
+        # 要約表示する項目
+        summary_items = ["売上高", "売上総損益金額", "販売管理費計", "営業損益金額", "経常損益金額", "当期純損益金額"]
+        self._pl_types = np.array(['要約' if x in summary_items else '詳細' for x in self.all_items], dtype=object)
+        # pl_to_frame の文字列列 (呼び出しごとに文字列型へ変換しないよう1回だけ作成)
+        self._pl_item_column = pd.array(self.all_items, dtype='str')
+        self._pl_type_column = pd.array(self._pl_types, dtype='str')
+        
+        # シナリオルールで指定できるカテゴリ
+        self.item_categories = {"販売管理費": self.ga_items}
+        
+        # 弥生会計Excelの解析 (インポート結果のキャッシュはDBと同じディレクトリに保存)
+        self.yayoi_parser = YayoiParser(
+            self.all_items, self.item_mapping,
+            os.path.join(os.path.dirname(os.path.abspath(self.db_path)), "import_cache"),
+        )
+        
+        # 会計期ごとのシナリオ係数キャッシュ {fiscal_period_id: (ルールversion, 係数配列)}
+        self._coefficient_cache = {}
+        
+        # インクリメンタルPL評価用: 会計期ごとの前回計算結果と、このプロセスの書き込みで変更されたセル
+        # {fiscal_period_id: {書き込み後のデータバージョン: {(項目名, 月), ...}}}
+        self._pl_memo = {}
+        self._pl_lock = threading.Lock()
+        self._dirty_cells = {}
+        self._dirty_lock = threading.Lock()
+        
+        # セッション間で共有する読み込みキャッシュ (会計期×データバージョンごとに1部だけ保持)
+        self.read_cache = ReadCache(read_cache_bytes or self.READ_CACHE_MAX_BYTES)
+        
+        # 書き込みはすべて専用スレッドのキューを通し、まとめてコミットする
+        self.writer = WriteQueue(self.backend)
+        
+        # 会計期データの並列読み込み用 (表示中の会計期) と、前後の会計期の先読み用 (1スレッド)
+        self._prefetch_pool = ThreadPoolExecutor(max_workers=self.PREFETCH_WORKERS, thread_name_prefix="prefetch")
+        self._warm_pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix="warm")
+
+    @property
+    def use_postgres(self):
+        """サーバー型データベース (PostgreSQL / Supabase) を使用しているか"""
+        return self.backend.is_server
+
+    @contextmanager
+    def _connection(self):
+        """バックエンドの接続プールから接続を取得"""
+        with self.backend.connection() as conn:
+            yield conn
+
+    def close(self):
+        """書き込みキューを空にしてから、プール内の接続をすべて閉じる"""
+        self._warm_pool.shutdown(wait=True, cancel_futures=True)
+        self._prefetch_pool.shutdown(wait=True)
+        self.writer.close()
+        self.backend.close()
+
+    def enable_query_log(self, slow_ms=None, max_entries=5000):
+        """
+        SQLの実行ログを有効にして QueryLog を返す (2回目以降は同じ QueryLog の閾値を変更して再開)
+        
+        実行したSQLごとに文・パラメータの指紋・行数・時間を記録し、slow_ms (省略時は QUERY_LOG_SLOW_MS)
+        以上かかったSQLは実行計画と共にログ (query_log ロガーの WARNING) に出す。集計は query_log.summary() で取得する
+        """
+        if self.query_log is None:
+            self.query_log = QueryLog(self.backend, max_entries=max_entries)
+        self.query_log.slow_ms = self.QUERY_LOG_SLOW_MS if slow_ms is None else slow_ms
+        if self.query_log not in self.backend.query_listeners:
+            self.backend.add_query_listener(self.query_log)
+        return self.query_log
+
+    def disable_query_log(self):
+        """SQLの実行ログを無効にする (記録済みの内容は query_log に残る)"""
+        if self.query_log is not None:
+            self.backend.remove_query_listener(self.query_log)
+
+    def submit_write(self, job, after_commit=None):
+        """
+        書き込みジョブ job(conn) を書き込みキューに追加して Future を返す
+        
+        job は conn 上で書き込むだけでコミットしない。Future はコミット完了後に job の戻り値
+        (after_commit を指定した場合はその呼び出し後) で完了し、失敗時は例外が設定される
+        """
+        return self.writer.submit(job, after_commit)
+
+    def _write(self, job, after_commit=None):
+        """書き込みキュー経由で実行し、コミット完了まで待って job の戻り値を返す"""
+        return self.writer.run(job, after_commit)
 
     def _init_db(self):
-        """データベーステーブルの初期化 (要件定義書の2.3に準拠)"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        
-        # 2.3.1 会社マスタ
-        cursor.execute('''
-        CREATE TABLE IF NOT EXISTS companies (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            name TEXT NOT NULL UNIQUE,
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-        )
-        ''')
-        
-        cursor.execute('CREATE INDEX IF NOT EXISTS idx_name ON companies(name)')
-        
-        # 2.3.2 会計期マスタ
-        cursor.execute('''
-        CREATE TABLE IF NOT EXISTS fiscal_periods (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            comp_id INTEGER NOT NULL,
-            period_num INTEGER NOT NULL,
-            start_date TEXT NOT NULL,
-            end_date TEXT NOT NULL,
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            FOREIGN KEY (comp_id) REFERENCES companies (id),
-            UNIQUE(comp_id, period_num),
-            CHECK (start_date < end_date)
-        )
-        ''')
-        
-        cursor.execute('CREATE INDEX IF NOT EXISTS idx_comp_period ON fiscal_periods(comp_id, period_num)')
-        
-        # 2.3.3 実績データ
-        cursor.execute('''
-        CREATE TABLE IF NOT EXISTS actual_data (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            fiscal_period_id INTEGER NOT NULL,
-            item_name TEXT NOT NULL,
-            month TEXT NOT NULL,
-            amount REAL NOT NULL DEFAULT 0,
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            FOREIGN KEY (fiscal_period_id) REFERENCES fiscal_periods (id),
-            UNIQUE(fiscal_period_id, item_name, month)
-        )
-        ''')
-        
-        cursor.execute('CREATE INDEX IF NOT EXISTS idx_period_item ON actual_data(fiscal_period_id, item_name)')
-        
-        # 2.3.4 予測データ
-        cursor.execute('''
-        CREATE TABLE IF NOT EXISTS forecast_data (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            fiscal_period_id INTEGER NOT NULL,
-            scenario TEXT NOT NULL,
-            item_name TEXT NOT NULL,
-            month TEXT NOT NULL,
-            amount REAL NOT NULL DEFAULT 0,
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            FOREIGN KEY (fiscal_period_id) REFERENCES fiscal_periods (id),
-            UNIQUE(fiscal_period_id, scenario, item_name, month),
-            CHECK (scenario IN ('現実', '楽観', '悲観'))
-        )
-        ''')
-        
-        cursor.execute('CREATE INDEX IF NOT EXISTS idx_period_scenario ON forecast_data(fiscal_period_id, scenario)')
-        
-        # 2.3.5 補助科目
-        cursor.execute('''
-        CREATE TABLE IF NOT EXISTS sub_accounts (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            fiscal_period_id INTEGER NOT NULL,
-            scenario TEXT NOT NULL,
-            parent_item TEXT NOT NULL,
-            sub_account_name TEXT NOT NULL,
-            month TEXT NOT NULL,
-            amount REAL NOT NULL DEFAULT 0,
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            FOREIGN KEY (fiscal_period_id) REFERENCES fiscal_periods(id),
-            UNIQUE(fiscal_period_id, scenario, parent_item, sub_account_name, month)
-        )
-        ''')
-        
-        cursor.execute('CREATE INDEX IF NOT EXISTS idx_period_parent ON sub_accounts(fiscal_period_id, parent_item)')
-        
-        # 2.3.6 勘定科目属性
-        cursor.execute('''
-        CREATE TABLE IF NOT EXISTS item_attributes (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            fiscal_period_id INTEGER NOT NULL,
-            item_name TEXT NOT NULL,
-            is_variable INTEGER DEFAULT 0,
-            variable_rate REAL DEFAULT 0.0,
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            FOREIGN KEY (fiscal_period_id) REFERENCES fiscal_periods(id),
-            UNIQUE(fiscal_period_id, item_name),
-            CHECK (is_variable IN (0, 1)),
-            CHECK (variable_rate >= 0 AND variable_rate <= 1)
-        )
-        ''')
+        """
+        データベースのスキーマを最新にする (要件定義書の2.3に準拠)
         
-        conn.commit()
-        conn.close()
+        スキーマが最新ならバージョンを1回読むだけで、テーブル作成などのDDLは実行しない (schema.migrate)
+        適用したマイグレーションはロガー data_processor に INFO で記録する (何も変更しなかったものは記録しない)
+        """
+        for version, name, changes in schema.migrate(self.backend):
+            if changes is None:
+                logger.info("データベースを更新しました (スキーマ %d: %s)", version, name)
+            elif changes:
+                logger.info("データベースを更新しました (スキーマ %d: %s): %s", version, name, "、".join(changes))
     
     def _sort_months(self, df, fiscal_period_id):
         """会計期の開始月を考慮して月をソート"""
         try:
             # 会計期情報を取得
-            conn = sqlite3.connect(self.db_path)
-            cursor = conn.cursor()
-            cursor.execute(
-                "SELECT start_date, end_date FROM fiscal_periods WHERE id = ?",
-                (fiscal_period_id,)
-            )
-            result = cursor.fetchone()
-            conn.close()
+            with self._connection() as conn:
+                result = conn.execute(
+                    "SELECT start_date, end_date FROM fiscal_periods WHERE id = ?",
+                    (fiscal_period_id,)
+                ).fetchone()
             
             if not result:
                 return df
@@ -250,56 +318,63 @@ class DataProcessor:
 
     def get_companies(self):
         """会社一覧を取得"""
-        conn = sqlite3.connect(self.db_path)
-        df = pd.read_sql_query("SELECT * FROM companies ORDER BY name", conn)
-        conn.close()
-        return df
+        with self._connection() as conn:
+            return self.backend.read_frame("SELECT * FROM companies ORDER BY name", conn)
 
     def add_company(self, company_name):
         """会社を追加"""
+        def job(conn):
+            conn.execute("INSERT INTO companies (name) VALUES (?)", (company_name,))
+            self._bump_data_version(conn, self.MASTER_DATA_VERSION_ID)
+        
         try:
-            conn = sqlite3.connect(self.db_path)
-            cursor = conn.cursor()
-            cursor.execute("INSERT INTO companies (name) VALUES (?)", (company_name,))
-            conn.commit()
-            conn.close()
+            self._write(job)
             return True
         except:
             return False
 
     def get_company_periods(self, comp_id):
         """指定会社の会計期一覧を取得"""
-        conn = sqlite3.connect(self.db_path)
-        df = pd.read_sql_query(
-            "SELECT * FROM fiscal_periods WHERE comp_id = ? ORDER BY period_num DESC",
-            conn,
-            params=(comp_id,)
-        )
-        conn.close()
-        return df
+        with self._connection() as conn:
+            return self.backend.read_frame(
+                "SELECT * FROM fiscal_periods WHERE comp_id = ? ORDER BY period_num DESC",
+                conn,
+                params=(comp_id,)
+            )
 
     def add_fiscal_period(self, comp_id, period_num, start_date, end_date):
         """会計期を追加"""
-        try:
-            conn = sqlite3.connect(self.db_path)
-            cursor = conn.cursor()
-            cursor.execute(
+        def job(conn):
+            conn.execute(
                 "INSERT INTO fiscal_periods (comp_id, period_num, start_date, end_date) VALUES (?, ?, ?, ?)",
                 (comp_id, period_num, start_date, end_date)
             )
-            conn.commit()
-            conn.close()
+            self._bump_data_version(conn, self.MASTER_DATA_VERSION_ID)
+        
+        try:
+            self._write(job)
             return True
         except:
             return False
 
+    def list_fiscal_periods(self):
+        """全会社の会計期一覧 (会計期ID, 会社ID, 会社名, 期数, 開始日, 終了日) を1回のクエリで取得"""
+        with self._connection() as conn:
+            return self.backend.read_frame(
+                """
+                SELECT f.id AS fiscal_period_id, c.id AS comp_id, c.name AS company_name,
+                       f.period_num, f.start_date, f.end_date
+                FROM fiscal_periods f
+                JOIN companies c ON c.id = f.comp_id
+                ORDER BY c.name, f.period_num
+                """,
+                conn
+            )
+
     def get_period_info(self, period_id):
         """会計期情報を取得"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        cursor.execute("SELECT * FROM fiscal_periods WHERE id = ?", (period_id,))
-        row = cursor.fetchone()
-        conn.close()
+        with self._connection() as conn:
+            row = conn.execute("SELECT * FROM fiscal_periods WHERE id = ?", (period_id,)).fetchone()
         if row:
             return {
                 "id": row[0],
@@ -312,11 +387,8 @@ class DataProcessor:
 
     def get_company_id_from_period_id(self, fiscal_period_id):
         """会計期IDから会社IDを取得"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        cursor.execute("SELECT comp_id FROM fiscal_periods WHERE id = ?", (fiscal_period_id,))
-        result = cursor.fetchone()
-        conn.close()
+        with self._connection() as conn:
+            result = conn.execute("SELECT comp_id FROM fiscal_periods WHERE id = ?", (fiscal_period_id,)).fetchone()
         return result[0] if result else None
 
     def get_fiscal_months(self, comp_id, fiscal_period_id):
@@ -325,8 +397,13 @@ class DataProcessor:
         if not period:
             return []
         
-        start = datetime.strptime(period['start_date'], '%Y-%m-%d')
-        end = datetime.strptime(period['end_date'], '%Y-%m-%d')
+        return self.months_between(period['start_date'], period['end_date'])
+
+    @staticmethod
+    def months_between(start_date, end_date):
+        """開始日〜終了日 (YYYY-MM-DD) の月リスト (YYYY-MM) を作成"""
+        start = datetime.strptime(start_date, '%Y-%m-%d')
+        end = datetime.strptime(end_date, '%Y-%m-%d')
         
         months = []
         curr = start
@@ -346,17 +423,149 @@ class DataProcessor:
         except:
             return 0
 
+    def _bump_data_version(self, conn, fiscal_period_id):
+        """会計期のデータバージョンを加算して加算後のバージョンを返す (書き込みと同じトランザクションで呼ぶ)"""
+        conn.execute(
+            "INSERT INTO data_versions (fiscal_period_id, version) VALUES (?, 1) "
+            "ON CONFLICT(fiscal_period_id) DO UPDATE SET version = data_versions.version + 1",
+            (fiscal_period_id,)
+        )
+        return conn.execute(
+            "SELECT version FROM data_versions WHERE fiscal_period_id = ?", (fiscal_period_id,)
+        ).fetchone()[0]
+
+    def get_data_versions(self, fiscal_period_ids):
+        """複数会計期のデータバージョンを {fiscal_period_id: version} で取得 (未更新は0)"""
+        condition, params = self._period_filter(fiscal_period_ids)
+        with self._connection() as conn:
+            rows = conn.execute(
+                f"SELECT fiscal_period_id, version FROM data_versions WHERE {condition}", params
+            ).fetchall()
+        versions = {int(pid): 0 for pid in fiscal_period_ids}
+        versions.update((int(pid), int(version)) for pid, version in rows)
+        return versions
+
+    def get_data_version(self, fiscal_period_id=None):
+        """
+        会計期のデータバージョンを取得 (省略時は会社・会計期マスタ)
+        
+        実績・予測・補助科目の書き込みごとに加算されるため、キャッシュのキーに含めれば
+        有効期限なしで保持しても変更時には必ず読み直される
+        """
+        if fiscal_period_id is None:
+            fiscal_period_id = self.MASTER_DATA_VERSION_ID
+        return self.get_data_versions([fiscal_period_id])[int(fiscal_period_id)]
+
+    def get_actual_data(self, fiscal_period_id, data_version=None):
+        """
+        実績データ (load_actual_data) を共有キャッシュ経由で取得
+        
+        データバージョンが変わらない限り全セッションで同じDataFrameを返すため、呼び出し側で変更しないこと
+        data_version: 取得済みのバージョン (省略時は1クエリで確認)
+        """
+        if data_version is None:
+            data_version = self.get_data_version(fiscal_period_id)
+        return self.read_cache.get_or_load(
+            ('actual', fiscal_period_id), data_version,
+            lambda: self.load_actual_data(fiscal_period_id)
+        )
+
+    def get_forecast_data(self, fiscal_period_id, scenario, data_version=None):
+        """予測データ (load_forecast_data) を共有キャッシュ経由で取得 (get_actual_data と同様)"""
+        if data_version is None:
+            data_version = self.get_data_version(fiscal_period_id)
+        return self.read_cache.get_or_load(
+            ('forecast', fiscal_period_id, scenario), data_version,
+            lambda: self.load_forecast_data(fiscal_period_id, scenario)
+        )
+
+    def get_sub_account_totals(self, fiscal_period_id, data_version=None):
+        """補助科目合計 (load_sub_account_totals の全シナリオ分) を共有キャッシュ経由で取得"""
+        if data_version is None:
+            data_version = self.get_data_version(fiscal_period_id)
+        return self.read_cache.get_or_load(
+            ('sub_account_totals', fiscal_period_id), data_version,
+            lambda: self.load_sub_account_totals(fiscal_period_id)
+        )
+
+    def get_item_attributes(self, fiscal_period_id, data_version=None):
+        """項目属性 (load_item_attributes) を共有キャッシュ経由で取得"""
+        if data_version is None:
+            data_version = self.get_data_version(fiscal_period_id)
+        return self.read_cache.get_or_load(
+            ('item_attributes', fiscal_period_id), data_version,
+            lambda: self.load_item_attributes(fiscal_period_id)
+        )
+
+    def _period_loads(self, fiscal_period_id, data_version):
+        """会計期の表示に必要な読み込み処理 {名前: 関数} (予測はシナリオ名ごと)"""
+        loads = {
+            'months': lambda: self.get_fiscal_months(None, fiscal_period_id),
+            'actuals': lambda: self.get_actual_data(fiscal_period_id, data_version),
+            'sub_account_totals': lambda: self.get_sub_account_totals(fiscal_period_id, data_version),
+            'item_attributes': lambda: self.get_item_attributes(fiscal_period_id, data_version),
+            'coefficients': lambda: self.get_scenario_coefficients(fiscal_period_id),
+        }
+        for scenario in self.SCENARIOS:
+            loads[scenario] = lambda scenario=scenario: self.get_forecast_data(fiscal_period_id, scenario, data_version)
+        return loads
+
+    def get_period_bundle(self, fiscal_period_id, data_version=None):
+        """
+        会計期の表示に必要なデータをスレッドプールで並列に読み込み、1つの辞書にまとめて返す
+        
+        キー: fiscal_period_id, data_version, months, actuals, forecasts ({シナリオ: DataFrame}),
+              sub_account_totals, item_attributes, coefficients
+        DataFrame は共有キャッシュの値のため呼び出し側で変更しないこと
+        """
+        if data_version is None:
+            data_version = self.get_data_version(fiscal_period_id)
+        # 呼び出し元のコンテキスト (再実行ごとの計測など) を読み込みスレッドに引き継ぐ
+        futures = {
+            name: self._prefetch_pool.submit(contextvars.copy_context().run, load)
+            for name, load in self._period_loads(fiscal_period_id, data_version).items()
+        }
+        bundle = {name: future.result() for name, future in futures.items()}
+        bundle['forecasts'] = {scenario: bundle.pop(scenario) for scenario in self.SCENARIOS}
+        bundle['fiscal_period_id'] = fiscal_period_id
+        bundle['data_version'] = data_version
+        return bundle
+
+    def get_adjacent_period_ids(self, fiscal_period_id):
+        """同じ会社の前後の会計期 (期数±1) のIDリスト"""
+        with self._connection() as conn:
+            rows = conn.execute(
+                "SELECT f.id FROM fiscal_periods f "
+                "JOIN fiscal_periods cur ON cur.comp_id = f.comp_id "
+                "WHERE cur.id = ? AND f.period_num IN (cur.period_num - 1, cur.period_num + 1) "
+                "ORDER BY f.period_num DESC",
+                (fiscal_period_id,)
+            ).fetchall()
+        return [int(row[0]) for row in rows]
+
+    def warm_adjacent_periods(self, fiscal_period_id):
+        """
+        次に開かれそうな前後の会計期のデータをバックグラウンドで共有キャッシュに読み込む
+        
+        完了を待たずに対象の会計期IDリストを返す。先読みの失敗は無視する (表示時に読み直される)
+        """
+        period_ids = self.get_adjacent_period_ids(fiscal_period_id)
+        if not period_ids:
+            return []
+        versions = self.get_data_versions(period_ids)
+        for pid in period_ids:
+            for load in self._period_loads(pid, versions[pid]).values():
+                self._warm_pool.submit(load)
+        return period_ids
+
     def load_actual_data(self, fiscal_period_id):
         """実績データを読み込み"""
-        conn = sqlite3.connect(self.db_path)
-        try:
-            df = pd.read_sql_query(
+        with self._connection() as conn:
+            df = self.backend.read_frame(
                 "SELECT item_name as 項目名, month, amount FROM actual_data WHERE fiscal_period_id = ?",
                 conn,
                 params=(fiscal_period_id,)
             )
-        finally:
-            conn.close()
         
         if df.empty:
             return pd.DataFrame({'項目名': self.all_items}).fillna(0)
@@ -374,15 +583,12 @@ class DataProcessor:
 
     def load_forecast_data(self, fiscal_period_id, scenario):
         """予測データを読み込み"""
-        conn = sqlite3.connect(self.db_path)
-        try:
-            df = pd.read_sql_query(
+        with self._connection() as conn:
+            df = self.backend.read_frame(
                 "SELECT item_name as 項目名, month, amount FROM forecast_data WHERE fiscal_period_id = ? AND scenario = ?",
                 conn,
                 params=(fiscal_period_id, scenario)
             )
-        finally:
-            conn.close()
         
         if df.empty:
             return pd.DataFrame({'項目名': self.all_items}).fillna(0)
@@ -400,160 +606,402 @@ class DataProcessor:
 
     def save_actual_item(self, fiscal_period_id, item_name, values_dict):
         """実績データを保存"""
-        conn = None
-        try:
-            conn = sqlite3.connect(self.db_path)
-            cursor = conn.cursor()
-            
-            for month, amount in values_dict.items():
-                cursor.execute(
-                    "INSERT OR REPLACE INTO actual_data (fiscal_period_id, item_name, month, amount, updated_at) VALUES (?, ?, ?, ?, CURRENT_TIMESTAMP)",
-                    (fiscal_period_id, item_name, month, float(amount))
-                )
-            
-            conn.commit()
-            return True
-        except Exception as e:
-            print(f"Error saving actual data: {e}")
-            if conn:
-                conn.rollback()
-            return False
-        finally:
-            if conn:
-                conn.close()
+        success, msg = self.save_grid(fiscal_period_id, 'actual', None, self._cells_frame(['項目名'], [item_name], values_dict))
+        if not success:
+            print(f"Error saving actual data: {msg}")
+        return success
 
     def save_forecast_item(self, fiscal_period_id, scenario, item_name, values_dict):
         """予測データを保存"""
-        conn = None
+        success, msg = self.save_grid(fiscal_period_id, 'forecast', scenario, self._cells_frame(['項目名'], [item_name], values_dict))
+        if not success:
+            print(f"Error saving forecast data: {msg}")
+        return success
+
+    def save_forecast_from_excel(self, fiscal_period_id, scenario, forecast_df):
+        """予測テンプレート(項目名×月)をまとめて保存
+
+        計算項目と0/空欄のセルは保存しない
+        """
+        df = forecast_df[~forecast_df['項目名'].isin(self.calculated_items)]
+        cells = self._grid_cells(df, ['項目名'])
+        cells = cells[cells['amount'] != 0]
+        if cells.empty:
+            return False, "インポート対象のデータがありません"
+        return self.save_grid(fiscal_period_id, 'forecast', scenario, cells)
+
+    def _cells_frame(self, key_cols, key_values, values_dict):
+        """{月: 金額} を save_grid 用の縦持ちDataFrameに変換"""
+        df = pd.DataFrame({'month': list(values_dict.keys()), 'amount': list(values_dict.values())})
+        for col, val in zip(key_cols, key_values):
+            df[col] = val
+        return df
+
+    def _grid_cells(self, frame, key_cols):
+        """横持ち(キー×月列)または縦持ち(キー, month, amount)のDataFrameをセル単位の縦持ちに変換"""
+        if 'month' in frame.columns and 'amount' in frame.columns:
+            cells = frame[key_cols + ['month', 'amount']]
+        else:
+            month_cols = [c for c in frame.columns if isinstance(c, str) and self.MONTH_COLUMN.match(c)]
+            cells = frame.melt(id_vars=key_cols, value_vars=month_cols, var_name='month', value_name='amount')
+        cells = cells.assign(amount=pd.to_numeric(cells['amount'], errors='coerce'))
+        return cells.dropna(subset=['amount'])
+
+    def save_grid(self, fiscal_period_id, kind, scenario, frame):
+        """
+        項目×月のグリッドを一括UPSERT (1トランザクション、方法はバックエンドによる)
+
+        kind: 'actual' / 'forecast' / 'sub_account'
+        frame: 横持ち (キー列 + YYYY-MM列) または変更セルのみの縦持ち (キー列, month, amount)
+               キー列は actual/forecast が '項目名'、sub_account が 'parent_item', 'sub_account_name'
+        """
         try:
-            conn = sqlite3.connect(self.db_path)
-            cursor = conn.cursor()
-            
-            for month, amount in values_dict.items():
-                cursor.execute(
-                    "INSERT OR REPLACE INTO forecast_data (fiscal_period_id, scenario, item_name, month, amount, updated_at) VALUES (?, ?, ?, ?, ?, CURRENT_TIMESTAMP)",
-                    (fiscal_period_id, scenario, item_name, month, float(amount))
-                )
-            
-            conn.commit()
-            return True
+            return True, self.submit_grid(fiscal_period_id, kind, scenario, frame).result()
         except Exception as e:
-            print(f"Error saving forecast data: {e}")
-            if conn:
-                conn.rollback()
-            return False
-        finally:
-            if conn:
-                conn.close()
+            return False, str(e)
+
+    def _grid_spec(self, kind, scenario):
+        """種別を検証して (テーブル名, DataFrameのキー列, DBのキー列, シナリオ列の有無) を返す"""
+        if kind not in self.GRID_KINDS:
+            raise ValueError(f"Unknown grid kind: {kind}")
+        has_scenario = kind != 'actual'
+        if has_scenario and scenario is None:
+            raise ValueError(f"scenario is required for kind '{kind}'")
+        return self.GRID_KINDS[kind] + (has_scenario,)
+
+    def submit_grid(self, fiscal_period_id, kind, scenario, frame):
+        """
+        save_grid を書き込みキューに追加して Future を返す (コミットを待たない)
+        
+        Future の結果は保存件数のメッセージ。種別・シナリオ・キー列が不正な場合や保存に失敗した場合は
+        Future に例外が設定される (この関数自体は例外を送出しない)
+        """
+        future = Future()
+        try:
+            table, key_cols, db_cols, has_scenario = self._grid_spec(kind, scenario)
+            cells = self._grid_cells(frame, key_cols)
+        except Exception as e:
+            future.set_exception(e)
+            return future
+        if cells.empty:
+            future.set_result("保存対象のデータがありません")
+            return future
+        
+        n = len(cells)
+        columns = [np.full(n, fiscal_period_id, dtype=object)]
+        if has_scenario:
+            columns.append(np.full(n, scenario, dtype=object))
+        columns += [cells[c].astype(str).to_numpy(dtype=object) for c in key_cols]
+        columns.append(cells['month'].astype(str).to_numpy(dtype=object))
+        columns.append(cells['amount'].astype(float).to_numpy(dtype=object))
+        rows = list(zip(*columns))
+        conflict_cols = ['fiscal_period_id'] + (['scenario'] if has_scenario else []) + db_cols + ['month']
+        item_col = 'parent_item' if kind == 'sub_account' else '項目名'
+        changed = list(zip(cells[item_col].astype(str), cells['month'].astype(str)))
+        
+        written = {}
+        
+        def job(conn):
+            self.backend.upsert(conn, table, conflict_cols, ['amount'], rows)
+            written['version'] = self._bump_data_version(conn, fiscal_period_id)
+            return f"{n}件のデータを保存しました"
+        
+        return self.submit_write(
+            job, after_commit=lambda _: self._mark_dirty(fiscal_period_id, written['version'], changed)
+        )
 
     def load_sub_accounts(self, fiscal_period_id, scenario):
         """補助科目データを読み込み"""
-        conn = sqlite3.connect(self.db_path)
-        df = pd.read_sql_query(
-            "SELECT * FROM sub_accounts WHERE fiscal_period_id = ? AND scenario = ?",
-            conn,
-            params=(fiscal_period_id, scenario)
+        with self._connection() as conn:
+            return self.backend.read_frame(
+                "SELECT * FROM sub_accounts WHERE fiscal_period_id = ? AND scenario = ?",
+                conn,
+                params=(fiscal_period_id, scenario)
+            )
+
+    def load_sub_account_totals(self, fiscal_period_id, scenario=None):
+        """
+        補助科目の親項目×月の合計をDB側で集計して取得
+        
+        scenario を省略すると全シナリオ分を返す
+        戻り値の列: scenario, 項目名, month, amount (build_scenario_forecasts の overrides にそのまま渡せる)
+        """
+        sql = (
+            "SELECT scenario, parent_item AS 項目名, month, SUM(amount) AS amount "
+            "FROM sub_accounts WHERE fiscal_period_id = ?"
         )
-        conn.close()
-        return df
+        params = [fiscal_period_id]
+        if scenario is not None:
+            sql += " AND scenario = ?"
+            params.append(scenario)
+        sql += " GROUP BY scenario, parent_item, month"
+        with self._connection() as conn:
+            return self.backend.read_frame(sql, conn, params=params)
+
+    def _period_filter(self, fiscal_period_ids):
+        """fiscal_period_ids (None は全件) から WHERE 句の条件とパラメータを作成"""
+        if fiscal_period_ids is None:
+            return "1 = 1", []
+        ids = [int(pid) for pid in fiscal_period_ids]
+        return f"fiscal_period_id IN ({', '.join(['?'] * len(ids))})", ids
+
+    def load_grid_cells(self, kind, fiscal_period_ids=None, scenario=None):
+        """
+        複数会計期の実績/予測を1回のクエリで縦持ちのまま取得
+        
+        kind: 'actual' / 'forecast' (forecast は scenario 指定時はそのシナリオのみ)
+        戻り値の列: fiscal_period_id, [scenario,] 項目名, month, amount (同じセルは後の行を採用)
+        """
+        if kind not in ('actual', 'forecast'):
+            raise ValueError(f"Unknown grid kind: {kind}")
+        table = self.GRID_KINDS[kind][0]
+        condition, params = self._period_filter(fiscal_period_ids)
+        columns = "fiscal_period_id, " + ("scenario, " if kind == 'forecast' else "")
+        sql = f"SELECT {columns}item_name AS 項目名, month, amount FROM {table} WHERE {condition}"
+        if kind == 'forecast' and scenario is not None:
+            sql += " AND scenario = ?"
+            params.append(scenario)
+        with self._connection() as conn:
+            df = self.backend.read_frame(sql, conn, params=params)
+        keys = [c for c in df.columns if c != 'amount']
+        return df.drop_duplicates(subset=keys, keep='last').reset_index(drop=True)
+
+    def load_sub_account_totals_many(self, fiscal_period_ids=None):
+        """複数会計期の補助科目合計を1回のクエリで取得 (列: fiscal_period_id, scenario, 項目名, month, amount)"""
+        condition, params = self._period_filter(fiscal_period_ids)
+        sql = (
+            "SELECT fiscal_period_id, scenario, parent_item AS 項目名, month, SUM(amount) AS amount "
+            f"FROM sub_accounts WHERE {condition} GROUP BY fiscal_period_id, scenario, parent_item, month"
+        )
+        with self._connection() as conn:
+            return self.backend.read_frame(sql, conn, params=params)
+
+    def load_item_attributes(self, fiscal_period_id):
+        """項目属性 (変動費区分・変動費率) を読み込み (列: 項目名, is_variable, variable_rate)"""
+        with self._connection() as conn:
+            return self.backend.read_frame(
+                "SELECT item_name AS 項目名, is_variable, variable_rate FROM item_attributes WHERE fiscal_period_id = ?",
+                conn,
+                params=(fiscal_period_id,)
+            )
 
     def get_sub_accounts_for_parent(self, fiscal_period_id, scenario, parent_item):
         """特定親項目の補助科目を取得"""
-        conn = sqlite3.connect(self.db_path)
-        df = pd.read_sql_query(
-            "SELECT * FROM sub_accounts WHERE fiscal_period_id = ? AND scenario = ? AND parent_item = ?",
-            conn,
-            params=(fiscal_period_id, scenario, parent_item)
-        )
-        conn.close()
-        return df
+        with self._connection() as conn:
+            return self.backend.read_frame(
+                "SELECT * FROM sub_accounts WHERE fiscal_period_id = ? AND scenario = ? AND parent_item = ?",
+                conn,
+                params=(fiscal_period_id, scenario, parent_item)
+            )
 
     def save_sub_account(self, fiscal_period_id, scenario, parent_item, sub_account_name, values_dict):
         """補助科目を保存"""
-        try:
-            conn = sqlite3.connect(self.db_path)
-            cursor = conn.cursor()
-            
-            for month, amount in values_dict.items():
-                cursor.execute(
-                    "INSERT OR REPLACE INTO sub_accounts (fiscal_period_id, scenario, parent_item, sub_account_name, month, amount, updated_at) VALUES (?, ?, ?, ?, ?, ?, CURRENT_TIMESTAMP)",
-                    (fiscal_period_id, scenario, parent_item, sub_account_name, month, float(amount))
-                )
-            
-            conn.commit()
-            conn.close()
-            return True
-        except Exception as e:
-            print(f"Error saving sub account: {e}")
-            return False
+        success, msg = self.save_grid(
+            fiscal_period_id, 'sub_account', scenario,
+            self._cells_frame(['parent_item', 'sub_account_name'], [parent_item, sub_account_name], values_dict)
+        )
+        if not success:
+            print(f"Error saving sub account: {msg}")
+        return success
 
     def delete_sub_account(self, fiscal_period_id, scenario, parent_item, sub_account_name):
         """補助科目を削除"""
-        try:
-            conn = sqlite3.connect(self.db_path)
-            cursor = conn.cursor()
-            cursor.execute(
+        def job(conn):
+            conn.execute(
                 "DELETE FROM sub_accounts WHERE fiscal_period_id = ? AND scenario = ? AND parent_item = ? AND sub_account_name = ?",
                 (fiscal_period_id, scenario, parent_item, sub_account_name)
             )
-            conn.commit()
-            conn.close()
+            return self._bump_data_version(conn, fiscal_period_id)
+        
+        try:
+            self._write(
+                job, after_commit=lambda version: self._mark_dirty(fiscal_period_id, version, [(parent_item, None)])
+            )
             return True
         except:
             return False
 
     def calculate_growth_forecast(self, actuals_df, item_name, split_index, months):
         """成長率ベースの予測計算 (要件定義書の5.5.2に準拠)"""
-        forecast_values = {}
+        forecasts = self.calculate_growth_forecasts(actuals_df, split_index, months, items=[item_name])
+        return forecasts.iloc[0, 1:].astype(float).to_dict()
+
+    def calculate_growth_forecasts(self, actuals_df, split_index, months, items=None,
+                                   fiscal_period_id=None, scenario=None):
+        """
+        成長率ベースの予測を全項目まとめて計算 (要件定義書の5.5.2に準拠)
+        
+        - 前月比成長率の平均で予測 (前月が0の月は成長率を計算しない)
+        - ±100%以上の変動は異常値として除外
+        - 最終実績が0の項目は平均成長率を毎月加算
+        - 実績が2ヶ月未満の場合は前月踏襲
         
+        items を省略した場合は計算項目以外の全項目を対象とする。
+        fiscal_period_id と scenario を指定すると、結果を1トランザクションで予測データに保存する。
+        戻り値: 項目名 + 予測月 のDataFrame。
+                保存する場合は (DataFrame, 成功フラグ, メッセージ) (成功フラグとメッセージは save_grid と同じ)
+        """
+        if items is None:
+            items = [item for item in self.all_items if item not in self.calculated_items]
         actual_months = months[:split_index]
         forecast_months = months[split_index:]
         
-        if len(actual_months) < 2:
-            # 実績が2ヶ月未満の場合は前月踏襲
-            if len(actual_months) == 1:
-                last_value = actuals_df[actuals_df['項目名'] == item_name][actual_months[0]].iloc[0]
-            else:
-                last_value = 0
-            
-            for m in forecast_months:
-                forecast_values[m] = last_value
-            
-            return forecast_values
+        rows = [self.item_index[item] for item in items]
+        actual = self.frame_to_matrix(actuals_df, actual_months)[rows]
         
-        # 前月比成長率の平均を計算
-        item_row = actuals_df[actuals_df['項目名'] == item_name]
-        actual_values = [item_row[m].iloc[0] for m in actual_months]
+        # 前月比成長率の平均を計算 (全項目を一括)
+        prev = actual[:, :-1]
+        curr = actual[:, 1:]
+        with np.errstate(divide='ignore', invalid='ignore'):
+            rates = (curr - prev) / np.abs(prev)
+        valid = (prev != 0) & (np.abs(rates) < 1.0)
+        count = valid.sum(axis=1)
+        total = np.where(valid, rates, 0.0).sum(axis=1)
+        avg_growth_rate = np.divide(total, count, out=np.zeros(len(rows)), where=count > 0)
         
-        growth_rates = []
-        for i in range(1, len(actual_values)):
-            if actual_values[i-1] != 0:
-                rate = (actual_values[i] - actual_values[i-1]) / abs(actual_values[i-1])
-                growth_rates.append(rate)
+        # 予測値の生成
+        last_actual_value = actual[:, -1] if actual_months else np.zeros(len(rows))
+        steps = np.arange(1, len(forecast_months) + 1)
+        compounded = last_actual_value[:, None] * (1 + avg_growth_rate[:, None]) ** steps
+        additive = avg_growth_rate[:, None] * steps
+        values = np.where(last_actual_value[:, None] != 0, compounded, additive)
         
-        if len(growth_rates) == 0:
-            avg_growth_rate = 0
-        else:
-            # 異常値を除外 (±100%以上の変動は除外)
-            filtered_rates = [r for r in growth_rates if abs(r) < 1.0]
-            if len(filtered_rates) > 0:
-                avg_growth_rate = np.mean(filtered_rates)
-            else:
-                avg_growth_rate = 0
+        result = pd.DataFrame(values, columns=forecast_months)
+        result.insert(0, '項目名', items)
         
-        # 予測値の生成
-        last_actual_value = actual_values[-1]
-        current_forecast_value = last_actual_value
+        if fiscal_period_id is not None and scenario is not None:
+            success, msg = self.save_grid(fiscal_period_id, 'forecast', scenario, result)
+            return result, success, msg
         
-        for m in forecast_months:
-            if last_actual_value != 0:
-                current_forecast_value *= (1 + avg_growth_rate)
-            else:
-                current_forecast_value += avg_growth_rate
-                
-            forecast_values[m] = current_forecast_value
-            
-        return forecast_values
+        return result
+
+    def _build_pl_matrix(self):
+        """
+        計算項目を入力項目の線形結合として表す集計行列を作成
+        
+        入力項目の行は単位行列、計算項目の行は各入力項目の係数 (+1/-1) を持つため、
+        PL = 集計行列 @ 入力行列 の1回の行列積で全ての小計が求まる
+        """
+        n = len(self.all_items)
+        
+        def vec(plus=(), minus=()):
+            v = np.zeros(n)
+            for item in plus:
+                v[self.item_index[item]] += 1.0
+            for item in minus:
+                v[self.item_index[item]] -= 1.0
+            return v
+        
+        gp = vec(["売上高"], ["売上原価"])
+        ga_total = vec(self.ga_items)
+        op = gp - ga_total
+        ord_p = op + vec(["営業外収益合計"], ["営業外費用合計"])
+        pre_tax = ord_p + vec(["特別利益合計"], ["特別損失合計"])
+        net_p = pre_tax - vec(["法人税、住民税及び事業税"])
+        
+        matrix = np.eye(n)
+        for item, row in [
+            ("売上総損益金額", gp),
+            ("販売管理費計", ga_total),
+            ("営業損益金額", op),
+            ("経常損益金額", ord_p),
+            ("税引前当期純損益金額", pre_tax),
+            ("当期純損益金額", net_p),
+        ]:
+            matrix[self.item_index[item]] = row
+        return matrix
+
+    def frame_to_matrix(self, df, months, items=None):
+        """
+        項目名×月のDataFrameを all_items 順 (items 指定時はその順) の float64 行列 (項目×月) に変換
+        
+        横持ち (項目名 + 月列) と縦持ち (項目名, month, amount) のどちらも受け付ける
+        """
+        if items is None:
+            items = self.all_items
+        matrix = np.zeros((len(items), len(months)))
+        if df is None or df.empty or '項目名' not in df.columns:
+            return matrix
+        
+        # 縦持ち (項目名, month, amount) の場合はセルを直接書き込む
+        if 'month' in df.columns and 'amount' in df.columns:
+            item_pos = {name: i for i, name in enumerate(items)}
+            month_pos = {m: i for i, m in enumerate(months)}
+            r_idx = df['項目名'].map(item_pos)
+            c_idx = df['month'].map(month_pos)
+            valid = (r_idx.notna() & c_idx.notna()).to_numpy()
+            amounts = pd.to_numeric(df['amount'], errors='coerce').to_numpy(dtype=float)[valid]
+            matrix[r_idx[valid].to_numpy(dtype=int), c_idx[valid].to_numpy(dtype=int)] = np.nan_to_num(amounts)
+            return matrix
+        
+        # pandasのIndex検索はこの規模では遅いため、辞書で位置を引く
+        # (DataFrameからの取り出しは to_numpy の1回だけにし、項目名もその配列から読む)
+        table = df.to_numpy()
+        col_pos = {c: i for i, c in enumerate(df.columns)}
+        item_pos = {name: i for i, name in enumerate(table[:, col_pos['項目名']].tolist())}
+        rows = np.array([item_pos.get(item, -1) for item in items], dtype=int)
+        cols = np.array([col_pos.get(m, -1) for m in months], dtype=int)
+        found_rows = rows >= 0
+        found_cols = cols >= 0
+        if found_rows.any() and found_cols.any():
+            values = table[np.ix_(rows[found_rows], cols[found_cols])]
+            try:
+                values = values.astype(float)
+            except (TypeError, ValueError):
+                values = pd.to_numeric(values.ravel(), errors='coerce').reshape(values.shape).astype(float)
+            matrix[np.ix_(found_rows, found_cols)] = np.nan_to_num(values)
+        return matrix
+
+    def matrix_to_frame(self, matrix, months):
+        """項目×月の行列を 項目名 + 月列 のDataFrameに変換"""
+        df = pd.DataFrame(matrix, columns=months)
+        df.insert(0, '項目名', self.all_items)
+        return df
+
+    def calculate_pl_matrix(self, actual_matrix, forecast_matrix, split_index):
+        """
+        行列形式でPLを計算
+        
+        actual_matrix / forecast_matrix: (..., 項目, 月) の配列。先頭の次元(シナリオ等)はまとめて計算される
+        戻り値: 同じ形状のPL配列 (計算項目の行は再計算済み)
+        """
+        actual_matrix = np.asarray(actual_matrix, dtype=float)
+        forecast_matrix = np.asarray(forecast_matrix, dtype=float)
+        is_actual = np.arange(actual_matrix.shape[-1]) < split_index
+        base = np.where(is_actual, actual_matrix, forecast_matrix)
+        return np.matmul(self._pl_matrix, base)
+
+    def pl_item_types(self):
+        """PL表のタイプ列 ('要約' / '詳細') を all_items と同じ順のリストで返す"""
+        return self._pl_types.tolist()
+
+    def pl_aggregation_matrix(self):
+        """
+        PL = 集計行列 @ 入力行列 の集計行列 (項目×項目、読み取り専用)
+        
+        DataProcessor を作らない計算処理 (batch_report のワーカーなど) に渡すためのもの
+        """
+        return self._pl_matrix
+
+    def pl_to_frame(self, pl_matrix, split_index, months):
+        """
+        PL行列を表示用DataFrameに変換
+        
+        月列と合計3列は1つの配列 (列×項目) にまとめて計算し、各行をそのまま列にする。
+        項目名・タイプの文字列列は作成済みのもの (_pl_item_column / _pl_type_column) を使い回す
+        """
+        n_months = len(months)
+        columns = np.empty((n_months + 3, pl_matrix.shape[0]))
+        columns[:n_months] = pl_matrix.T
+        np.sum(pl_matrix[:, :split_index], axis=1, out=columns[n_months])
+        np.sum(pl_matrix[:, split_index:], axis=1, out=columns[n_months + 1])
+        np.add(columns[n_months], columns[n_months + 1], out=columns[n_months + 2])
+        
+        data = {'項目名': self._pl_item_column}
+        data.update(zip(months, columns))
+        data.update(zip(self.PL_TOTAL_COLUMNS, columns[n_months:]))
+        data['タイプ'] = self._pl_type_column
+        return pd.DataFrame(data)
 
     def calculate_pl(self, actuals_df, forecasts_df, split_index, months):
         """
@@ -566,186 +1014,427 @@ class DataProcessor:
         - 経常損益金額 = 営業損益金額 + 営業外収益合計 - 営業外費用合計
         - 税引前当期純損益金額 = 経常損益金額 + 特別利益合計 - 特別損失合計
         - 当期純損益金額 = 税引前当期純損益金額 - 法人税、住民税及び事業税
+        
+        実績・予測を項目×月の行列に変換し、集計行列との行列積で一括計算する。
+        DataFrameは表示用に最後に1回だけ作成する。
+        """
+        pl = self.calculate_pl_matrix(
+            self.frame_to_matrix(actuals_df, months),
+            self.frame_to_matrix(forecasts_df, months),
+            split_index
+        )
+        return self.pl_to_frame(pl, split_index, months)
+
+    def compile_scenario_rules(self, rules):
         """
-        df = pd.DataFrame({'項目名': self.all_items})
+        感応度ルールを項目ごとの感応度ベクトルに変換
         
-        # 実績と予測の結合
-        for i, m in enumerate(months):
-            if i < split_index:
-                # 実績
-                if m in actuals_df.columns:
-                    df[m] = df['項目名'].map(actuals_df.set_index('項目名')[m])
-                else:
-                    df[m] = 0.0
-            else:
-                # 予測
-                if m in forecasts_df.columns:
-                    df[m] = df['項目名'].map(forecasts_df.set_index('項目名')[m])
-                else:
-                    df[m] = 0.0
-        
-        df = df.fillna(0)
-        
-        # 計算項目の算出
-        def get_val(item_name):
-            row = df[df['項目名'] == item_name]
-            if not row.empty:
-                return row[months].iloc[0]
-            return pd.Series(0.0, index=months)
-
-        # 売上総損益金額 = 売上高 - 売上原価
-        sales = get_val("売上高")
-        cogs = get_val("売上原価")
-        gp = sales - cogs
-        df.loc[df['項目名'] == "売上総損益金額", months] = gp.values
-        
-        # 販売管理費計 = 33項目の合計
-        ga_total = pd.Series(0.0, index=months)
-        for item in self.ga_items:
-            ga_total += get_val(item)
-        df.loc[df['項目名'] == "販売管理費計", months] = ga_total.values
-        
-        # 営業損益金額 = 売上総損益金額 - 販売管理費計
-        op = gp - ga_total
-        df.loc[df['項目名'] == "営業損益金額", months] = op.values
-        
-        # 経常損益金額 = 営業損益金額 + 営業外収益合計 - 営業外費用合計
-        non_op_inc = get_val("営業外収益合計")
-        non_op_exp = get_val("営業外費用合計")
-        ord_p = op + non_op_inc - non_op_exp
-        df.loc[df['項目名'] == "経常損益金額", months] = ord_p.values
-        
-        # 税引前当期純損益金額 = 経常損益金額 + 特別利益合計 - 特別損失合計
-        sp_inc = get_val("特別利益合計")
-        sp_exp = get_val("特別損失合計")
-        pre_tax = ord_p + sp_inc - sp_exp
-        df.loc[df['項目名'] == "税引前当期純損益金額", months] = pre_tax.values
-        
-        # 当期純損益金額 = 税引前当期純損益金額 - 法人税、住民税及び事業税
-        tax = get_val("法人税、住民税及び事業税")
-        net_p = pre_tax - tax
-        df.loc[df['項目名'] == "当期純損益金額", months] = net_p.values
-        
-        # 合計列の追加
-        df['実績合計'] = df[months[:split_index]].sum(axis=1)
-        df['予測合計'] = df[months[split_index:]].sum(axis=1)
-        df['合計'] = df['実績合計'] + df['予測合計']
-        
-        # タイプ（要約/詳細）の付与
-        summary_items = ["売上高", "売上総損益金額", "販売管理費計", "営業損益金額", "経常損益金額", "当期純損益金額"]
-        df['タイプ'] = df['項目名'].apply(lambda x: '要約' if x in summary_items else '詳細')
+        rules: {項目名またはカテゴリ名: 感応度}
+        カテゴリのルールを先に適用し、項目のルールで上書きする
+        """
+        elasticity = np.zeros(len(self.all_items))
+        for target, value in rules.items():
+            if target in self.item_categories:
+                elasticity[[self.item_index[item] for item in self.item_categories[target]]] = value
+        for target, value in rules.items():
+            if target in self.item_index:
+                elasticity[self.item_index[target]] = value
+        return elasticity
+
+    def scenario_coefficients(self, rates, rules=None):
+        """
+        シナリオ×項目の予測係数を作成
         
-        return df
+        rates: {シナリオ名: 増減率} (未指定のシナリオは0)
+        rules: {項目名またはカテゴリ名: 感応度} (省略時は DEFAULT_SCENARIO_RULES)
+        係数 = 1 + 増減率 × 項目の感応度
+        """
+        elasticity = self.compile_scenario_rules(self.DEFAULT_SCENARIO_RULES if rules is None else rules)
+        rate_vec = np.array([rates.get(s, 0.0) for s in self.SCENARIOS], dtype=float)
+        return 1.0 + rate_vec[:, None] * elasticity[None, :]
+
+    def _scenario_rule_version(self, conn, fiscal_period_id):
+        row = conn.execute(
+            "SELECT version FROM scenario_rule_versions WHERE fiscal_period_id = ?",
+            (fiscal_period_id,)
+        ).fetchone()
+        return row[0] if row else 0
 
-    def import_yayoi_excel(self, file_path, preview_only=False):
+    def _bump_scenario_rule_version(self, conn, fiscal_period_id):
+        conn.execute(
+            "INSERT INTO scenario_rule_versions (fiscal_period_id, version) VALUES (?, 1) "
+            "ON CONFLICT(fiscal_period_id) DO UPDATE SET version = scenario_rule_versions.version + 1",
+            (fiscal_period_id,)
+        )
+
+    def get_scenario_rates(self, fiscal_period_id):
+        """会計期のシナリオ増減率を取得 (未設定のシナリオは初期値)"""
+        with self._connection() as conn:
+            rows = conn.execute(
+                "SELECT scenario, rate FROM scenario_rates WHERE fiscal_period_id = ?",
+                (fiscal_period_id,)
+            ).fetchall()
+        rates = dict(self.DEFAULT_SCENARIO_RATES)
+        rates.update(dict(rows))
+        return rates
+
+    def save_scenario_rate(self, fiscal_period_id, scenario, rate):
+        """シナリオ増減率を保存"""
+        def job(conn):
+            conn.execute(
+                "INSERT INTO scenario_rates (fiscal_period_id, scenario, rate, updated_at) VALUES (?, ?, ?, CURRENT_TIMESTAMP) "
+                "ON CONFLICT(fiscal_period_id, scenario) DO UPDATE SET rate = excluded.rate, updated_at = CURRENT_TIMESTAMP",
+                (fiscal_period_id, scenario, float(rate))
+            )
+            self._bump_scenario_rule_version(conn, fiscal_period_id)
+        
+        try:
+            self._write(job)
+            return True, f"{scenario}シナリオの増減率を保存しました"
+        except Exception as e:
+            return False, str(e)
+
+    def get_scenario_rules(self, fiscal_period_id):
+        """会計期の感応度ルールを取得 (保存済みのルールで初期ルールを上書き)"""
+        with self._connection() as conn:
+            rows = conn.execute(
+                "SELECT target, elasticity FROM scenario_rules WHERE fiscal_period_id = ?",
+                (fiscal_period_id,)
+            ).fetchall()
+        rules = dict(self.DEFAULT_SCENARIO_RULES)
+        rules.update(dict(rows))
+        return rules
+
+    def save_scenario_rules(self, fiscal_period_id, rules):
         """
-        弥生会計Excelからデータをインポート
-        preview_only=True の場合はプレビュー用のDataFrameを返す
+        感応度ルールを保存 (会計期のルールを丸ごと置き換え)
+        
+        rules: {項目名またはカテゴリ名: 感応度}
         """
+        unknown = [t for t in rules if t not in self.item_index and t not in self.item_categories]
+        if unknown:
+            return False, f"不明な項目またはカテゴリです: {', '.join(unknown)}"
+        def job(conn):
+            conn.execute("DELETE FROM scenario_rules WHERE fiscal_period_id = ?", (fiscal_period_id,))
+            conn.executemany(
+                "INSERT INTO scenario_rules (fiscal_period_id, target, elasticity) VALUES (?, ?, ?)",
+                [(fiscal_period_id, target, float(value)) for target, value in rules.items()]
+            )
+            self._bump_scenario_rule_version(conn, fiscal_period_id)
+        
         try:
-            xls = pd.ExcelFile(file_path)
-            
-            # 全シートの最初の会社IDと期数を取得（仮に最初のシート名から推測）
-            # 実際の実装では、ユーザーに選択させる必要がある場合もある
-            
-            # ここでは簡易的に、セッションから会社IDと期数を取得する想定
-            # 実際の呼び出し元でこれらを渡すように修正が必要
-            
-            imported_data = {item: {} for item in self.all_items}
-            
-            for sheet_name in xls.sheet_names:
-                df = pd.read_excel(xls, sheet_name=sheet_name, header=None)
-                
-                month_cols = {}
-                
-                # 月の列を特定
-                for r in range(min(20, len(df))):
-                    for c in range(len(df.columns)):
-                        val = str(df.iloc[r, c])
-                        # 月のパターンを検出
-                        match = re.search(r'(\d{1,2})月', val)
-                        if match:
-                            month_num = int(match.group(1))
-                            # 年度を推定（簡易的に現在年）
-                            year = datetime.now().year
-                            month_str = f"{year}-{month_num:02d}"
-                            month_cols[month_str] = c
-                
-                if not month_cols:
-                    continue
-                
-                # 項目の行を特定して数値を抽出
-                for r in range(len(df)):
-                    item_val = ""
-                    for c in range(min(3, len(df.columns))):
-                        v = str(df.iloc[r, c]).strip()
-                        if v and v != "nan":
-                            item_val = v
-                            break
-                    
-                    if not item_val:
-                        continue
-                    
-                    target_item = None
-                    for std_name, aliases in self.item_mapping.items():
-                        if any(alias in item_val for alias in aliases):
-                            target_item = std_name
-                            break
-                    
-                    if not target_item and item_val in self.all_items:
-                        target_item = item_val
-                    
-                    if target_item:
-                        for m, col_idx in month_cols.items():
-                            raw_val = df.iloc[r, col_idx]
-                            try:
-                                if isinstance(raw_val, str):
-                                    clean_val = raw_val.replace(',', '').replace('¥', '').replace('円', '').strip()
-                                    if clean_val.startswith('△') or clean_val.startswith('▲'):
-                                        val = -float(clean_val[1:])
-                                    elif clean_val.startswith('(') and clean_val.endswith(')'):
-                                        val = -float(clean_val[1:-1])
-                                    else:
-                                        val = float(clean_val)
-                                else:
-                                    val = float(raw_val)
-                                
-                                if not np.isnan(val):
-                                    imported_data[target_item][m] = val
-                            except:
-                                pass
-            
-            # DataFrameに変換
-            imported_df = pd.DataFrame.from_dict(imported_data, orient='index').reset_index().rename(columns={'index': '項目名'})
+            self._write(job)
+            return True, "シナリオルールを保存しました"
+        except Exception as e:
+            return False, str(e)
+
+    def get_scenario_coefficients(self, fiscal_period_id):
+        """
+        会計期のシナリオ係数 (シナリオ×項目) を取得
+        
+        増減率とルールから作成した係数をルールのバージョンごとにキャッシュし、
+        バージョンが変わらない限りバージョン確認の1クエリのみで返す
+        """
+        with self._connection() as conn:
+            version = self._scenario_rule_version(conn, fiscal_period_id)
+        cached = self._coefficient_cache.get(fiscal_period_id)
+        if cached is not None and cached[0] == version:
+            return cached[1]
+        
+        coefficients = self.scenario_coefficients(
+            self.get_scenario_rates(fiscal_period_id),
+            self.get_scenario_rules(fiscal_period_id)
+        )
+        coefficients.flags.writeable = False
+        self._coefficient_cache[fiscal_period_id] = (version, coefficients)
+        return coefficients
+
+    def get_scenario_coefficients_many(self, fiscal_period_ids):
+        """複数会計期のシナリオ係数を {fiscal_period_id: 係数配列} で取得 (増減率・ルールそれぞれ1クエリ)"""
+        condition, params = self._period_filter(fiscal_period_ids)
+        with self._connection() as conn:
+            rate_rows = conn.execute(
+                f"SELECT fiscal_period_id, scenario, rate FROM scenario_rates WHERE {condition}", params
+            ).fetchall()
+            rule_rows = conn.execute(
+                f"SELECT fiscal_period_id, target, elasticity FROM scenario_rules WHERE {condition}", params
+            ).fetchall()
+        rates = {int(pid): dict(self.DEFAULT_SCENARIO_RATES) for pid in fiscal_period_ids}
+        rules = {int(pid): dict(self.DEFAULT_SCENARIO_RULES) for pid in fiscal_period_ids}
+        for pid, scenario, rate in rate_rows:
+            rates[pid][scenario] = rate
+        for pid, target, elasticity in rule_rows:
+            rules[pid][target] = elasticity
+        return {pid: self.scenario_coefficients(rates[pid], rules[pid]) for pid in rates}
+
+    def build_scenario_forecasts(self, forecasts_df, split_index, months, coefficients, overrides=None):
+        """
+        全シナリオの予測値を (シナリオ, 項目, 月) の配列で作成
+        
+        coefficients: シナリオ×項目の係数 (get_scenario_coefficients)。{シナリオ名: 増減率} も指定可
+        予測月には係数をブロードキャストで乗じ、
+        overrides (列: scenario, 項目名, month, amount — 補助科目合計など) があればその値で上書きする
+        """
+        if isinstance(coefficients, dict):
+            coefficients = self.scenario_coefficients(coefficients)
+        base = self.frame_to_matrix(forecasts_df, months)
+        is_forecast = np.arange(len(months)) >= split_index
+        cube = np.where(is_forecast, base[None, :, :] * coefficients[:, :, None], base[None, :, :])
+        
+        self._scatter_overrides(cube, overrides, self.item_index, months)
+        return cube
+
+    def _scatter_overrides(self, cube, overrides, row_pos, months):
+        """overrides (列: scenario, 項目名, month, amount) の値を (シナリオ, 行, 月) の配列へ書き込む"""
+        if overrides is None or overrides.empty:
+            return
+        scenario_pos = {s: i for i, s in enumerate(self.SCENARIOS)}
+        month_pos = {m: i for i, m in enumerate(months)}
+        s_idx = overrides['scenario'].map(scenario_pos)
+        r_idx = overrides['項目名'].map(row_pos)
+        c_idx = overrides['month'].map(month_pos)
+        valid = (s_idx.notna() & r_idx.notna() & c_idx.notna()).to_numpy()
+        cube[
+            s_idx[valid].to_numpy(dtype=int),
+            r_idx[valid].to_numpy(dtype=int),
+            c_idx[valid].to_numpy(dtype=int)
+        ] = overrides['amount'][valid].to_numpy(dtype=float)
+
+    def calculate_scenario_pls(self, actuals_df, forecasts_df, split_index, months, coefficients, overrides=None):
+        """
+        現実・楽観・悲観のPLを1回の計算で作成
+        
+        戻り値: (シナリオ, 項目, 月) の配列 (シナリオは SCENARIOS の順)
+        """
+        forecast_cube = self.build_scenario_forecasts(forecasts_df, split_index, months, coefficients, overrides)
+        return self.calculate_pl_matrix(self.frame_to_matrix(actuals_df, months), forecast_cube, split_index)
+
+    def kpi_summary(self, pl_matrix, split_index):
+        """
+        PL行列 (項目, 月) から KPI_ITEMS の合計と利益率を計算
+        
+        戻り値: {'実績合計': {項目名: 金額}, '予測合計': {...}, '合計': {...},
+                 '利益率': {'実績合計': {項目名: 売上高に対する比率}, ...}}
+                 (列名は pl_to_frame と同じ。売上高が0の区分の利益率は0)
+        """
+        kpi = np.asarray(pl_matrix)[self._kpi_rows]
+        actual_total = kpi[:, :split_index].sum(axis=1)
+        forecast_total = kpi[:, split_index:].sum(axis=1)
+        totals = {'実績合計': actual_total, '予測合計': forecast_total, '合計': actual_total + forecast_total}
+        
+        summary = {name: dict(zip(self.KPI_ITEMS, values.tolist())) for name, values in totals.items()}
+        summary['利益率'] = {}
+        for name, values in totals.items():
+            sales, *profits = values.tolist()
+            summary['利益率'][name] = {
+                item: (value / sales if sales != 0 else 0.0) for item, value in zip(self.KPI_ITEMS[1:], profits)
+            }
+        return summary
+
+    def get_kpi_summary(self, fiscal_period_id, split_index, data_version=None):
+        """
+        会計期の全シナリオのKPIサマリー {シナリオ: kpi_summary の戻り値} を共有キャッシュ経由で取得
+        
+        PL表 (pl_to_frame) を作らずにPL行列から直接計算し、データバージョン・シナリオ係数・
+        split_index が変わらない限り計算結果を再利用する。戻り値は共有されるため変更しないこと
+        """
+        if data_version is None:
+            data_version = self.get_data_version(fiscal_period_id)
+        coefficients = self.get_scenario_coefficients(fiscal_period_id)
+        
+        def load():
+            months = self.get_fiscal_months(None, fiscal_period_id)
+            pl_cube = self.calculate_scenario_pls(
+                self.get_actual_data(fiscal_period_id, data_version),
+                self.get_forecast_data(fiscal_period_id, self.SCENARIOS[0], data_version),
+                split_index,
+                months,
+                coefficients,
+                self.get_sub_account_totals(fiscal_period_id, data_version)
+            )
+            return {
+                scenario: self.kpi_summary(pl_cube[i], split_index)
+                for i, scenario in enumerate(self.SCENARIOS)
+            }
+        
+        return self.read_cache.get_or_load(
+            ('kpi', fiscal_period_id, split_index), (data_version, coefficients.tobytes()), load
+        )
+
+    def get_kpi_summaries(self, split_indexes):
+        """
+        複数会計期のKPIサマリーを {会計期ID: get_kpi_summary の戻り値} で取得 (会社一覧のダッシュボード用)
+        
+        split_indexes: {会計期ID: 実績の月数}。データバージョンはまとめて1クエリで確認する
+        """
+        versions = self.get_data_versions(list(split_indexes))
+        return {
+            pid: self.get_kpi_summary(pid, split_index, versions[pid])
+            for pid, split_index in split_indexes.items()
+        }
+
+    def _mark_dirty(self, fiscal_period_id, version, cells):
+        """
+        このプロセスの書き込みで変更されたセル (項目名, 月) を書き込み後のデータバージョンと共に記録
+        
+        月が None の場合はその項目の全月。前回のPLが無い会計期は記録しない (次回は全体を計算するため)
+        """
+        if fiscal_period_id not in self._pl_memo:
+            return
+        with self._dirty_lock:
+            self._dirty_cells.setdefault(fiscal_period_id, {}).setdefault(version, set()).update(cells)
+
+    def evaluate_period_pls(self, fiscal_period_id, actuals_df, forecasts_df, split_index, months,
+                            coefficients, overrides=None, data_version=None):
+        """
+        会計期の全シナリオの予測配列とPL配列をインクリメンタルに評価
+        
+        前回の計算結果を会計期ごとにデータバージョンと共に保持し (全シナリオ分をまとめて保持するため、
+        (会計期, シナリオ) ごとの結果を兼ねる)、save_grid / delete_sub_account / merge_actual_data で
+        記録された変更セルの行・月と、それに依存する計算項目だけを再計算する。
+        前回からのバージョンの増分がすべてこのプロセスの書き込みの場合だけ変更セルで更新し、
+        他のプロセス (batch_import・別のアプリ・PostgreSQLの他の接続) の書き込みを含む場合は
+        変更箇所が分からないため全体を再計算する。
+        締月・月リスト・シナリオ係数が変わった場合、変更が多い場合、
+        変更記録なしで入力DataFrameが差し替えられた場合も全体を再計算する。
+        
+        data_version: actuals_df / forecasts_df / overrides を読み込んだときのデータバージョン
+                      (省略時は1クエリで確認。読み込み後に他の書き込みがあると古いPLが残るため、
+                      get_period_bundle の data_version を渡すこと)
+        戻り値: (予測配列, PL配列) — どちらも (シナリオ, 項目, 月) の読み取り専用配列
+        """
+        if data_version is None:
+            data_version = self.get_data_version(fiscal_period_id)
+        # 前回結果はセッション間で共有するため、会計期の評価は1スレッドずつ行う
+        with self._pl_lock:
+            return self._evaluate_period_pls(fiscal_period_id, actuals_df, forecasts_df, split_index, months,
+                                             coefficients, overrides, int(data_version))
+
+    def _evaluate_period_pls(self, fiscal_period_id, actuals_df, forecasts_df, split_index, months,
+                             coefficients, overrides, data_version):
+        coefficients = np.asarray(coefficients, dtype=float)
+        key = (split_index, tuple(months), coefficients.tobytes())
+        memo = self._pl_memo.get(fiscal_period_id)
+        
+        if memo is not None and memo['key'] == key:
+            same_frames = memo['actuals'] is actuals_df and memo['forecasts'] is forecasts_df
+            if same_frames and memo['data_version'] == data_version:
+                return memo['forecast_cube'], memo['pl_cube']
+            # 前回からこのバージョンまでの書き込みのうち、このプロセスで記録したもの
+            with self._dirty_lock:
+                writes = {
+                    version: cells
+                    for version, cells in self._dirty_cells.get(fiscal_period_id, {}).items()
+                    if memo['data_version'] < version <= data_version
+                }
+            if writes and len(writes) == data_version - memo['data_version']:
+                updated = self._update_period_pls(memo, set().union(*writes.values()), actuals_df, forecasts_df,
+                                                  split_index, months, coefficients, overrides)
+                if updated is not None:
+                    memo = dict(memo, actuals=actuals_df, forecasts=forecasts_df, data_version=data_version,
+                                forecast_cube=updated[0], base_cube=updated[1], pl_cube=updated[2])
+                    self._store_pl_memo(fiscal_period_id, memo)
+                    return memo['forecast_cube'], memo['pl_cube']
+        
+        # 全体を再計算
+        forecast_cube = self.build_scenario_forecasts(forecasts_df, split_index, months, coefficients, overrides)
+        is_actual = np.arange(len(months)) < split_index
+        base_cube = np.where(is_actual, self.frame_to_matrix(actuals_df, months), forecast_cube)
+        pl_cube = np.matmul(self._pl_matrix, base_cube)
+        for arr in (forecast_cube, base_cube, pl_cube):
+            arr.flags.writeable = False
+        self._store_pl_memo(fiscal_period_id, {
+            'key': key,
+            'data_version': data_version,
+            'actuals': actuals_df,
+            'forecasts': forecasts_df,
+            'forecast_cube': forecast_cube,
+            'base_cube': base_cube,
+            'pl_cube': pl_cube,
+        })
+        return forecast_cube, pl_cube
+
+    def _store_pl_memo(self, fiscal_period_id, memo):
+        """前回結果を保存し、反映済みのバージョンまでの変更セルの記録を破棄"""
+        self._pl_memo[fiscal_period_id] = memo
+        with self._dirty_lock:
+            writes = self._dirty_cells.get(fiscal_period_id, {})
+            for version in [v for v in writes if v <= memo['data_version']]:
+                del writes[version]
+
+    def _update_period_pls(self, memo, dirty, actuals_df, forecasts_df, split_index, months,
+                           coefficients, overrides):
+        """変更セルの行・月と依存する計算項目のみ再計算。変更が多い場合は None (全体再計算)"""
+        month_pos = {m: i for i, m in enumerate(months)}
+        rows = sorted({self.item_index[item] for item, _ in dirty if item in self.item_index})
+        if any(month is None for _, month in dirty):
+            cols = list(range(len(months)))
+        else:
+            cols = sorted({month_pos[m] for _, m in dirty if m in month_pos})
+        if len(rows) * len(cols) * 2 > len(self.all_items) * len(months):
+            return None
+        
+        forecast_cube = memo['forecast_cube'].copy()
+        base_cube = memo['base_cube'].copy()
+        pl_cube = memo['pl_cube'].copy()
+        if rows and cols:
+            items = [self.all_items[r] for r in rows]
+            block_months = [months[c] for c in cols]
             
-            # 月列を取得してソート
-            month_cols = [c for c in imported_df.columns if c != '項目名']
-            if month_cols:
-                # YYYY-MM形式の月をソート
-                try:
-                    month_cols_sorted = sorted(month_cols, key=lambda x: pd.to_datetime(x + '-01'))
-                    imported_df = imported_df[['項目名'] + month_cols_sorted]
-                except:
-                    pass  # ソート失敗時はそのまま
+            # 変更セルを含む行×月のブロックだけ入力DataFrameから取り直す
+            is_forecast = np.array(cols) >= split_index
+            forecast_block = self.frame_to_matrix(forecasts_df, block_months, items)
+            forecast_block = np.where(
+                is_forecast,
+                forecast_block[None, :, :] * coefficients[:, rows, None],
+                forecast_block[None, :, :]
+            )
+            if overrides is not None and not overrides.empty:
+                self._scatter_overrides(
+                    forecast_block,
+                    overrides[overrides['項目名'].isin(items) & overrides['month'].isin(block_months)],
+                    {item: i for i, item in enumerate(items)},
+                    block_months
+                )
+            actual_block = self.frame_to_matrix(actuals_df, block_months, items)
             
-            # 項目名でソート
-            imported_df['項目名'] = pd.Categorical(imported_df['項目名'], categories=self.all_items, ordered=True)
-            imported_df = imported_df.sort_values('項目名').reset_index(drop=True)
+            scenario_idx = np.arange(len(self.SCENARIOS))
+            block = np.ix_(scenario_idx, rows, cols)
+            forecast_cube[block] = forecast_block
+            base_cube[block] = np.where(is_forecast, forecast_block, actual_block[None, :, :])
             
-            return imported_df, "データ抽出に成功しました"
+            # 変更行に依存する計算項目 (集計行列の列が非ゼロの行) を再計算
+            affected = np.nonzero(self._pl_matrix[:, rows].any(axis=1))[0]
+            pl_cube[np.ix_(scenario_idx, affected, cols)] = np.matmul(
+                self._pl_matrix[affected], base_cube[:, :, cols]
+            )
+        for arr in (forecast_cube, base_cube, pl_cube):
+            arr.flags.writeable = False
+        return forecast_cube, base_cube, pl_cube
 
-        except Exception as e:
-            return pd.DataFrame(), str(e)
+    def import_yayoi_excel(self, file_path, preview_only=False, streaming=False, max_workers=None, use_cache=False):
+        """
+        弥生会計Excelからデータをインポート
+        preview_only=True の場合はプレビュー用のDataFrameを返す
+        streaming=True の場合は読み取り専用モードで必要な列だけを読み、シートを並列に解析する (.xlsx のみ)
+        use_cache=True の場合、同じ内容のファイルは前回の解析結果をディスクキャッシュから返す
+        """
+        return self.yayoi_parser.parse(file_path, streaming=streaming, max_workers=max_workers, use_cache=use_cache)
 
-    def save_extracted_data(self, fiscal_period_id, imported_df):
-        """抽出されたDataFrameをデータベースに保存"""
-        conn = None
+    def save_extracted_data(self, fiscal_period_id, imported_df, merge=True):
+        """
+        抽出されたDataFrameをデータベースに保存
+        
+        merge=True の場合は保存済みの値との差分 (追加・更新・削除) のみを反映し、件数をメッセージに含める
+        merge=False の場合は会計期の実績を全削除して入れ直す
+        """
         try:
-            conn = sqlite3.connect(self.db_path)
-            cursor = conn.cursor()
-            
-            # 既存のデータを削除
-            cursor.execute("DELETE FROM actual_data WHERE fiscal_period_id = ?", (fiscal_period_id,))
+            if merge:
+                counts = self.merge_actual_data(fiscal_period_id, imported_df)
+                return True, (
+                    f"インポートが完了しました（追加 {counts['inserted']}件・更新 {counts['updated']}件・"
+                    f"削除 {counts['deleted']}件・変更なし {counts['unchanged']}件）"
+                )
             
             months = [c for c in imported_df.columns if c != '項目名']
             
@@ -757,19 +1446,392 @@ class DataProcessor:
                     if val != 0 and not pd.isna(val):
                         insert_data.append((fiscal_period_id, row['項目名'], m, float(val)))
             
-            # 一括挿入
-            if insert_data:
-                cursor.executemany(
-                    "INSERT INTO actual_data (fiscal_period_id, item_name, month, amount) VALUES (?, ?, ?, ?)",
-                    insert_data
-                )
+            def job(conn):
+                # 既存のデータを削除
+                conn.execute("DELETE FROM actual_data WHERE fiscal_period_id = ?", (fiscal_period_id,))
+                
+                # 一括挿入
+                if insert_data:
+                    self.backend.bulk_insert(conn, 'actual_data', ['fiscal_period_id', 'item_name', 'month', 'amount'], insert_data)
+                
+                self._bump_data_version(conn, fiscal_period_id)
             
-            conn.commit()
+            # 会計期全体が置き換わるため前回のPLは破棄
+            self._write(job, after_commit=lambda _: self._pl_memo.pop(fiscal_period_id, None))
             return True, "インポートが完了しました"
         except Exception as e:
-            if conn:
-                conn.rollback()
             return False, str(e)
+
+    def merge_actual_data(self, fiscal_period_id, imported_df):
+        """
+        取り込んだ実績 (項目名 + 月列) を保存済みの値と比較し、異なるセルだけを1トランザクションで反映
+        
+        反映後の状態は全削除して0以外の値を入れ直した場合と同じ (取り込みに無い・0のセルは削除)
+        戻り値: {'inserted': 件数, 'updated': 件数, 'deleted': 件数, 'unchanged': 件数}
+        """
+        return self.merge_actual_data_many([(fiscal_period_id, imported_df)])[0]
+
+    def merge_actual_data_many(self, imports):
+        """
+        複数会計期の取り込み結果 [(fiscal_period_id, imported_df), ...] を1トランザクションで差分反映
+        
+        同じ会計期が複数ある場合は後のものが優先される。戻り値は imports と同じ順の件数辞書のリスト
+        """
+        changed_cells = []
+        
+        def job(conn):
+            # 比較から反映までの間に他の書き込みが入らないよう書き込みロックを取る
+            # (SQLiteは書き込みキューのトランザクション開始時に取得済み)
+            self.backend.begin_write(conn, ['actual_data'])
+            results = []
+            for fiscal_period_id, imported_df in imports:
+                counts, changed = self._merge_actual_rows(conn, fiscal_period_id, imported_df)
+                if changed:
+                    version = self._bump_data_version(conn, fiscal_period_id)
+                    changed_cells.append((fiscal_period_id, version, changed))
+                results.append(counts)
+            return results
+        
+        def mark_changed(_):
+            for fiscal_period_id, version, changed in changed_cells:
+                self._mark_dirty(fiscal_period_id, version, changed)
+        
+        return self._write(job, after_commit=mark_changed)
+
+    def _merge_actual_rows(self, conn, fiscal_period_id, imported_df):
+        """1会計期分の差分を conn 上で反映 (コミットは呼び出し側)。(件数辞書, 変更セル) を返す"""
+        cells = self._grid_cells(imported_df, ['項目名'])
+        incoming = pd.DataFrame({
+            'item_name': cells['項目名'].astype(str).to_numpy(dtype=object),
+            'month': cells['month'].astype(str).to_numpy(dtype=object),
+            'amount': cells['amount'].astype(float).to_numpy(),
+        })
+        incoming = incoming[incoming['amount'] != 0].drop_duplicates(['item_name', 'month'], keep='last')
+        
+        stored = self.backend.read_frame(
+            "SELECT item_name, month, MIN(amount) AS stored_min, MAX(amount) AS stored_max "
+            "FROM actual_data WHERE fiscal_period_id = ? GROUP BY item_name, month",
+            conn, params=(fiscal_period_id,)
+        )
+        diff = incoming.merge(stored, on=['item_name', 'month'], how='outer', indicator=True)
+        both = diff['_merge'] == 'both'
+        same = both & (diff['stored_min'] == diff['amount']) & (diff['stored_max'] == diff['amount'])
+        inserts = diff[diff['_merge'] == 'left_only']
+        updates = diff[both & ~same]
+        deletes = diff[diff['_merge'] == 'right_only']
+        
+        def rows(frame, columns):
+            return list(zip(*(frame[c].tolist() for c in columns)))
+        
+        if not deletes.empty:
+            conn.executemany(
+                "DELETE FROM actual_data WHERE fiscal_period_id = ? AND item_name = ? AND month = ?",
+                [(fiscal_period_id, item, month) for item, month in rows(deletes, ['item_name', 'month'])]
+            )
+        if not updates.empty:
+            conn.executemany(
+                "UPDATE actual_data SET amount = ?, updated_at = CURRENT_TIMESTAMP "
+                "WHERE fiscal_period_id = ? AND item_name = ? AND month = ?",
+                [(amount, fiscal_period_id, item, month) for amount, item, month in rows(updates, ['amount', 'item_name', 'month'])]
+            )
+        if not inserts.empty:
+            self.backend.bulk_insert(
+                conn, 'actual_data', ['fiscal_period_id', 'item_name', 'month', 'amount'],
+                [(fiscal_period_id, item, month, amount) for item, month, amount in rows(inserts, ['item_name', 'month', 'amount'])]
+            )
+        
+        changed = pd.concat([inserts, updates, deletes])
+        counts = {
+            'inserted': len(inserts),
+            'updated': len(updates),
+            'deleted': len(deletes),
+            'unchanged': int(same.sum()),
+        }
+        return counts, list(zip(changed['item_name'], changed['month']))
+
+
+class YayoiParser:
+    """
+    弥生会計の月次推移表 (Excel) を 項目名 + 月列 のDataFrameに変換する
+    
+    項目の並びと別名のマッピングだけを持ち、DBには接続しない。
+    一括インポートのワーカープロセスにはこれだけを渡し、保存は親プロセスの DataProcessor が行う
+    """
+    # 弥生会計の金額表記: △/▲ 始まりと括弧囲みは負数
+    AMOUNT_PATTERN = re.compile(r'^\s*(?:[△▲](?P<neg>.*?)|\((?P<paren>.*)\)|(?P<plain>.*?))\s*$', re.S)
+    
+    # インポート結果キャッシュ: 解析処理を変更したら IMPORT_PARSER_VERSION を上げる
+    IMPORT_PARSER_VERSION = 1
+    IMPORT_CACHE_MAX_ENTRIES = 64
+    
+    def __init__(self, all_items, item_mapping, import_cache_dir):
+        self.all_items = list(all_items)
+        self.item_mapping = {item: list(aliases) for item, aliases in item_mapping.items()}
+        self._build_alias_matcher()
+        
+        # インポート結果のキャッシュ (項目・マッピングが変わったら別のキャッシュになる)
+        self.import_cache_dir = import_cache_dir
+        mapping_source = json.dumps([self.IMPORT_PARSER_VERSION, self.all_items, self.item_mapping], ensure_ascii=False)
+        self._import_signature = hashlib.sha256(mapping_source.encode('utf-8')).hexdigest()
+
+    def parse(self, file_path, streaming=False, max_workers=None, use_cache=False):
+        """
+        弥生会計Excelを解析し (DataFrame, メッセージ) を返す (失敗時は空のDataFrameとエラー内容)
+        streaming=True の場合は読み取り専用モードで必要な列だけを読み、シートを並列に解析する (.xlsx のみ)
+        use_cache=True の場合、同じ内容のファイルは前回の解析結果をディスクキャッシュから返す
+        """
+        try:
+            cache_path = self._import_cache_path(file_path) if use_cache else None
+            if cache_path:
+                cached = self._load_import_cache(cache_path)
+                if cached is not None:
+                    return cached, "データ抽出に成功しました"
+            
+            if streaming and zipfile.is_zipfile(file_path):
+                imported_df = self._assemble_imported(self._read_sheets_streaming(file_path, max_workers))
+            else:
+                xls = pd.ExcelFile(file_path)
+                
+                # 全シートの最初の会社IDと期数を取得（仮に最初のシート名から推測）
+                # 実際の実装では、ユーザーに選択させる必要がある場合もある
+                
+                # ここでは簡易的に、セッションから会社IDと期数を取得する想定
+                # 実際の呼び出し元でこれらを渡すように修正が必要
+                
+                sheets = [
+                    self._extract_sheet(pd.read_excel(xls, sheet_name=sheet_name, header=None))
+                    for sheet_name in xls.sheet_names
+                ]
+                imported_df = self._assemble_imported(sheets)
+            
+            if cache_path:
+                self._store_import_cache(cache_path, imported_df)
+            return imported_df, "データ抽出に成功しました"
+
+        except Exception as e:
+            return pd.DataFrame(), str(e)
+
+    def _build_alias_matcher(self):
+        """item_mapping から別名照合用の正規表現を作成 (生成時に一度だけ)"""
+        # 別名ごとの優先順位 (item_mapping で先に出てくる標準項目ほど優先)
+        priority = {}
+        for rank, aliases in enumerate(self.item_mapping.values()):
+            for alias in aliases:
+                priority.setdefault(alias, rank)
+        aliases = sorted(priority, key=len, reverse=True)
+        # 同じ位置では最長の別名しか拾えないため、その別名の先頭部分に一致する別名の優先順位も考慮しておく
+        self._alias_rank = {a: min(r for b, r in priority.items() if a.startswith(b)) for a in aliases}
+        self._alias_targets = list(self.item_mapping.keys())
+        # 先読みで全位置の一致を拾う (「少額交際費」から「交際費」も検出するため)
+        self._alias_regex = re.compile('(?=(' + '|'.join(re.escape(a) for a in aliases) + '))')
+
+    def _match_items(self, labels):
+        """科目名の Series を標準項目名に変換 (該当なしは NaN)"""
+        unique = pd.Series(pd.unique(labels.dropna()), dtype=object)
+        if unique.empty:
+            return pd.Series(np.nan, index=labels.index, dtype=object)
+        found = unique.str.findall(self._alias_regex).explode().dropna()
+        ranks = found.map(self._alias_rank).groupby(level=0).min()
+        target = pd.Series(np.nan, index=unique.index, dtype=object)
+        target[ranks.index] = np.array(self._alias_targets, dtype=object)[ranks.to_numpy(dtype=int)]
+        # 別名に該当しない場合は標準項目名との完全一致
+        exact = target.isna() & unique.isin(self.all_items)
+        target[exact] = unique[exact]
+        return labels.map(dict(zip(unique, target)))
+
+    def _parse_amounts(self, values):
+        """セル値の Series を数値に変換 (△/▲/括弧は負数、カンマ/¥/円は除去、変換できない値は NaN)"""
+        if values.dtype != object or pd.api.types.infer_dtype(values, skipna=True) not in ('string', 'mixed', 'mixed-integer'):
+            # 文字列を含まない列 (日付列は数値として扱わない)
+            if values.dtype.kind == 'M':
+                return pd.Series(np.nan, index=values.index)
+            return pd.to_numeric(values, errors='coerce').astype(float)
+        # 文字列セルのみ取り出して記号を除去 (文字列以外は NaN になる)
+        cleaned = values.str.replace(r'[,¥円]', '', regex=True)
+        is_text = cleaned.notna()
+        parts = cleaned[is_text].str.extract(self.AMOUNT_PATTERN)
+        negative = parts['neg'].notna() | parts['paren'].notna()
+        body = parts['neg'].fillna(parts['paren']).fillna(parts['plain'])
+        parsed = pd.to_numeric(body, errors='coerce').astype(float)
+        parsed[negative] = -parsed[negative]
+        # 文字列以外 (数値セル) はそのまま数値化
+        numeric = pd.to_numeric(values.where(~is_text), errors='coerce').astype(float)
+        numeric[is_text] = parsed
+        return numeric
+
+    @staticmethod
+    def _detect_month_columns(header):
+        """先頭行から「n月」を含む列を探し {YYYY-MM: 列番号} を返す (同じ月は後に出現した列を採用)"""
+        cells = header.astype(str).stack()
+        found = cells.str.extract(r'(\d{1,2})月', expand=False).dropna()
+        if found.empty:
+            return {}
+        # 年度を推定（簡易的に現在年）
+        year = datetime.now().year
+        months = found.astype(int).map(lambda m: f"{year}-{m:02d}")
+        month_cols = {}
+        for (_, col), month_str in months.items():
+            month_cols[month_str] = col
+        return month_cols
+
+    def _extract_sheet(self, df, month_cols=None):
+        """
+        1シート分のDataFrameから (項目名, month, amount) の縦持ちDataFrameを作成
+        
+        df の列ラベルはシート上の列番号 (0始まり)。month_cols 省略時は先頭20行から月列を検出する
+        """
+        empty = pd.DataFrame(columns=['項目名', 'month', 'amount'])
+        if month_cols is None:
+            month_cols = self._detect_month_columns(df.iloc[:20])
+        if not month_cols:
+            return empty
+        
+        # 先頭3列のうち最初の空でない値を科目名とする
+        labels = None
+        for c in range(3):
+            if c not in df.columns:
+                continue
+            col = df[c].astype(str).str.strip()
+            col = col.where(df[c].notna() & (col != '') & (col != 'nan'))
+            labels = col if labels is None else labels.fillna(col)
+        if labels is None:
+            return empty
+        targets = self._match_items(labels)
+        rows = targets.notna().to_numpy()
+        if not rows.any():
+            return empty
+        
+        block = df.loc[rows, list(month_cols.values())].to_numpy()
+        amounts = self._parse_amounts(pd.Series(block.ravel())).to_numpy()
+        # 行優先で展開しているため、元の行順 (後の行が優先) が保たれる
+        long_df = pd.DataFrame({
+            '項目名': np.repeat(targets[rows].to_numpy(), len(month_cols)),
+            'month': np.tile(np.array(list(month_cols.keys()), dtype=object), block.shape[0]),
+            'amount': amounts,
+        })
+        return long_df[~np.isnan(amounts)].reset_index(drop=True)
+
+    def _assemble_imported(self, sheets):
+        """シートごとの抽出結果を 項目名 + 月列 のDataFrameにまとめる (同じセルは後のシート・行を採用)"""
+        frames = [s for s in sheets if not s.empty]
+        if frames:
+            long_df = pd.concat(frames, ignore_index=True).drop_duplicates(['項目名', 'month'], keep='last')
+            months = list(dict.fromkeys(long_df['month']))
+            wide = long_df.pivot(index='項目名', columns='month', values='amount')
+            # 値が1件もない項目は含めない
+            wide = wide.reindex(index=[i for i in self.all_items if i in wide.index], columns=months)
+        else:
+            wide = pd.DataFrame(index=pd.Index([], dtype=object))
+        imported_df = wide.rename_axis(index='項目名', columns=None).reset_index()
+        
+        # 月列を取得してソート
+        month_cols = [c for c in imported_df.columns if c != '項目名']
+        if month_cols:
+            # YYYY-MM形式の月をソート
+            try:
+                month_cols_sorted = sorted(month_cols, key=lambda x: pd.to_datetime(x + '-01'))
+                imported_df = imported_df[['項目名'] + month_cols_sorted]
+            except:
+                pass  # ソート失敗時はそのまま
+        
+        # 項目名でソート
+        imported_df['項目名'] = pd.Categorical(imported_df['項目名'], categories=self.all_items, ordered=True)
+        return imported_df.sort_values('項目名').reset_index(drop=True)
+
+    def _import_cache_path(self, file_path):
+        """ファイル内容のハッシュ + 解析処理/マッピングの版 + 推定年度からキャッシュファイルのパスを作成"""
+        digest = hashlib.sha256()
+        with open(file_path, 'rb') as f:
+            for chunk in iter(lambda: f.read(1 << 20), b''):
+                digest.update(chunk)
+        # 月列は現在年から作るため、年が変わったら別のキャッシュにする
+        digest.update(f"{self._import_signature}:{datetime.now().year}".encode('utf-8'))
+        return os.path.join(self.import_cache_dir, f"{digest.hexdigest()}.npz")
+
+    def _load_import_cache(self, cache_path):
+        """キャッシュ済みの解析結果を読み込む (無い・壊れている場合は None)"""
+        try:
+            with np.load(cache_path, allow_pickle=False) as data:
+                items, months, values = data['items'], data['months'], data['values']
+            os.utime(cache_path)  # LRU用に最終利用時刻を更新
+        except (OSError, KeyError, ValueError):
+            return None
+        
+        imported_df = pd.DataFrame(values, columns=months.tolist())
+        imported_df.insert(0, '項目名', pd.Categorical(items.tolist(), categories=self.all_items, ordered=True))
+        return imported_df
+
+    def _store_import_cache(self, cache_path, imported_df):
+        """解析結果を項目名・月・値の配列として圧縮保存し、古いものから上限件数まで削除する"""
+        try:
+            os.makedirs(self.import_cache_dir, exist_ok=True)
+            months = [c for c in imported_df.columns if c != '項目名']
+            tmp_path = f"{cache_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+            with open(tmp_path, 'wb') as f:
+                np.savez_compressed(
+                    f,
+                    items=np.array(imported_df['項目名'].astype(str).tolist(), dtype=str),
+                    months=np.array(months, dtype=str),
+                    values=imported_df[months].to_numpy(dtype=float).reshape(len(imported_df), len(months)),
+                )
+            os.replace(tmp_path, cache_path)
+            
+            entries = sorted(
+                (os.path.join(self.import_cache_dir, name) for name in os.listdir(self.import_cache_dir) if name.endswith('.npz')),
+                key=os.path.getmtime,
+            )
+            for old_path in entries[:-self.IMPORT_CACHE_MAX_ENTRIES]:
+                os.remove(old_path)
+        except OSError as e:
+            print(f"Error writing import cache: {e}")
+
+    def _read_sheets_streaming(self, file_path, max_workers=None):
+        """全シートを read_only モードで読み、シートごとの抽出結果を返す (複数シートはプロセスプールで並列処理)"""
+        import openpyxl  # インポート時のみ必要なため遅延読み込み
+        wb = openpyxl.load_workbook(file_path, read_only=True)
+        try:
+            sheet_names = wb.sheetnames
         finally:
-            if conn:
-                conn.close()
+            wb.close()
+        
+        workers = min(len(sheet_names), max_workers or os.cpu_count() or 1)
+        if workers <= 1:
+            results = [_read_sheet_columns(file_path, name) for name in sheet_names]
+        else:
+            with ProcessPoolExecutor(max_workers=workers) as executor:
+                results = list(executor.map(_read_sheet_columns, [file_path] * len(sheet_names), sheet_names))
+        return [self._extract_sheet(df, month_cols) for df, month_cols in results]
+
+
+# 月見出しの判定用 (YayoiParser._detect_month_columns と同じパターン)
+_MONTH_HEADER = re.compile(r'\d{1,2}月')
+
+
+def _read_sheet_columns(file_path, sheet_name, header_rows=20):
+    """
+    1シートを openpyxl の read_only モードで1行ずつ読み、(DataFrame, 月列) を返す
+    
+    2列以上に月が並ぶ行 (見出し行) が見つかった時点で見出しの探索をやめ、
+    以降の行は先頭3列 (科目名) と月列だけを保持する。プロセスプールから呼ぶためモジュール関数にしている
+    """
+    import openpyxl
+    wb = openpyxl.load_workbook(file_path, read_only=True, data_only=True)
+    try:
+        rows = wb[sheet_name].iter_rows(values_only=True)
+        header = []
+        for row in rows:
+            header.append(row)
+            month_positions = {c for c, v in enumerate(row) if v is not None and _MONTH_HEADER.search(str(v))}
+            if len(month_positions) >= 2 or len(header) >= header_rows:
+                break
+        
+        month_cols = YayoiParser._detect_month_columns(pd.DataFrame(header)) if header else {}
+        if not month_cols:
+            return pd.DataFrame(), {}
+        
+        keep = sorted(set(range(3)) | set(month_cols.values()))
+        data = [[row[c] if c < len(row) else None for c in keep] for row in header]
+        data.extend([row[c] if c < len(row) else None for c in keep] for row in rows)
+        return pd.DataFrame(data, columns=keep), month_cols
+    finally:
+        wb.close()
@@ -0,0 +1,197 @@
+"""
+再実行ごとの処理時間の計測 (管理者向けパフォーマンスパネル用)
+
+app.py の1回の実行 (Streamlit の再実行) を PerfTrace で囲み、その間の
+    - 区間 (phase) ごとの経過時間
+    - DBクエリの件数と時間 (storage のクエリリスナー経由)
+    - キャッシュ付き読み込み関数のヒット/ミス
+    - DataFrame のサイズ
+を記録する。計測中の PerfTrace は contextvars で保持するため、共有の DataProcessor を
+複数のセッションが同時に使っても、クエリは実行したセッションの計測にだけ記録される。
+
+計測していないときの phase / record_* は何もしない。
+"""
+import contextvars
+import functools
+import threading
+import time
+from contextlib import contextmanager
+
+_current = contextvars.ContextVar('perf_trace', default=None)
+
+
+class PerfTrace:
+    """1回の再実行の計測結果"""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.total_seconds = None
+        self.phases = []        # {'name', 'depth', 'seconds', 'queries', 'query_seconds'}
+        self.queries = []       # storage のクエリイベント + 'phase'
+        self.cache_calls = {}   # 関数名 → [呼び出し回数, ミス回数]
+        self.frames = {}        # 名前 → (行数, 列数, バイト数)
+        self._stack = []
+        self._mark = None
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def phase(self, name):
+        """with ブロックの経過時間とその間のクエリを name の区間として記録 (入れ子可)"""
+        entry = {'name': name, 'depth': len(self._stack), 'seconds': 0.0, 'queries': 0, 'query_seconds': 0.0}
+        with self._lock:
+            self.phases.append(entry)
+        self._stack.append(entry)
+        start = time.perf_counter()
+        try:
+            yield entry
+        finally:
+            entry['seconds'] = time.perf_counter() - start
+            self._stack.pop()
+
+    def mark(self, name):
+        """
+        name の区間を開始し、次の mark または finish まで続ける (前の mark の区間はここで終わる)
+
+        ページ本体のように with で囲みにくい長い処理に使う
+        """
+        self._end_mark()
+        self._mark = self.phase(name)
+        self._mark.__enter__()
+
+    def _end_mark(self):
+        mark, self._mark = self._mark, None
+        if mark is not None:
+            mark.__exit__(None, None, None)
+
+    def finish(self):
+        """計測を終了して全体の経過時間を確定"""
+        self._end_mark()
+        if self.total_seconds is None:
+            self.total_seconds = time.perf_counter() - self.started
+
+    def record_query(self, event):
+        phase = self._stack[-1] if self._stack else None
+        with self._lock:
+            self.queries.append(dict(event, phase=phase['name'] if phase else None))
+            # 入れ子の区間はすべてに加算する
+            for entry in self._stack:
+                entry['queries'] += 1
+                entry['query_seconds'] += event['seconds']
+
+    def record_cache_call(self, name, missed):
+        with self._lock:
+            counts = self.cache_calls.setdefault(name, [0, 0])
+            counts[0] += 1
+            counts[1] += int(missed)
+
+    def record_frame(self, name, df):
+        if df is None:
+            return
+        try:
+            size = int(df.memory_usage(index=True, deep=True).sum())
+        except (AttributeError, TypeError):
+            size = 0
+        self.frames[name] = (len(df), len(getattr(df, 'columns', ())), size)
+
+    def summary(self):
+        """パネル表示用の辞書 (phases / queries / slowest_queries / caches / frames)"""
+        with self._lock:
+            queries = list(self.queries)
+            phases = [dict(p) for p in self.phases]
+            caches = {
+                name: {'calls': calls, 'hits': calls - misses, 'misses': misses}
+                for name, (calls, misses) in self.cache_calls.items()
+            }
+        return {
+            'total_seconds': self.total_seconds,
+            'phases': phases,
+            'query_count': len(queries),
+            'query_seconds': sum(q['seconds'] for q in queries),
+            'slowest_queries': sorted(queries, key=lambda q: q['seconds'], reverse=True)[:10],
+            'caches': caches,
+            'frames': {
+                name: {'rows': rows, 'columns': columns, 'bytes': size}
+                for name, (rows, columns, size) in self.frames.items()
+            },
+        }
+
+
+def start(enabled=True):
+    """
+    この再実行の計測を開始して PerfTrace を返す (enabled が偽なら計測せず None)
+
+    前回の再実行の計測が残っていても置き換える
+    """
+    trace = PerfTrace() if enabled else None
+    _current.set(trace)
+    return trace
+
+
+def current():
+    """計測中の PerfTrace (計測していなければ None)"""
+    return _current.get()
+
+
+@contextmanager
+def phase(name):
+    """計測中なら with ブロックを name の区間として記録"""
+    trace = _current.get()
+    if trace is None:
+        yield None
+        return
+    with trace.phase(name) as entry:
+        yield entry
+
+
+def mark(name):
+    """計測中なら name の区間を開始 (PerfTrace.mark)"""
+    trace = _current.get()
+    if trace is not None:
+        trace.mark(name)
+
+
+def record_query(event):
+    """storage のクエリリスナー (backend.add_query_listener(perf_trace.record_query) で登録)"""
+    trace = _current.get()
+    if trace is not None:
+        trace.record_query(event)
+
+
+def record_frame(name, df):
+    """計測中なら DataFrame の行数・列数・メモリ使用量を記録"""
+    trace = _current.get()
+    if trace is not None:
+        trace.record_frame(name, df)
+
+
+def track_cache(cache_decorator):
+    """
+    st.cache_data などのキャッシュデコレーターを付け、呼び出しごとのヒット/ミスを記録する
+
+    ミスはキャッシュされた関数の本体が実行されたことで判定する。
+    例: @perf_trace.track_cache(st.cache_data(max_entries=64))
+    """
+    def decorate(func):
+        name = func.__name__
+        missed = threading.local()
+
+        @functools.wraps(func)
+        def body(*args, **kwargs):
+            missed.value = True
+            return func(*args, **kwargs)
+
+        cached = cache_decorator(body)
+
+        @functools.wraps(func)
+        def call(*args, **kwargs):
+            trace = _current.get()
+            if trace is None:
+                return cached(*args, **kwargs)
+            missed.value = False
+            value = cached(*args, **kwargs)
+            trace.record_cache_call(name, missed.value)
+            return value
+
+        call.clear = cached.clear
+        return call
+    return decorate
@@ -0,0 +1,182 @@
+"""
+SQLの実行ログと遅いクエリの検出
+
+storage のクエリリスナーとして登録し、実行したSQLごとに
+正規化した文 (リテラルを ? に置き換え) ・パラメータの指紋・行数・時間を記録する。
+直近 max_entries 件をリングバッファに保持し、文ごとの合計時間の上位を集計する (summary)。
+同じ文がパラメータだけ変えて大量に実行されていれば N+1 の可能性がある (distinct_params 列)。
+
+slow_ms 以上かかったSQLは実行計画 (SQLite は EXPLAIN QUERY PLAN、PostgreSQL は EXPLAIN) と共に
+ログ (既定はこのモジュールのロガーの WARNING) に出す。実行計画は文ごとに1回だけ取得する。
+"""
+import hashlib
+import logging
+import re
+import threading
+import time
+from collections import deque
+
+logger = logging.getLogger(__name__)
+
+_WHITESPACE = re.compile(r'\s+')
+_STRING_LITERAL = re.compile(r"'(?:[^']|'')*'")
+_NUMBER_LITERAL = re.compile(r'\b\d+(?:\.\d+)?\b')
+_IN_LIST = re.compile(r'\bIN \((?:\?, ?)*\?\)', re.I)
+
+# 実行計画を取得する文 (トランザクション制御や PRAGMA は対象外)
+_EXPLAINABLE = re.compile(r'^\s*(?:SELECT|WITH|INSERT|UPDATE|DELETE)\b', re.I)
+
+
+def normalize_sql(sql):
+    """空白をまとめ、文字列・数値リテラルを ?、IN (?, ?, ...) を IN (...) に置き換える"""
+    statement = _WHITESPACE.sub(' ', sql).strip()
+    statement = _STRING_LITERAL.sub('?', statement)
+    statement = _NUMBER_LITERAL.sub('?', statement)
+    return _IN_LIST.sub('IN (...)', statement)
+
+
+def fingerprint(text):
+    """文字列の短いハッシュ (12桁)"""
+    return hashlib.sha1(text.encode('utf-8')).hexdigest()[:12]
+
+
+class QueryLog:
+    """
+    実行したSQLの記録と集計 (スレッドセーフ)
+
+    backend.add_query_listener(query_log) で登録する
+    """
+
+    def __init__(self, backend, slow_ms=100.0, max_entries=5000, max_slow=100, log=None):
+        """
+        backend: 実行計画の取得に使う storage のバックエンド
+        slow_ms: これ以上かかったSQLを遅いクエリとしてログに出す (ミリ秒、None で無効)
+        max_entries: 集計対象として保持する直近のSQLの件数
+        max_slow: 保持する遅いクエリの件数
+        log: ログの出力先 (文字列を1つ受け取る関数、省略時は logger.warning)
+        """
+        self.backend = backend
+        self.slow_ms = slow_ms
+        self.log = log or logger.warning
+        self._entries = deque(maxlen=max_entries)
+        self._slow = deque(maxlen=max_slow)
+        self._plans = {}        # 文の指紋 → 実行計画の行のリスト
+        self._lock = threading.Lock()
+        self._explaining = threading.local()
+        self.queries = 0
+        self.slow_queries = 0
+        self.errors = 0
+
+    def __call__(self, event):
+        # 実行計画の取得で実行したSQLは記録しない
+        if getattr(self._explaining, 'active', False):
+            return
+        statement = normalize_sql(event['sql'])
+        params = event['params']
+        entry = {
+            'time': time.time(),
+            'statement': statement,
+            'fingerprint': fingerprint(statement),
+            'params_fingerprint': fingerprint(repr(params)) if params else None,
+            'many': event['many'],
+            'rows': event['rows'],
+            'seconds': event['seconds'],
+            'error': event['error'],
+            'thread': threading.current_thread().name,
+        }
+        slow = self.slow_ms is not None and entry['seconds'] * 1000 >= self.slow_ms
+        with self._lock:
+            self._entries.append(entry)
+            self.queries += 1
+            self.errors += entry['error'] is not None
+            self.slow_queries += slow
+
+        if entry['error'] is not None:
+            self.log(f"SQLエラー: {entry['error']}: {statement}")
+        if slow:
+            entry['plan'] = self._plan(entry['fingerprint'], event)
+            with self._lock:
+                self._slow.append(entry)
+            plan = "\n".join(f"    {line}" for line in entry['plan'])
+            self.log(
+                f"遅いクエリ {entry['seconds'] * 1000:.1f}ms (行数 {entry['rows']}, {entry['thread']}): "
+                f"{statement}" + (f"\n  実行計画:\n{plan}" if plan else "")
+            )
+
+    def _plan(self, key, event):
+        """文の実行計画 (取得済みならそれを返す。取得できない文は空のリスト)"""
+        with self._lock:
+            if key in self._plans:
+                return self._plans[key]
+        if event['many'] or not _EXPLAINABLE.match(event['sql']):
+            plan = []
+        else:
+            self._explaining.active = True
+            try:
+                plan = self.backend.explain(event['sql'], event['params'])
+            except Exception as e:
+                plan = [f"実行計画を取得できません: {e}"]
+            finally:
+                self._explaining.active = False
+        with self._lock:
+            self._plans[key] = plan
+        return plan
+
+    def summary(self, n=10, by='total_seconds'):
+        """
+        直近のSQLを文ごとに集計し、by の降順で上位 n 件を返す
+
+        各要素の辞書: statement, fingerprint, count, total_seconds, mean_ms, max_ms, rows,
+                      distinct_params (パラメータの種類数), errors
+        """
+        with self._lock:
+            entries = list(self._entries)
+        groups = {}
+        for entry in entries:
+            group = groups.get(entry['fingerprint'])
+            if group is None:
+                group = groups[entry['fingerprint']] = {
+                    'statement': entry['statement'], 'fingerprint': entry['fingerprint'],
+                    'count': 0, 'total_seconds': 0.0, 'max_ms': 0.0, 'rows': 0, 'errors': 0, '_params': set(),
+                }
+            group['count'] += 1
+            group['total_seconds'] += entry['seconds']
+            group['max_ms'] = max(group['max_ms'], entry['seconds'] * 1000)
+            group['rows'] += max(entry['rows'] or 0, 0)
+            group['errors'] += entry['error'] is not None
+            group['_params'].add(entry['params_fingerprint'])
+        for group in groups.values():
+            group['mean_ms'] = group['total_seconds'] * 1000 / group['count']
+            group['distinct_params'] = len(group.pop('_params'))
+        return sorted(groups.values(), key=lambda g: g[by], reverse=True)[:n]
+
+    def slow(self):
+        """記録した遅いクエリ (新しい順、実行計画 'plan' 付き)"""
+        with self._lock:
+            return list(reversed(self._slow))
+
+    def recent(self, n=50):
+        """直近 n 件のSQL (新しい順)"""
+        with self._lock:
+            return list(self._entries)[-n:][::-1]
+
+    def stats(self):
+        """記録件数・遅いクエリ数・エラー数などを辞書で返す"""
+        with self._lock:
+            window = list(self._entries)
+        return {
+            'queries': self.queries,
+            'slow_queries': self.slow_queries,
+            'errors': self.errors,
+            'window': len(window),
+            'window_seconds': sum(e['seconds'] for e in window),
+            'slow_ms': self.slow_ms,
+        }
+
+    def clear(self):
+        """記録と取得済みの実行計画を消去"""
+        with self._lock:
+            self._entries.clear()
+            self._slow.clear()
+            self._plans.clear()
+            self.queries = self.slow_queries = self.errors = 0
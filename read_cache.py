@@ -0,0 +1,138 @@
+"""
+プロセス内で共有する読み込みキャッシュ
+
+Streamlit の全セッションで1つの DataProcessor を共有し、会計期ごとの読み込み結果を
+このキャッシュに1つだけ保持する。同じ会社を複数人が見ても、データは1部のみメモリに置かれる。
+
+エントリは (キー, バージョン) で管理し、バージョンが変わったキーは読み直して置き換える。
+合計サイズが上限を超えたら最近使われていないものから破棄する (LRU)。
+"""
+import sys
+import threading
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+
+
+class ReadCache:
+    """
+    スレッドセーフなLRUキャッシュ (メモリ上限付き)
+
+    値は共有されるため呼び出し側は変更しないこと。numpy配列は読み取り専用にして保持する。
+    DataFrame は pandas の Copy-on-Write に依存し、変更時は呼び出し側でコピーされる
+    (Copy-on-Write が常に有効な pandas 3 以上を requirements.txt で要求している)。
+    """
+
+    def __init__(self, max_bytes=256 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()   # キー → (バージョン, 値, バイト数)
+        self._lock = threading.Lock()
+        self._loading = {}              # キー → 読み込み中のロック (同じキーの同時読み込みを1回にまとめる)
+        self.total_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get_or_load(self, key, version, loader):
+        """
+        キーのバージョンが一致すればキャッシュの値を返し、無ければ loader() で読み込んで保持
+
+        複数のスレッドが同時に同じキーを要求した場合、読み込みは1回だけ行い結果を共有する
+        """
+        value = self._get(key, version)
+        if value is not None:
+            return value
+
+        with self._lock:
+            key_lock = self._loading.setdefault(key, threading.Lock())
+        try:
+            with key_lock:
+                # 待っている間に他のスレッドが読み込んでいれば、それを使う
+                value = self._get(key, version, count=False)
+                if value is not None:
+                    return value
+                value = self._freeze(loader())
+                self._put(key, version, value)
+            return value
+        finally:
+            # loader() が例外を送出した場合も含めて片付ける (後から来たスレッドの新しいロックは残す)
+            with self._lock:
+                if self._loading.get(key) is key_lock:
+                    del self._loading[key]
+
+    def _get(self, key, version, count=True):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] == version:
+                self._entries.move_to_end(key)
+                if count:
+                    self.hits += 1
+                return entry[1]
+            if count:
+                self.misses += 1
+            return None
+
+    def _put(self, key, version, value):
+        size = self.sizeof(value)
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self.total_bytes -= old[2]
+            if size > self.max_bytes:
+                # 上限より大きい値は保持しない
+                return
+            self._entries[key] = (version, value, size)
+            self.total_bytes += size
+            while self.total_bytes > self.max_bytes:
+                _, (_, _, evicted) = self._entries.popitem(last=False)
+                self.total_bytes -= evicted
+                self.evictions += 1
+
+    def invalidate(self, predicate=None):
+        """predicate(キー) が真のエントリを破棄 (省略時は全件)"""
+        with self._lock:
+            for key in [k for k in self._entries if predicate is None or predicate(k)]:
+                self.total_bytes -= self._entries.pop(key)[2]
+
+    def stats(self):
+        """件数・使用バイト数・ヒット率などを辞書で返す"""
+        with self._lock:
+            requests = self.hits + self.misses
+            return {
+                'entries': len(self._entries),
+                'bytes': self.total_bytes,
+                'max_bytes': self.max_bytes,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'hit_rate': self.hits / requests if requests else 0.0,
+            }
+
+    @classmethod
+    def _freeze(cls, value):
+        """numpy配列を読み取り専用にする (タプル・辞書の中も含む)"""
+        if isinstance(value, np.ndarray):
+            value.flags.writeable = False
+        elif isinstance(value, (tuple, list)):
+            for item in value:
+                cls._freeze(item)
+        elif isinstance(value, dict):
+            for item in value.values():
+                cls._freeze(item)
+        return value
+
+    @classmethod
+    def sizeof(cls, value):
+        """値のおおよそのメモリ使用量 (バイト)"""
+        if isinstance(value, np.ndarray):
+            return value.nbytes
+        if isinstance(value, pd.DataFrame):
+            return int(value.memory_usage(index=True, deep=True).sum())
+        if isinstance(value, pd.Series):
+            return int(value.memory_usage(index=True, deep=True))
+        if isinstance(value, (tuple, list)):
+            return sys.getsizeof(value) + sum(cls.sizeof(item) for item in value)
+        if isinstance(value, dict):
+            return sys.getsizeof(value) + sum(cls.sizeof(k) + cls.sizeof(v) for k, v in value.items())
+        return sys.getsizeof(value)
@@ -0,0 +1,276 @@
+"""
+データベーススキーマのバージョン管理 (前方マイグレーション)
+
+スキーマの変更は MIGRATIONS に番号順で追加する。適用済みの番号は SQLite では PRAGMA user_version、
+全バックエンド共通で schema_migrations テーブル (適用日時の履歴) に記録する。
+
+スキーマが最新の場合、migrate はバージョンを1回読むだけで終わる (DDL は実行しない)。
+古い場合は書き込みロックを取ってから未適用のマイグレーションを1トランザクションで順に適用する。
+複数のプロセスが同時に起動しても、ロック取得後にバージョンを読み直すため二重には適用されない。
+
+マイグレーション関数は (conn, backend) を受け取り、DDL・データ移行を行う (コミットは migrate が行う)。
+実際に行った変更の説明のリスト (何も変更しなかった場合は空のリスト) を返せる。None を返す関数は
+内容を報告しないマイグレーションとして扱う。
+"""
+
+MIGRATIONS = []
+
+
+def migration(version, name):
+    """マイグレーション関数を登録するデコレーター (version は1からの連番)"""
+    def register(func):
+        MIGRATIONS.append((version, name, func))
+        MIGRATIONS.sort(key=lambda m: m[0])
+        return func
+    return register
+
+
+def latest_version():
+    return MIGRATIONS[-1][0] if MIGRATIONS else 0
+
+
+def migrate(backend):
+    """
+    スキーマを最新にする
+
+    戻り値: 適用したマイグレーションの (番号, 名前, 変更内容) のリスト (最新なら空)
+            変更内容はマイグレーション関数の戻り値 (変更の説明のリスト、報告しない関数は None)
+    """
+    target = latest_version()
+    with backend.connection() as conn:
+        if backend.schema_version(conn) >= target:
+            return []
+        
+        backend.begin_schema_change(conn)
+        current = backend.schema_version(conn)
+        conn.execute('''
+        CREATE TABLE IF NOT EXISTS schema_migrations (
+            version INTEGER PRIMARY KEY,
+            name TEXT NOT NULL,
+            applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+        ''')
+        applied = []
+        for version, name, func in MIGRATIONS:
+            if version <= current:
+                continue
+            changes = func(conn, backend)
+            conn.execute("INSERT INTO schema_migrations (version, name) VALUES (?, ?)", (version, name))
+            backend.set_schema_version(conn, version)
+            applied.append((version, name, changes))
+        conn.commit()
+    return applied
+
+
+@migration(1, "初期スキーマ")
+def _initial_schema(conn, backend):
+    """テーブルとインデックスを作成 (要件定義書の2.3に準拠)"""
+    cursor = conn.cursor()
+    
+    # 2.3.1 会社マスタ
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS companies (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        name TEXT NOT NULL UNIQUE,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )
+    ''')
+    
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_name ON companies(name)')
+    
+    # 2.3.2 会計期マスタ
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS fiscal_periods (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        comp_id INTEGER NOT NULL,
+        period_num INTEGER NOT NULL,
+        start_date TEXT NOT NULL,
+        end_date TEXT NOT NULL,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        FOREIGN KEY (comp_id) REFERENCES companies (id),
+        UNIQUE(comp_id, period_num),
+        CHECK (start_date < end_date)
+    )
+    ''')
+    
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_comp_period ON fiscal_periods(comp_id, period_num)')
+    
+    # 2.3.3 実績データ
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS actual_data (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        fiscal_period_id INTEGER NOT NULL,
+        item_name TEXT NOT NULL,
+        month TEXT NOT NULL,
+        amount REAL NOT NULL DEFAULT 0,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        FOREIGN KEY (fiscal_period_id) REFERENCES fiscal_periods (id),
+        UNIQUE(fiscal_period_id, item_name, month)
+    )
+    ''')
+    
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_period_item ON actual_data(fiscal_period_id, item_name)')
+    
+    # 2.3.4 予測データ
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS forecast_data (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        fiscal_period_id INTEGER NOT NULL,
+        scenario TEXT NOT NULL,
+        item_name TEXT NOT NULL,
+        month TEXT NOT NULL,
+        amount REAL NOT NULL DEFAULT 0,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        FOREIGN KEY (fiscal_period_id) REFERENCES fiscal_periods (id),
+        UNIQUE(fiscal_period_id, scenario, item_name, month),
+        CHECK (scenario IN ('現実', '楽観', '悲観'))
+    )
+    ''')
+    
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_period_scenario ON forecast_data(fiscal_period_id, scenario)')
+    
+    # 2.3.5 補助科目
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS sub_accounts (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        fiscal_period_id INTEGER NOT NULL,
+        scenario TEXT NOT NULL,
+        parent_item TEXT NOT NULL,
+        sub_account_name TEXT NOT NULL,
+        month TEXT NOT NULL,
+        amount REAL NOT NULL DEFAULT 0,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        FOREIGN KEY (fiscal_period_id) REFERENCES fiscal_periods(id),
+        UNIQUE(fiscal_period_id, scenario, parent_item, sub_account_name, month)
+    )
+    ''')
+    
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_period_parent ON sub_accounts(fiscal_period_id, parent_item)')
+    # 補助科目合計の集計用 (カバリングインデックス)
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_sub_totals ON sub_accounts(fiscal_period_id, scenario, parent_item, month, amount)')
+    
+    # 2.3.6 勘定科目属性
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS item_attributes (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        fiscal_period_id INTEGER NOT NULL,
+        item_name TEXT NOT NULL,
+        is_variable INTEGER DEFAULT 0,
+        variable_rate REAL DEFAULT 0.0,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        FOREIGN KEY (fiscal_period_id) REFERENCES fiscal_periods(id),
+        UNIQUE(fiscal_period_id, item_name),
+        CHECK (is_variable IN (0, 1)),
+        CHECK (variable_rate >= 0 AND variable_rate <= 1)
+    )
+    ''')
+    
+    # シナリオ増減率
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS scenario_rates (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        fiscal_period_id INTEGER NOT NULL,
+        scenario TEXT NOT NULL,
+        rate REAL NOT NULL DEFAULT 0,
+        updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        FOREIGN KEY (fiscal_period_id) REFERENCES fiscal_periods(id),
+        UNIQUE(fiscal_period_id, scenario),
+        CHECK (scenario IN ('現実', '楽観', '悲観'))
+    )
+    ''')
+    
+    # シナリオ感応度ルール (項目名またはカテゴリ名ごと)
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS scenario_rules (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        fiscal_period_id INTEGER NOT NULL,
+        target TEXT NOT NULL,
+        elasticity REAL NOT NULL DEFAULT 0,
+        updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        FOREIGN KEY (fiscal_period_id) REFERENCES fiscal_periods(id),
+        UNIQUE(fiscal_period_id, target)
+    )
+    ''')
+    
+    # シナリオ設定のバージョン (増減率・ルール変更のたびに加算)
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS scenario_rule_versions (
+        fiscal_period_id INTEGER PRIMARY KEY,
+        version INTEGER NOT NULL DEFAULT 0,
+        FOREIGN KEY (fiscal_period_id) REFERENCES fiscal_periods(id)
+    )
+    ''')
+    
+    # データのバージョン (会計期の実績・予測・補助科目が変わるたびに加算。キャッシュの照合用)
+    # fiscal_period_id = 0 は会社・会計期マスタ
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS data_versions (
+        fiscal_period_id INTEGER PRIMARY KEY,
+        version INTEGER NOT NULL DEFAULT 0
+    )
+    ''')
+
+
+# 旧バージョンのアプリで作成されたDBに無い列 (テーブル → [(列名, 型)])
+_LEGACY_COLUMNS = {
+    'companies': [('created_at', 'TIMESTAMP')],
+    'fiscal_periods': [('created_at', 'TIMESTAMP')],
+    'actual_data': [('created_at', 'TIMESTAMP'), ('updated_at', 'TIMESTAMP')],
+    'forecast_data': [('created_at', 'TIMESTAMP'), ('updated_at', 'TIMESTAMP')],
+    'sub_accounts': [('created_at', 'TIMESTAMP'), ('updated_at', 'TIMESTAMP')],
+}
+
+# UPSERT (ON CONFLICT) の対象となる一意キー
+_GRID_KEYS = {
+    'actual_data': ['fiscal_period_id', 'item_name', 'month'],
+    'forecast_data': ['fiscal_period_id', 'scenario', 'item_name', 'month'],
+    'sub_accounts': ['fiscal_period_id', 'scenario', 'parent_item', 'sub_account_name', 'month'],
+}
+
+
+@migration(2, "旧スキーマのDBに更新日時列と一意キーを追加")
+def _upgrade_legacy_schema(conn, backend):
+    """
+    旧バージョンで作成されたDB (CREATE TABLE IF NOT EXISTS では変更されない) を現在の定義に揃える
+
+    - 作成日時・更新日時の列を追加 (既存行は移行時刻)
+    - 実績・予測・補助科目の重複セルを削除 (後に登録された行を残す) してから一意インデックスを作成
+    - 項目属性は項目名だけで一意になっていたため、会計期×項目名で一意のテーブルに作り直す
+    新しく作成されたDBでは何もしない (空のリストを返す)
+    """
+    changes = []
+    for table, columns in _LEGACY_COLUMNS.items():
+        existing = backend.table_columns(conn, table)
+        missing = [(name, type_) for name, type_ in columns if name not in existing]
+        for name, type_ in missing:
+            # SQLite は ALTER TABLE で CURRENT_TIMESTAMP を既定値にできないため、既存行は UPDATE で埋める
+            conn.execute(f"ALTER TABLE {table} ADD COLUMN {name} {type_}")
+            conn.execute(f"UPDATE {table} SET {name} = CURRENT_TIMESTAMP")
+        if missing:
+            changes.append(f"{table} に列を追加 ({', '.join(name for name, _ in missing)})")
+        if table in _GRID_KEYS and missing:
+            keys = ', '.join(_GRID_KEYS[table])
+            deleted = conn.execute(
+                f"DELETE FROM {table} WHERE id NOT IN (SELECT MAX(id) FROM {table} GROUP BY {keys})"
+            ).rowcount
+            if deleted > 0:
+                changes.append(f"{table} の重複セルを{deleted}件削除")
+            conn.execute(f"CREATE UNIQUE INDEX IF NOT EXISTS uq_{table} ON {table}({keys})")
+            changes.append(f"{table} に一意インデックス uq_{table} を作成")
+    
+    if 'created_at' not in backend.table_columns(conn, 'item_attributes'):
+        conn.execute("ALTER TABLE item_attributes RENAME TO item_attributes_legacy")
+        _initial_schema(conn, backend)
+        conn.execute('''
+        INSERT INTO item_attributes (fiscal_period_id, item_name, is_variable, variable_rate)
+        SELECT fiscal_period_id, item_name, COALESCE(is_variable, 0), COALESCE(variable_rate, 0.0)
+        FROM item_attributes_legacy
+        WHERE fiscal_period_id IS NOT NULL AND item_name IS NOT NULL
+        ''')
+        conn.execute("DROP TABLE item_attributes_legacy")
+        changes.append("item_attributes を会計期×項目名で一意のテーブルに作り直し")
+    return changes
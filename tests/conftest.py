@@ -0,0 +1,83 @@
+"""
+テスト共通のフィクスチャ
+
+backend はバックエンドの契約テスト用に SQLite と PostgreSQL で実行する。
+PostgreSQL は環境変数 TEST_DATABASE_URL (postgresql://...) が設定され psycopg2 がある場合のみ、
+テストごとに作成する一時スキーマ上で実行し、それ以外はスキップする。
+"""
+import contextlib
+import os
+import sys
+import uuid
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import storage  # noqa: E402
+from data_processor import DataProcessor  # noqa: E402
+
+MONTHS = ['2024-04', '2024-05', '2024-06']
+
+
+def _postgres_backend():
+    dsn = os.environ.get('TEST_DATABASE_URL')
+    if not dsn or not dsn.startswith('postgresql'):
+        pytest.skip("TEST_DATABASE_URL (postgresql://...) が未設定")
+    if storage.psycopg2 is None:
+        pytest.skip("psycopg2 が未インストール")
+    schema_name = f"test_{uuid.uuid4().hex[:12]}"
+    admin = storage.psycopg2.connect(dsn)
+    admin.autocommit = True
+    admin.cursor().execute(f"CREATE SCHEMA {schema_name}")
+    backend = storage.PostgresBackend(dsn, options=f"-c search_path={schema_name}")
+    try:
+        yield backend
+    finally:
+        # DataProcessor.close で閉じ済みの場合がある
+        with contextlib.suppress(storage.psycopg2.pool.PoolError):
+            backend.close()
+        admin.cursor().execute(f"DROP SCHEMA {schema_name} CASCADE")
+        admin.close()
+
+
+@pytest.fixture(params=['sqlite', 'postgres'])
+def backend(request, tmp_path):
+    """空のデータベースのバックエンド"""
+    if request.param == 'postgres':
+        yield from _postgres_backend()
+        return
+    backend = storage.SQLiteBackend(str(tmp_path / 'test.db'))
+    yield backend
+    backend.close()
+
+
+@pytest.fixture
+def processor(backend):
+    """backend 上の DataProcessor (スキーマ作成済み)"""
+    dp = DataProcessor(backend=backend)
+    yield dp
+    dp.close()
+
+
+@pytest.fixture
+def sqlite_processor(tmp_path):
+    """SQLiteファイル上の DataProcessor (別プロセスからの書き込みを再現するテスト用)"""
+    dp = DataProcessor(str(tmp_path / 'test.db'))
+    yield dp
+    dp.close()
+
+
+def add_period(dp, company='テスト株式会社', period_num=1, start_date='2024-04-01', end_date='2024-06-30'):
+    """会社と会計期を追加して会計期IDを返す"""
+    dp.add_company(company)
+    comp_id = int(dp.get_companies().set_index('name').loc[company, 'id'])
+    dp.add_fiscal_period(comp_id, period_num, start_date, end_date)
+    periods = dp.get_company_periods(comp_id)
+    return int(periods.set_index('period_num').loc[period_num, 'id'])
+
+
+@pytest.fixture
+def period(processor):
+    """processor に追加した3か月の会計期のID"""
+    return add_period(processor)
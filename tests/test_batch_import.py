@@ -0,0 +1,58 @@
+"""弥生会計Excelの一括インポート (batch_import)"""
+import pickle
+from datetime import datetime
+
+import openpyxl
+import pytest
+
+import batch_import
+from conftest import add_period
+from data_processor import YayoiParser
+
+YEAR = datetime.now().year
+
+
+@pytest.fixture
+def workbook(tmp_path):
+    """2シートの月次推移表 (2シート目の値が優先される)"""
+    path = tmp_path / 'A社_1期.xlsx'
+    wb = openpyxl.Workbook()
+    ws = wb.active
+    ws.append(['月次推移表'])
+    ws.append(['勘定科目', None, None, '4月', '5月', '6月'])
+    ws.append(['売上金額', None, None, 100, '1,200', None])
+    ws.append([None, '給与手当', None, '△20', '(30)', '¥40円'])
+    ws.append(['合計', None, None, 80, 1170, 40])
+    ws = wb.create_sheet('販管費')
+    ws.append(['勘定科目', None, None, '4月', '5月'])
+    ws.append([None, None, '地代家賃', 9, 10])
+    ws.append(['売上金額', None, None, 150, None])
+    wb.save(path)
+    return str(path)
+
+
+def test_parser_runs_without_a_processor(sqlite_processor, workbook, tmp_path):
+    parser = YayoiParser(sqlite_processor.all_items, sqlite_processor.item_mapping, str(tmp_path / 'cache'))
+    expected, message = sqlite_processor.import_yayoi_excel(workbook)
+    assert message == "データ抽出に成功しました"
+
+    # ワーカーへはpickleして渡される
+    parsed, _ = pickle.loads(pickle.dumps(parser)).parse(workbook, streaming=True, max_workers=1)
+    assert parsed.equals(expected)
+    rows = parsed.set_index(parsed['項目名'].astype(str))
+    assert rows.loc['売上高', [f"{YEAR}-04", f"{YEAR}-05"]].tolist() == [150.0, 1200.0]
+    assert rows.loc['給料手当', [f"{YEAR}-04", f"{YEAR}-05", f"{YEAR}-06"]].tolist() == [-20.0, -30.0, 40.0]
+    assert rows.loc['地代家賃', f"{YEAR}-05"] == 10.0
+
+
+def test_run_batch_saves_in_parent(sqlite_processor, workbook):
+    pid = add_period(sqlite_processor, 'A社')
+    targets, failed = batch_import.resolve_targets(sqlite_processor, [workbook])
+    assert targets == [(workbook, pid)] and failed == []
+
+    results = batch_import.run_batch(sqlite_processor.db_path, targets, workers=1, use_cache=False,
+                                     log=lambda *_: None)
+    assert [r['status'] for r in results] == ['ok']
+    assert results[0]['inserted'] == 7
+    saved = sqlite_processor.load_actual_data(pid).set_index('項目名')
+    assert saved.loc['売上高', f"{YEAR}-04"] == 150.0
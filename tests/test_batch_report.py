@@ -0,0 +1,49 @@
+"""全会計期のPL一括作成 (batch_report)"""
+import numpy as np
+import pandas as pd
+import pytest
+
+import batch_report
+from conftest import MONTHS, add_period
+
+
+@pytest.fixture
+def report_db(sqlite_processor):
+    dp = sqlite_processor
+    p1 = add_period(dp, 'A社')
+    p2 = add_period(dp, 'B社')
+    dp.save_grid(p1, 'actual', None, pd.DataFrame({'項目名': ['売上高', '売上原価'], MONTHS[0]: [100.0, -40.0]}))
+    dp.save_forecast_item(p1, '現実', '売上高', {MONTHS[1]: 120.0, MONTHS[2]: 130.0})
+    dp.save_sub_account(p1, '楽観', '地代家賃', '本社', {MONTHS[2]: 9.0})
+    dp.save_scenario_rate(p1, '楽観', 0.2)
+    dp.save_actual_item(p2, '売上高', {MONTHS[0]: 50.0, MONTHS[1]: 60.0})
+    return dp, p1, p2
+
+
+def test_report_matches_scenario_pls(report_db):
+    dp, p1, p2 = report_db
+    report = batch_report.build_pl_report(dp.db_path, workers=1, log=lambda *_: None)
+
+    assert list(report.columns) == batch_report.REPORT_COLUMNS
+    assert len(report) == 2 * len(dp.SCENARIOS) * len(dp.all_items) * len(MONTHS)
+    for pid, split_index in ((p1, 1), (p2, 2)):
+        bundle = dp.get_period_bundle(pid)
+        expected = dp.calculate_scenario_pls(bundle['actuals'], bundle['forecasts']['現実'], split_index, MONTHS,
+                                             bundle['coefficients'], bundle['sub_account_totals'])
+        rows = report[report['会計期ID'] == pid]
+        np.testing.assert_allclose(rows['金額'].to_numpy().reshape(expected.shape), expected)
+        is_actual = rows['月'].map(MONTHS.index) < split_index
+        assert (rows['区分'] == np.where(is_actual, '実績', '予測')).all()
+
+
+def test_workers_compute_from_matrices_without_a_processor(report_db):
+    dp, _, _ = report_db
+    tasks = batch_report.build_report_tasks(dp)
+    layout = batch_report.pl_layout(dp)
+    assert layout['item_types'] == dp.pl_item_types()
+    # ワーカーに渡すのは行列と定義だけ
+    assert all(isinstance(task['actuals'], np.ndarray) and isinstance(task['forecasts'], np.ndarray) for task in tasks)
+
+    serial = batch_report.compute_report_rows(layout, tasks)
+    parallel = batch_report.build_pl_report(dp.db_path, workers=2, log=lambda *_: None)
+    pd.testing.assert_frame_equal(serial, parallel)
@@ -0,0 +1,124 @@
+"""DataProcessor の保存・差分反映・データバージョン (バックエンドごとに実行)"""
+import pandas as pd
+
+from conftest import MONTHS, add_period
+
+
+def _cells(dp, kind, period, scenario=None):
+    df = dp.load_grid_cells(kind, [period], scenario)
+    return {(row['項目名'], row['month']): row['amount'] for _, row in df.iterrows()}
+
+
+def test_save_grid_upserts_without_duplicates(processor, period):
+    wide = pd.DataFrame({'項目名': ['売上高', '売上原価'], '2024-04': [100.0, -40.0], '2024-05': [200.0, -80.0]})
+    assert processor.save_grid(period, 'actual', None, wide) == (True, "4件のデータを保存しました")
+
+    # 変更セルのみの縦持ちで2回目の保存 → 同じセルは更新され行は増えない
+    changed = pd.DataFrame({'項目名': ['売上高'], 'month': ['2024-04'], 'amount': [150.0]})
+    success, _ = processor.save_grid(period, 'actual', None, changed)
+    assert success
+    with processor._connection() as conn:
+        count = conn.execute("SELECT COUNT(*) FROM actual_data WHERE fiscal_period_id = ?", (period,)).fetchone()[0]
+    assert count == 4
+    assert _cells(processor, 'actual', period) == {
+        ('売上高', '2024-04'): 150.0, ('売上高', '2024-05'): 200.0,
+        ('売上原価', '2024-04'): -40.0, ('売上原価', '2024-05'): -80.0,
+    }
+
+
+def test_save_grid_forecast_and_sub_account(processor, period):
+    forecast = pd.DataFrame({'項目名': ['売上高'], '2024-06': [300.0]})
+    assert processor.save_grid(period, 'forecast', '楽観', forecast)[0]
+    assert _cells(processor, 'forecast', period, '楽観') == {('売上高', '2024-06'): 300.0}
+    assert _cells(processor, 'forecast', period, '現実') == {}
+
+    sub = pd.DataFrame({'parent_item': ['地代家賃', '地代家賃'], 'sub_account_name': ['本社', '倉庫'],
+                        '2024-04': [10.0, 5.0]})
+    assert processor.save_grid(period, 'sub_account', '現実', sub)[0]
+    totals = processor.load_sub_account_totals(period, '現実')
+    assert totals[['項目名', 'month', 'amount']].values.tolist() == [['地代家賃', '2024-04', 15.0]]
+
+
+def test_merge_actual_data_many_counts_and_result(processor):
+    p1 = add_period(processor, 'A社')
+    p2 = add_period(processor, 'B社')
+    processor.save_grid(p1, 'actual', None, pd.DataFrame({
+        '項目名': ['売上高', '売上原価', '雑費'], '2024-04': [100.0, -40.0, 5.0],
+    }))
+
+    imported1 = pd.DataFrame({'項目名': ['売上高', '売上原価', '給料手当'], '2024-04': [100.0, -45.0, 30.0],
+                              '2024-05': [0.0, 0.0, 0.0]})
+    imported2 = pd.DataFrame({'項目名': ['売上高'], '2024-04': [70.0]})
+    results = processor.merge_actual_data_many([(p1, imported1), (p2, imported2)])
+
+    assert results == [
+        {'inserted': 1, 'updated': 1, 'deleted': 1, 'unchanged': 1},
+        {'inserted': 1, 'updated': 0, 'deleted': 0, 'unchanged': 0},
+    ]
+    # 全削除して0以外を入れ直した場合と同じ状態
+    assert _cells(processor, 'actual', p1) == {
+        ('売上高', '2024-04'): 100.0, ('売上原価', '2024-04'): -45.0, ('給料手当', '2024-04'): 30.0,
+    }
+    assert _cells(processor, 'actual', p2) == {('売上高', '2024-04'): 70.0}
+
+    # 同じ内容を再度反映しても変更なし・バージョンも変わらない
+    version = processor.get_data_version(p1)
+    assert processor.merge_actual_data(p1, imported1) == {'inserted': 0, 'updated': 0, 'deleted': 0, 'unchanged': 3}
+    assert processor.get_data_version(p1) == version
+
+
+def test_data_version_bumps_on_each_write(processor, period):
+    master = processor.get_data_version()
+    assert master > 0  # add_company / add_fiscal_period で加算済み
+    assert processor.get_data_version(period) == 0
+
+    processor.save_actual_item(period, '売上高', {MONTHS[0]: 100.0})
+    assert processor.get_data_version(period) == 1
+    processor.save_forecast_item(period, '現実', '売上高', {MONTHS[2]: 120.0})
+    assert processor.get_data_version(period) == 2
+    processor.save_sub_account(period, '現実', '地代家賃', '本社', {MONTHS[0]: 10.0})
+    assert processor.get_data_version(period) == 3
+    processor.save_extracted_data(period, pd.DataFrame({'項目名': ['売上高'], MONTHS[0]: [90.0]}), merge=False)
+    assert processor.get_data_version(period) == 4
+
+    # 他の会計期・マスタのバージョンは変わらない
+    assert processor.get_data_version() == master
+    processor.add_company('別会社')
+    assert processor.get_data_version() == master + 1
+    assert processor.get_data_versions([period, 999]) == {period: 4, 999: 0}
+
+
+def test_save_grid_reports_invalid_kind_and_scenario(processor, period):
+    frame = pd.DataFrame({'項目名': ['売上高'], '2024-04': [1.0]})
+    success, msg = processor.save_grid(period, 'budget', None, frame)
+    assert not success and 'budget' in msg
+    success, msg = processor.save_grid(period, 'forecast', None, frame)
+    assert not success and 'scenario' in msg
+    # キー列の無いDataFrame
+    success, _ = processor.save_grid(period, 'sub_account', '現実', frame)
+    assert not success
+    assert processor.get_data_version(period) == 0
+
+
+def test_submit_grid_returns_failed_future_for_invalid_input(processor, period):
+    future = processor.submit_grid(period, 'forecast', None, pd.DataFrame({'項目名': ['売上高'], '2024-04': [1.0]}))
+    assert future.done()
+    assert isinstance(future.exception(), ValueError)
+
+
+def test_growth_forecasts_save_and_report_failure(processor, period, monkeypatch):
+    actuals = pd.DataFrame({'項目名': ['売上高'], MONTHS[0]: [100.0], MONTHS[1]: [110.0]})
+    result, success, msg = processor.calculate_growth_forecasts(actuals, 2, MONTHS, items=['売上高'],
+                                                                fiscal_period_id=period, scenario='現実')
+    assert success and msg == "1件のデータを保存しました"
+    assert _cells(processor, 'forecast', period, '現実') == {('売上高', MONTHS[2]): result.loc[0, MONTHS[2]]}
+
+    # 保存に失敗した場合も計算結果と共に呼び出し元へ返る
+    def fail(*args, **kwargs):
+        raise RuntimeError("disk full")
+    monkeypatch.setattr(processor.backend, 'upsert', fail)
+    result, success, msg = processor.calculate_growth_forecasts(actuals, 2, MONTHS, items=['売上高'],
+                                                                fiscal_period_id=period, scenario='現実')
+    assert not success and 'disk full' in msg
+    assert result['項目名'].tolist() == ['売上高']
+    assert processor.get_data_version(period) == 1
@@ -0,0 +1,66 @@
+"""KPIサマリー (kpi_summary / get_kpi_summary)"""
+import numpy as np
+import pytest
+
+from conftest import MONTHS, add_period
+
+
+def test_kpi_summary_totals_and_margins(sqlite_processor):
+    dp = sqlite_processor
+    pl = np.zeros((len(dp.all_items), len(MONTHS)))
+    pl[dp.item_index['売上高']] = [100.0, 200.0, 0.0]
+    pl[dp.item_index['営業損益金額']] = [10.0, 30.0, 5.0]
+    summary = dp.kpi_summary(pl, 2)
+
+    assert summary['実績合計']['売上高'] == 300.0
+    assert summary['予測合計']['営業損益金額'] == 5.0
+    assert summary['合計']['営業損益金額'] == 45.0
+    assert summary['利益率']['実績合計']['営業損益金額'] == pytest.approx(40.0 / 300.0)
+    # 売上高が0の区分の利益率は0
+    assert summary['利益率']['予測合計']['営業損益金額'] == 0.0
+    assert set(summary['合計']) == set(dp.KPI_ITEMS)
+    assert all(isinstance(v, float) for v in summary['利益率']['合計'].values())
+
+
+def test_get_kpi_summary_matches_pl_frame_and_is_cached(processor, period):
+    processor.save_actual_item(period, '売上高', {MONTHS[0]: 100.0})
+    processor.save_actual_item(period, '売上原価', {MONTHS[0]: 40.0})
+    processor.save_forecast_item(period, '現実', '売上高', {MONTHS[1]: 120.0, MONTHS[2]: 130.0})
+
+    summaries = processor.get_kpi_summary(period, 1)
+    assert set(summaries) == set(processor.SCENARIOS)
+    bundle = processor.get_period_bundle(period)
+    pl_df = processor.calculate_pl(bundle['actuals'], bundle['forecasts']['現実'], 1, MONTHS).set_index('項目名')
+    for column in processor.PL_TOTAL_COLUMNS:
+        for item in processor.KPI_ITEMS:
+            assert summaries['現実'][column][item] == pytest.approx(pl_df.loc[item, column])
+
+    # データバージョン・係数が同じなら計算結果を再利用する
+    assert processor.get_kpi_summary(period, 1) is summaries
+
+
+def test_get_kpi_summary_recomputes_after_save_or_rate_change(processor, period):
+    processor.save_actual_item(period, '売上高', {MONTHS[0]: 100.0})
+    processor.save_forecast_item(period, '現実', '売上高', {MONTHS[1]: 100.0})
+    before = processor.get_kpi_summary(period, 1)
+
+    processor.save_actual_item(period, '売上高', {MONTHS[0]: 300.0})
+    after_save = processor.get_kpi_summary(period, 1)
+    assert after_save['現実']['実績合計']['売上高'] == 300.0
+    assert before['現実']['実績合計']['売上高'] == 100.0
+
+    processor.save_scenario_rate(period, '楽観', 0.5)
+    after_rate = processor.get_kpi_summary(period, 1)
+    assert after_rate['楽観']['予測合計']['売上高'] == pytest.approx(150.0)
+
+
+def test_get_kpi_summaries_for_many_periods(processor):
+    p1 = add_period(processor, 'A社')
+    p2 = add_period(processor, 'B社')
+    processor.save_actual_item(p1, '売上高', {MONTHS[0]: 10.0})
+    processor.save_actual_item(p2, '売上高', {MONTHS[0]: 20.0, MONTHS[1]: 30.0})
+
+    summaries = processor.get_kpi_summaries({p1: 1, p2: 2})
+    assert summaries[p1]['現実']['実績合計']['売上高'] == 10.0
+    assert summaries[p2]['現実']['実績合計']['売上高'] == 50.0
+    assert summaries[p2] is processor.get_kpi_summary(p2, 2)
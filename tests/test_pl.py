@@ -0,0 +1,89 @@
+"""PL計算 (calculate_pl / pl_to_frame)"""
+import numpy as np
+import pandas as pd
+
+from conftest import MONTHS, add_period
+from data_processor import DataProcessor
+
+
+def test_calculate_pl_subtotals_and_frame_layout(sqlite_processor):
+    dp = sqlite_processor
+    actuals = pd.DataFrame({'項目名': ['売上高', '売上原価', '給料手当'],
+                            MONTHS[0]: [100.0, -40.0, 10.0], MONTHS[1]: [200.0, -80.0, 10.0], MONTHS[2]: [9.0, 9.0, 9.0]})
+    forecasts = pd.DataFrame({'項目名': ['売上高'], MONTHS[2]: [300.0]})
+    pl = dp.calculate_pl(actuals, forecasts, 2, MONTHS)
+
+    assert list(pl.columns) == ['項目名'] + MONTHS + dp.PL_TOTAL_COLUMNS + ['タイプ']
+    assert pl['項目名'].tolist() == dp.all_items
+    row = pl.set_index('項目名')
+    # 売上総損益金額 = 売上高 - 売上原価 (元データの符号のまま)
+    assert row.loc['売上総損益金額', MONTHS].tolist() == [140.0, 280.0, 300.0]
+    assert row.loc['営業損益金額', MONTHS].tolist() == [130.0, 270.0, 300.0]
+    assert row.loc['売上高', dp.PL_TOTAL_COLUMNS].tolist() == [300.0, 300.0, 600.0]
+    assert row.loc['売上高', 'タイプ'] == '要約' and row.loc['給料手当', 'タイプ'] == '詳細'
+
+
+def test_pl_to_frame_matches_matrix(sqlite_processor):
+    dp = sqlite_processor
+    rng = np.random.default_rng(0)
+    matrix = rng.normal(size=(len(dp.all_items), len(MONTHS)))
+    df = dp.pl_to_frame(matrix, 1, MONTHS)
+    np.testing.assert_array_equal(df[MONTHS].to_numpy(), matrix)
+    np.testing.assert_allclose(df['実績合計'], matrix[:, 0])
+    np.testing.assert_allclose(df['予測合計'], matrix[:, 1:].sum(axis=1))
+    np.testing.assert_allclose(df['合計'], matrix.sum(axis=1))
+    # 作成したDataFrameを変更しても次の呼び出しに影響しない
+    df.loc[0, '項目名'] = '変更'
+    assert dp.pl_to_frame(matrix, 1, MONTHS).loc[0, '項目名'] == dp.all_items[0]
+
+
+def _evaluate(dp, period, split_index=2):
+    """会計期の最新データで evaluate_period_pls を呼び、(PL配列, 全体を再計算した場合のPL配列) を返す"""
+    bundle = dp.get_period_bundle(period)
+    args = (bundle['actuals'], bundle['forecasts']['現実'], split_index, bundle['months'],
+            bundle['coefficients'], bundle['sub_account_totals'])
+    _, pl_cube = dp.evaluate_period_pls(period, *args, data_version=bundle['data_version'])
+    return pl_cube, dp.calculate_scenario_pls(*args)
+
+
+def test_incremental_pl_applies_local_edits(sqlite_processor, monkeypatch):
+    dp = sqlite_processor
+    period = add_period(dp)
+    dp.save_actual_item(period, '売上高', {MONTHS[0]: 100.0, MONTHS[1]: 120.0})
+    dp.save_forecast_item(period, '現実', '売上高', {MONTHS[2]: 150.0})
+    _evaluate(dp, period)
+
+    updates = []
+    update = dp._update_period_pls
+    monkeypatch.setattr(dp, '_update_period_pls', lambda *a: updates.append(a[1]) or update(*a))
+    dp.save_actual_item(period, '売上原価', {MONTHS[0]: -30.0})
+    dp.save_sub_account(period, '現実', '地代家賃', '本社', {MONTHS[2]: 7.0})
+    pl_cube, expected = _evaluate(dp, period)
+
+    assert updates == [{('売上原価', MONTHS[0]), ('地代家賃', MONTHS[2])}]
+    np.testing.assert_allclose(pl_cube, expected)
+
+
+def test_incremental_pl_recomputes_after_external_writer(sqlite_processor, monkeypatch):
+    dp = sqlite_processor
+    period = add_period(dp)
+    dp.save_actual_item(period, '売上高', {MONTHS[0]: 100.0, MONTHS[1]: 120.0})
+    _evaluate(dp, period)
+
+    # 別プロセス (batch_import・別のアプリ) の書き込みはこのプロセスの変更記録に残らない
+    other = DataProcessor(dp.db_path)
+    try:
+        other.save_actual_item(period, '給料手当', {MONTHS[0]: 5000.0, MONTHS[1]: 8000.0})
+    finally:
+        other.close()
+    # その後のこのプロセスの書き込みだけで差分更新すると、別プロセスの変更が反映されない
+    updates = []
+    update = dp._update_period_pls
+    monkeypatch.setattr(dp, '_update_period_pls', lambda *a: updates.append(a[1]) or update(*a))
+    dp.save_actual_item(period, '売上高', {MONTHS[0]: 110.0})
+    pl_cube, expected = _evaluate(dp, period)
+
+    assert updates == []
+    np.testing.assert_allclose(pl_cube, expected)
+    operating = dp.item_index['営業損益金額']
+    assert pl_cube[0, operating, :2].tolist() == [110.0 - 5000.0, 120.0 - 8000.0]
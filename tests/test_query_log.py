@@ -0,0 +1,27 @@
+"""SQLの実行ログ (QueryLog)"""
+import logging
+
+import pytest
+
+from conftest import MONTHS
+
+
+def test_slow_queries_and_errors_go_to_the_logger(processor, period, caplog, capsys):
+    caplog.set_level(logging.WARNING, logger='query_log')
+    query_log = processor.enable_query_log(slow_ms=0)
+    processor.save_actual_item(period, '売上高', {MONTHS[0]: 100.0})
+    processor.load_actual_data(period)
+
+    slow = [r for r in caplog.records if r.getMessage().startswith("遅いクエリ")]
+    assert slow and all(r.name == 'query_log' and r.levelno == logging.WARNING for r in slow)
+    assert query_log.stats()['slow_queries'] == len(slow)
+
+    caplog.clear()
+    query_log.slow_ms = None
+    with pytest.raises(Exception), processor._connection() as conn:
+        conn.execute("SELECT * FROM no_such_table")
+    assert [r.getMessage().startswith("SQLエラー") for r in caplog.records] == [True]
+
+    # 標準出力には何も出さない
+    assert capsys.readouterr().out == ""
+    processor.disable_query_log()
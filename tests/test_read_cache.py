@@ -0,0 +1,113 @@
+"""共有読み込みキャッシュ (ReadCache と DataProcessor の読み込み)"""
+import threading
+import time
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from conftest import MONTHS
+from read_cache import ReadCache
+
+
+def test_hit_on_same_version_and_reload_on_new_version():
+    cache = ReadCache()
+    calls = []
+
+    def loader(value):
+        return lambda: calls.append(value) or value
+
+    assert cache.get_or_load('k', 1, loader('v1')) == 'v1'
+    assert cache.get_or_load('k', 1, loader('unused')) == 'v1'
+    assert cache.get_or_load('k', 2, loader('v2')) == 'v2'
+    assert calls == ['v1', 'v2']
+    stats = cache.stats()
+    assert (stats['hits'], stats['misses'], stats['entries']) == (1, 2, 1)
+
+
+def test_numpy_values_are_frozen():
+    cache = ReadCache()
+    value = cache.get_or_load('k', 1, lambda: {'a': np.zeros(3), 'b': (np.ones(2),)})
+    with pytest.raises(ValueError):
+        value['a'][0] = 1
+    with pytest.raises(ValueError):
+        value['b'][0][0] = 1
+
+
+def test_lru_eviction_by_size():
+    item = np.zeros(100)  # 800バイト
+    cache = ReadCache(max_bytes=2000)
+    cache.get_or_load('a', 1, lambda: item.copy())
+    cache.get_or_load('b', 1, lambda: item.copy())
+    cache.get_or_load('a', 1, lambda: None)     # a を最近使ったことにする
+    cache.get_or_load('c', 1, lambda: item.copy())
+    assert cache.stats()['evictions'] == 1
+    assert isinstance(cache.get_or_load('a', 1, lambda: 'reloaded'), np.ndarray)
+    assert cache.get_or_load('b', 1, lambda: 'reloaded') == 'reloaded'
+
+    # 上限より大きい値は返すが保持しない
+    big = cache.get_or_load('big', 1, lambda: np.zeros(1000))
+    assert big.shape == (1000,)
+    assert cache.stats()['bytes'] <= cache.max_bytes
+
+
+def test_concurrent_loads_of_one_key_run_once():
+    cache = ReadCache()
+    calls = []
+
+    def slow_loader():
+        calls.append(1)
+        time.sleep(0.05)
+        return 'value'
+
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(cache.get_or_load('k', 1, slow_loader)))
+               for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert results == ['value'] * 8 and calls == [1]
+    # 待っていたスレッド (キャッシュ済みの値を返す) も含めて読み込み中のロックは残らない
+    assert cache._loading == {}
+
+
+def test_failed_load_is_not_cached_and_releases_key():
+    cache = ReadCache()
+
+    def failing_loader():
+        raise OSError("db is gone")
+
+    with pytest.raises(OSError):
+        cache.get_or_load('k', 1, failing_loader)
+    assert cache._loading == {}
+    assert cache.get_or_load('k', 1, lambda: 'value') == 'value'
+    assert cache.stats()['entries'] == 1
+
+
+def test_invalidate_with_predicate():
+    cache = ReadCache()
+    for key in [('actual', 1), ('actual', 2), ('kpi', 1, 3)]:
+        cache.get_or_load(key, 1, lambda: np.zeros(1))
+    cache.invalidate(lambda key: key[0] == 'actual')
+    assert cache.stats()['entries'] == 1
+    cache.invalidate()
+    assert cache.stats()['entries'] == 0
+
+
+def test_processor_shares_frames_until_data_version_changes(processor, period):
+    processor.save_actual_item(period, '売上高', {MONTHS[0]: 100.0})
+    first = processor.get_actual_data(period)
+    assert processor.get_actual_data(period) is first
+
+    processor.save_actual_item(period, '売上高', {MONTHS[0]: 150.0})
+    reloaded = processor.get_actual_data(period)
+    assert reloaded is not first
+    assert reloaded.set_index('項目名').loc['売上高', MONTHS[0]] == 150.0
+    # 共有中のDataFrameは変更されない
+    assert first.set_index('項目名').loc['売上高', MONTHS[0]] == 100.0
+
+    bundle = processor.get_period_bundle(period)
+    assert bundle['actuals'] is reloaded
+    assert bundle['data_version'] == processor.get_data_version(period)
+    assert isinstance(bundle['forecasts']['現実'], pd.DataFrame)
@@ -0,0 +1,144 @@
+"""旧バージョンのアプリで作成されたSQLiteのDBからのマイグレーション"""
+import logging
+import sqlite3
+
+import schema
+from data_processor import DataProcessor
+from storage import SQLiteBackend
+
+# 旧バージョンのアプリ (_init_db で CREATE TABLE IF NOT EXISTS していた頃) が作成したテーブル
+LEGACY_DDL = """
+CREATE TABLE companies (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    name TEXT NOT NULL UNIQUE
+);
+CREATE TABLE fiscal_periods (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    comp_id INTEGER,
+    period_num INTEGER,
+    start_date TEXT,
+    end_date TEXT,
+    FOREIGN KEY (comp_id) REFERENCES companies (id)
+);
+CREATE TABLE actual_data (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    fiscal_period_id INTEGER,
+    item_name TEXT,
+    month TEXT,
+    amount REAL,
+    FOREIGN KEY (fiscal_period_id) REFERENCES fiscal_periods (id)
+);
+CREATE TABLE forecast_data (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    fiscal_period_id INTEGER,
+    scenario TEXT,
+    item_name TEXT,
+    month TEXT,
+    amount REAL,
+    FOREIGN KEY (fiscal_period_id) REFERENCES fiscal_periods (id)
+);
+CREATE TABLE sub_accounts (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    fiscal_period_id INTEGER,
+    scenario TEXT,
+    parent_item TEXT,
+    sub_account_name TEXT,
+    month TEXT,
+    amount REAL,
+    FOREIGN KEY (fiscal_period_id) REFERENCES fiscal_periods (id)
+);
+CREATE TABLE item_attributes (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    fiscal_period_id INTEGER,
+    item_name TEXT UNIQUE,
+    is_variable BOOLEAN DEFAULT 0,
+    variable_rate REAL DEFAULT 0.0,
+    FOREIGN KEY (fiscal_period_id) REFERENCES fiscal_periods(id)
+);
+INSERT INTO companies (name) VALUES ('旧会社');
+INSERT INTO fiscal_periods (comp_id, period_num, start_date, end_date) VALUES (1, 1, '2024-04-01', '2025-03-31');
+INSERT INTO actual_data (fiscal_period_id, item_name, month, amount) VALUES
+    (1, '売上高', '2024-04', 100), (1, '売上高', '2024-04', 110), (1, '売上原価', '2024-04', -30);
+INSERT INTO forecast_data (fiscal_period_id, scenario, item_name, month, amount) VALUES
+    (1, '現実', '売上高', '2024-05', 200), (1, '現実', '売上高', '2024-05', 210);
+INSERT INTO sub_accounts (fiscal_period_id, scenario, parent_item, sub_account_name, month, amount) VALUES
+    (1, '現実', '地代家賃', '本社', '2024-04', 10), (1, '現実', '地代家賃', '本社', '2024-04', 12);
+INSERT INTO item_attributes (fiscal_period_id, item_name, is_variable, variable_rate) VALUES
+    (1, '売上原価', 1, 0.3);
+"""
+
+
+def _legacy_db(path):
+    conn = sqlite3.connect(path)
+    conn.executescript(LEGACY_DDL)
+    conn.close()
+    return SQLiteBackend(path)
+
+
+def test_legacy_db_is_migrated_and_deduplicated(tmp_path):
+    backend = _legacy_db(str(tmp_path / 'legacy.db'))
+    try:
+        applied = schema.migrate(backend)
+        assert [v for v, _, _ in applied] == [v for v, _, _ in schema.MIGRATIONS]
+        changes = dict((v, changes) for v, _, changes in applied)[2]
+        assert "actual_data の重複セルを1件削除" in changes
+        assert "item_attributes を会計期×項目名で一意のテーブルに作り直し" in changes
+
+        with backend.connection() as conn:
+            assert backend.schema_version(conn) == schema.latest_version()
+            for table, columns in schema._LEGACY_COLUMNS.items():
+                assert {name for name, _ in columns} <= set(backend.table_columns(conn, table))
+            # 重複セルは後に登録された行が残る
+            assert conn.execute(
+                "SELECT item_name, amount FROM actual_data ORDER BY item_name"
+            ).fetchall() == [('売上原価', -30.0), ('売上高', 110.0)]
+            assert conn.execute("SELECT amount FROM forecast_data").fetchall() == [(210.0,)]
+            assert conn.execute("SELECT amount FROM sub_accounts").fetchall() == [(12.0,)]
+            assert conn.execute(
+                "SELECT fiscal_period_id, item_name, is_variable, variable_rate FROM item_attributes"
+            ).fetchall() == [(1, '売上原価', 1, 0.3)]
+            assert conn.execute("SELECT updated_at FROM actual_data WHERE updated_at IS NULL").fetchall() == []
+
+            # 一意キーが作成され UPSERT できる
+            backend.upsert(conn, 'actual_data', ['fiscal_period_id', 'item_name', 'month'], ['amount'],
+                           [(1, '売上高', '2024-04', 120.0)])
+            conn.commit()
+            assert conn.execute(
+                "SELECT COUNT(*), MAX(amount) FROM actual_data WHERE item_name = '売上高'"
+            ).fetchone() == (1, 120.0)
+
+        # 2回目は何も適用しない
+        assert schema.migrate(backend) == []
+    finally:
+        backend.close()
+
+
+def test_item_attributes_unique_per_period_after_migration(tmp_path):
+    backend = _legacy_db(str(tmp_path / 'legacy.db'))
+    try:
+        schema.migrate(backend)
+        with backend.connection() as conn:
+            # 旧スキーマでは項目名だけで一意だったため別の会計期に同じ項目を登録できなかった
+            conn.execute(
+                "INSERT INTO item_attributes (fiscal_period_id, item_name, is_variable, variable_rate) "
+                "VALUES (2, '売上原価', 0, 0.0)"
+            )
+            conn.commit()
+            assert conn.execute("SELECT COUNT(*) FROM item_attributes").fetchone()[0] == 2
+    finally:
+        backend.close()
+
+
+def test_init_db_logs_only_migrations_that_changed_something(tmp_path, caplog, capsys):
+    caplog.set_level(logging.INFO, logger='data_processor')
+    DataProcessor(str(tmp_path / 'new.db')).close()
+    assert [r.getMessage() for r in caplog.records] == ["データベースを更新しました (スキーマ 1: 初期スキーマ)"]
+
+    caplog.clear()
+    _legacy_db(str(tmp_path / 'legacy.db')).close()
+    DataProcessor(str(tmp_path / 'legacy.db')).close()
+    messages = [r.getMessage() for r in caplog.records]
+    assert len(messages) == 2 and messages[1].startswith("データベースを更新しました (スキーマ 2:")
+
+    # 標準出力には何も出さない
+    assert capsys.readouterr().out == ""
@@ -0,0 +1,125 @@
+"""ストレージバックエンドの契約テスト (SQLite / PostgreSQL で同じ結果になること)"""
+import threading
+
+import numpy as np
+import pandas as pd
+
+import schema
+
+
+def _rows(backend, sql, params=()):
+    with backend.connection() as conn:
+        return conn.execute(sql, params).fetchall()
+
+
+def test_migrate_creates_latest_schema_once(backend):
+    applied = schema.migrate(backend)
+    assert [v for v, _, _ in applied] == [v for v, _, _ in schema.MIGRATIONS]
+    # 新しいDBでは旧スキーマの更新は何も変更しない
+    assert dict((v, changes) for v, _, changes in applied)[2] == []
+    with backend.connection() as conn:
+        assert backend.schema_version(conn) == schema.latest_version()
+        assert 'updated_at' in backend.table_columns(conn, 'actual_data')
+    # 最新なら何も適用しない
+    assert schema.migrate(backend) == []
+
+
+def test_bulk_insert(backend):
+    schema.migrate(backend)
+    rows = [(1, '売上高', '2024-04', 100.0), (1, '売上高', '2024-05', 200.0), (1, '売上原価', '2024-04', -50.5)]
+    with backend.connection() as conn:
+        backend.bulk_insert(conn, 'actual_data', ['fiscal_period_id', 'item_name', 'month', 'amount'], rows)
+        conn.commit()
+    stored = _rows(backend, "SELECT fiscal_period_id, item_name, month, amount FROM actual_data ORDER BY id")
+    assert [tuple(r) for r in stored] == rows
+
+
+def test_upsert_inserts_updates_and_keeps_last_duplicate(backend):
+    schema.migrate(backend)
+    keys = ['fiscal_period_id', 'item_name', 'month']
+    with backend.connection() as conn:
+        backend.upsert(conn, 'actual_data', keys, ['amount'], [(1, '売上高', '2024-04', 100.0)])
+        conn.commit()
+    with backend.connection() as conn:
+        backend.upsert(conn, 'actual_data', keys, ['amount'], [
+            (1, '売上高', '2024-04', 150.0),
+            (1, '売上高', '2024-05', 10.0),
+            (1, '売上高', '2024-05', 20.0),
+        ])
+        conn.commit()
+    stored = _rows(backend, "SELECT item_name, month, amount, updated_at FROM actual_data ORDER BY month")
+    assert [tuple(r[:3]) for r in stored] == [('売上高', '2024-04', 150.0), ('売上高', '2024-05', 20.0)]
+    assert all(r[3] is not None for r in stored)
+
+
+def test_uncommitted_write_is_rolled_back_on_return(backend):
+    schema.migrate(backend)
+    with backend.connection() as conn:
+        backend.begin_write(conn, ['actual_data'])
+        backend.bulk_insert(conn, 'actual_data', ['fiscal_period_id', 'item_name', 'month', 'amount'],
+                            [(1, '売上高', '2024-04', 1.0)])
+    assert _rows(backend, "SELECT COUNT(*) FROM actual_data")[0][0] == 0
+
+
+def test_read_frame(backend):
+    schema.migrate(backend)
+    with backend.connection() as conn:
+        conn.execute("INSERT INTO companies (name) VALUES (?)", ('A社',))
+        conn.commit()
+        df = backend.read_frame("SELECT name FROM companies WHERE name = ?", conn, params=('A社',))
+    assert df['name'].tolist() == ['A社']
+
+
+def test_query_listener_receives_statements(backend):
+    schema.migrate(backend)
+    events = []
+    listener = events.append
+    backend.add_query_listener(listener)
+    try:
+        _rows(backend, "SELECT name FROM companies WHERE id = ?", (1,))
+    finally:
+        backend.remove_query_listener(listener)
+    assert any(e['sql'].startswith("SELECT name FROM companies") and e['rows'] == 0 for e in events)
+
+
+def test_query_listener_receives_bulk_writes(backend):
+    # PostgreSQL の COPY もカーソルを通す書き込みと同じように記録される
+    schema.migrate(backend)
+    events = []
+    listener = events.append
+    backend.add_query_listener(listener)
+    rows = [(1, '売上高', '2024-04', 100.0), (1, '売上原価', '2024-04', -50.0)]
+    try:
+        with backend.connection() as conn:
+            backend.bulk_insert(conn, 'actual_data', ['fiscal_period_id', 'item_name', 'month', 'amount'], rows)
+            conn.commit()
+    finally:
+        backend.remove_query_listener(listener)
+    bulk = [e for e in events if e['many'] and 'actual_data' in e['sql']]
+    assert len(bulk) == 1 and bulk[0]['rows'] == 2 and bulk[0]['error'] is None
+
+
+def test_numpy_float_parameters_including_nan(backend):
+    # numpy の NaN は SQLite では NULL、PostgreSQL では NaN として渡る (構文エラーにならない)
+    value, missing = _rows(backend, "SELECT ?, ?", (np.float64(1.5), np.float64(np.nan)))[0]
+    assert value == 1.5 and pd.isna(missing)
+
+
+def test_sqlite_pool_reuses_connections_across_threads(tmp_path):
+    from storage import SQLiteBackend
+    backend = SQLiteBackend(str(tmp_path / 'pool.db'))
+    try:
+        with backend.connection() as conn:
+            first = conn
+        seen = []
+
+        def borrow():
+            with backend.connection() as conn:
+                seen.append(conn)
+
+        thread = threading.Thread(target=borrow)
+        thread.start()
+        thread.join()
+        assert seen == [first]
+    finally:
+        backend.close()
@@ -0,0 +1,118 @@
+"""書き込みキュー (グループコミット・ジョブ単位の取り消し)"""
+import threading
+
+import pytest
+
+import schema
+from write_queue import WriteQueue
+
+
+@pytest.fixture
+def writer(backend):
+    schema.migrate(backend)
+    queue = WriteQueue(backend)
+    yield queue
+    queue.close()
+
+
+def _insert(name):
+    def job(conn):
+        conn.execute("INSERT INTO companies (name) VALUES (?)", (name,))
+        return name
+    return job
+
+
+def _names(backend):
+    with backend.connection() as conn:
+        return sorted(row[0] for row in conn.execute("SELECT name FROM companies").fetchall())
+
+
+def _block(writer):
+    """書き込みスレッドを止めておき、その間に追加したジョブが1回のコミットにまとまるようにする"""
+    started, release = threading.Event(), threading.Event()
+
+    def job(conn):
+        started.set()
+        release.wait(10)
+    future = writer.submit(job)
+    started.wait(10)
+    return release, future
+
+
+def test_run_returns_after_commit(writer, backend):
+    assert writer.run(_insert('A社')) == 'A社'
+    # 別の接続から見える (コミット済み)
+    assert _names(backend) == ['A社']
+
+
+def test_pending_jobs_are_group_committed(writer, backend):
+    release, blocker = _block(writer)
+    futures = [writer.submit(_insert(f"{i}社")) for i in range(5)]
+    release.set()
+    assert [f.result(10) for f in futures] == [f"{i}社" for i in range(5)]
+    blocker.result(10)
+
+    stats = writer.stats()
+    assert stats['jobs'] == 6 and stats['commits'] == 2
+    assert _names(backend) == [f"{i}社" for i in range(5)]
+
+
+def test_failed_job_is_rolled_back_alone(writer, backend):
+    release, _ = _block(writer)
+    ok1 = writer.submit(_insert('A社'))
+    duplicate = writer.submit(_insert('A社'))  # companies.name は一意
+
+    def partial(conn):
+        conn.execute("INSERT INTO companies (name) VALUES ('途中まで')")
+        raise ValueError("ジョブの失敗")
+    failed = writer.submit(partial)
+    ok2 = writer.submit(_insert('B社'))
+    release.set()
+
+    assert ok1.result(10) == 'A社' and ok2.result(10) == 'B社'
+    assert duplicate.exception(10) is not None
+    assert isinstance(failed.exception(10), ValueError)
+    assert _names(backend) == ['A社', 'B社']
+    assert writer.stats()['failed_jobs'] == 2
+
+
+def test_after_commit_runs_with_job_result(writer, backend):
+    seen = []
+    future = writer.submit(_insert('A社'), after_commit=lambda value: seen.append((value, _names(backend))))
+    assert future.result(10) == 'A社'
+    assert seen == [('A社', ['A社'])]
+
+    # after_commit の例外は Future に設定される (書き込みはコミット済み)
+    def fail(_):
+        raise RuntimeError("after_commit の失敗")
+    future = writer.submit(_insert('B社'), after_commit=fail)
+    assert isinstance(future.exception(10), RuntimeError)
+    assert _names(backend) == ['A社', 'B社']
+
+
+def test_submit_from_inside_a_job_is_rejected(writer):
+    def job(conn):
+        writer.submit(_insert('A社'))
+    with pytest.raises(RuntimeError):
+        writer.run(job)
+
+
+def test_close_drains_pending_jobs(writer, backend):
+    release, _ = _block(writer)
+    futures = [writer.submit(_insert(f"{i}社")) for i in range(3)]
+    threading.Timer(0.05, release.set).start()
+    writer.close()
+    assert all(f.done() and f.exception() is None for f in futures)
+    assert len(_names(backend)) == 3
+
+
+def test_concurrent_saves_from_sessions(processor, period):
+    from concurrent.futures import ThreadPoolExecutor
+    items = processor.ga_items[:16]
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        results = list(pool.map(lambda item: processor.save_actual_item(period, item, {'2024-04': 1.0}), items))
+    assert all(results)
+    cells = processor.load_grid_cells('actual', [period])
+    assert sorted(cells['項目名']) == sorted(items)
+    # 保存ごとにデータバージョンが1つずつ加算される
+    assert processor.get_data_version(period) == len(items)
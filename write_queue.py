@@ -0,0 +1,145 @@
+"""
+書き込み専用スレッドとキュー
+
+DataProcessor の書き込みはすべてこのキューを通り、1つのスレッドが順番に実行する。
+同時に複数のセッションが保存しても書き込みロックの取り合い (database is locked) は起きず、
+読み込みは WAL により書き込み中も並行して動く。
+
+キューに溜まった書き込みはまとめて1トランザクションでコミットする (グループコミット)。
+ジョブごとに SAVEPOINT を置くため、失敗したジョブだけが取り消され、他のジョブはコミットされる。
+submit は Future を返し、コミット完了 (永続化) 後に結果が設定される。
+"""
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+
+class WriteQueue:
+    """
+    書き込みジョブを1スレッドで順に実行し、グループコミットする
+
+    ジョブは job(conn) の形の関数。conn 上で書き込みだけを行い、コミットはしない。
+    """
+
+    _STOP = object()
+
+    def __init__(self, backend, max_pending=1000, max_batch=64):
+        """
+        backend: storage のバックエンド
+        max_pending: キューの上限 (超えると submit は空きが出るまで待つ)
+        max_batch: 1回のコミットにまとめるジョブ数の上限
+        """
+        self.backend = backend
+        self.max_batch = max_batch
+        self._queue = queue.Queue(maxsize=max_pending)
+        self._thread = None
+        self._start_lock = threading.Lock()
+        self.commits = 0
+        self.jobs = 0
+        self.failed_jobs = 0
+        self.commit_seconds = 0.0
+
+    def submit(self, job, after_commit=None):
+        """
+        書き込みジョブを追加して Future を返す
+
+        Future の結果は job の戻り値 (after_commit を指定した場合はコミット後に after_commit(戻り値) を呼ぶ)。
+        ジョブが例外を出した場合は Future に例外が設定され、そのジョブの書き込みは取り消される
+        """
+        if threading.current_thread() is self._thread:
+            raise RuntimeError("書き込みジョブの中から書き込みを追加することはできません")
+        self._ensure_started()
+        future = Future()
+        self._queue.put((job, after_commit, future))
+        return future
+
+    def run(self, job, after_commit=None):
+        """submit してコミット完了まで待ち、job の戻り値を返す"""
+        return self.submit(job, after_commit).result()
+
+    def _ensure_started(self):
+        with self._start_lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._loop, name="db-writer", daemon=True)
+                self._thread.start()
+
+    def _loop(self):
+        while True:
+            item = self._queue.get()
+            if item is self._STOP:
+                return
+            batch = [item]
+            # 実行中に溜まったジョブをまとめて1トランザクションにする
+            stop = False
+            while len(batch) < self.max_batch:
+                try:
+                    item = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                if item is self._STOP:
+                    stop = True
+                    break
+                batch.append(item)
+            self._commit_batch(batch)
+            if stop:
+                return
+
+    def _commit_batch(self, batch):
+        start = time.perf_counter()
+        results = []
+        try:
+            with self.backend.connection() as conn:
+                self.backend.begin_write(conn, [])
+                for job, after_commit, future in batch:
+                    if not future.set_running_or_notify_cancel():
+                        continue
+                    conn.execute("SAVEPOINT write_job")
+                    try:
+                        value = job(conn)
+                    except Exception as e:
+                        conn.execute("ROLLBACK TO SAVEPOINT write_job")
+                        conn.execute("RELEASE SAVEPOINT write_job")
+                        self.failed_jobs += 1
+                        future.set_exception(e)
+                        continue
+                    conn.execute("RELEASE SAVEPOINT write_job")
+                    results.append((after_commit, future, value))
+                conn.commit()
+        except Exception as e:
+            # コミットできなかった場合は同じグループのジョブをすべて失敗にする
+            for _, _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+                    self.failed_jobs += 1
+            return
+        self.commits += 1
+        self.jobs += len(results)
+        self.commit_seconds += time.perf_counter() - start
+        for after_commit, future, value in results:
+            try:
+                if after_commit is not None:
+                    after_commit(value)
+            except Exception as e:
+                future.set_exception(e)
+            else:
+                future.set_result(value)
+
+    def stats(self):
+        """コミット回数・ジョブ数・1コミットあたりのジョブ数などを辞書で返す"""
+        return {
+            'pending': self._queue.qsize(),
+            'commits': self.commits,
+            'jobs': self.jobs,
+            'failed_jobs': self.failed_jobs,
+            'jobs_per_commit': self.jobs / self.commits if self.commits else 0.0,
+            'commit_seconds': self.commit_seconds,
+        }
+
+    def close(self):
+        """キューに残っているジョブを実行してからスレッドを止める"""
+        with self._start_lock:
+            thread = self._thread
+        if thread is not None and thread.is_alive():
+            self._queue.put(self._STOP)
+            thread.join()